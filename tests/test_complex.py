@@ -0,0 +1,20 @@
+import pytest
+
+import Калькулятор as calc
+
+
+@pytest.mark.parametrize("x, y, expr", [
+    ("2j", "2", "2j*2j"),
+    ("-4", "0,5", "(-4+0j)**0.5"),
+    ("1j", "1", "1j"),
+    ("1+1j", "2", "(1+1j)**2"),
+])
+def test_power_window_matches_dialect(x, y, expr):
+    assert calc.exact_power((x, y)) == calc.safe_eval(expr)
+    assert type(calc.exact_power((x, y))) is type(calc.safe_eval(expr))
+
+
+def test_real_results_are_floats():
+    assert calc.exact_power(("2j", "2")) == -4.0
+    assert isinstance(calc.exact_power(("2j", "2")), float)
+    assert isinstance(calc.safe_eval("sqrt(-4)*sqrt(-4)"), float)
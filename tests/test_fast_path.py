@@ -0,0 +1,94 @@
+import pytest
+
+import Калькулятор as calc
+
+
+def _ast_value(expr):
+    fn = calc.compile_safe(calc._normalize_expr(expr))
+    value = fn()
+    return calc._real_if_exact(value) if fn.complex_mode else value
+
+
+@pytest.mark.parametrize("expr", [
+    # precedence and associativity
+    "1+2*3",
+    "(1+2)*3",
+    "10-4-3",
+    "100/10/5",
+    "2*3%4",
+    "17%5*3",
+    "7//2*3",
+    "-7//2",
+    "1-2+3-4+5",
+    "2*(3+4)*(5-(6-7))",
+    "((((1))))+((2))",
+    # unary minus and plus
+    "-3",
+    "--3",
+    "-+-3",
+    "-3*2",
+    "-2%3",
+    "2*-3",
+    "2--3",
+    "-(1+2)*-(3+4)",
+    # numbers
+    "0,1+0,2",
+    "12,5/4-3",
+    ".5+5.",
+    "0",
+    "0.07*100",
+    "1/3",
+    "10/5",
+    "123456789012345678901234567890*98765432109876543210",
+    # complex literals
+    "2j*2j",
+    "1+2j",
+    "(1+2j)*(3-1j)",
+    # keypad glyphs
+    "6×7",
+    "8÷2",
+    "  1 +\t2 ",
+])
+def test_fast_path_matches_ast(expr):
+    fast = calc.fast_eval(expr)
+    assert fast is not None
+    expected = _ast_value(expr)
+    assert type(fast) is type(expected)
+    assert fast == expected
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("2^3^2", 512),
+    ("2**3**2", 512),
+    ("(2^3)^2", 64),
+    ("-2^2", -4),
+    ("2^-1", 0.5),
+    ("sqrt(16)+1", 5.0),
+    ("pi*0", 0.0),
+    ("1e3", 1000.0),
+    ("007", None),
+    ("1..2", None),
+])
+def test_falls_back_to_ast(expr, expected):
+    assert calc.fast_eval(expr) is None
+    if expected is None:
+        with pytest.raises(ValueError):
+            calc.safe_eval(expr)
+    else:
+        assert calc.safe_eval(expr) == expected
+        assert _ast_value(expr) == expected
+
+
+@pytest.mark.parametrize("expr", ["2(3)", "(2)(3)", "2 3", "(1+2)(3)", "1+", "(1", "1)", "*2"])
+def test_implicit_calls_and_malformed_input_fall_back(expr):
+    assert calc.fast_eval(expr) is None
+    with pytest.raises(ValueError):
+        calc.safe_eval(expr)
+
+
+@pytest.mark.parametrize("expr", ["1/0", "5//0", "5%0"])
+def test_errors_match(expr):
+    with pytest.raises(ValueError):
+        calc.fast_eval(expr)
+    with pytest.raises(ZeroDivisionError):
+        _ast_value(expr)
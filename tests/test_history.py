@@ -0,0 +1,39 @@
+import os
+
+import Калькулятор as calc
+
+
+def _fill(store, n):
+    for i in range(n):
+        store.append(f"{i}+1", str(i + 1))
+
+
+def test_compaction_keeps_newest(tmp_path):
+    store = calc.HistoryStore(str(tmp_path), limit=8)
+    _fill(store, 11)
+    assert len(store) == 8
+    assert store.entry(len(store) - 1) == ("10+1", "11")
+    reopened = calc.HistoryStore(str(tmp_path), limit=8)
+    assert [reopened.entry(i) for i in range(len(reopened))] == [store.entry(i) for i in range(len(store))]
+
+
+def test_crash_between_compaction_replaces(tmp_path, monkeypatch):
+    store = calc.HistoryStore(str(tmp_path), limit=8)
+    _fill(store, 10)
+    real_replace = os.replace
+
+    def replace_log_only(src, dst):
+        if dst.endswith("history.idx"):
+            raise KeyboardInterrupt
+        real_replace(src, dst)
+
+    monkeypatch.setattr(calc.os, "replace", replace_log_only)
+    try:
+        store.append("10+1", "11")
+    except KeyboardInterrupt:
+        pass
+    monkeypatch.undo()
+    store.close()
+    reopened = calc.HistoryStore(str(tmp_path), limit=8)
+    entries = [reopened.entry(i) for i in range(len(reopened))]
+    assert entries == [(f"{i}+1", str(i + 1)) for i in range(3, 11)]
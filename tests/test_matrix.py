@@ -0,0 +1,44 @@
+import pytest
+
+import Калькулятор as calc
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("[1,2]*3", [3, 6]),
+    ("[[1,2],[3,4]]", [[1, 2], [3, 4]]),
+    ("[[1,2],[3,4]] @ [1,1]", [3, 7]),
+    ("(1,2)+(3,4)", [4, 6]),
+    ("transpose([[1,2],[3,4]])", [[1, 3], [2, 4]]),
+    ("[1.5, 2]*2", [3, 4]),
+])
+def test_unspaced_list_literals(expr, expected):
+    np.testing.assert_array_equal(calc.safe_eval_matrix(expr), np.array(expected))
+
+
+def test_matrix_scalars():
+    assert calc.safe_eval_matrix("det([[1,2],[3,4]])") == pytest.approx(-2.0)
+    assert calc.safe_eval_matrix("2.5*2") == 5.0
+
+
+def test_brackets_keep_commas_outside_matrix_mode():
+    assert calc._normalize_expr("[1,2]") == "[1,2]"
+    assert calc._normalize_expr("[1,2]+2,5") == "[1,2]+2.5"
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("sqrt(-1)", 1j),
+    ("sqrt(-4)", 2j),
+    ("log(-1)", complex(0, np.pi)),
+    ("sqrt(4)", 2.0),
+    ("log(8,2)", 3.0),
+])
+def test_matrix_functions_leave_the_real_domain_like_plain_mode(expr, expected):
+    value = calc.safe_eval_matrix(expr)
+    assert value == pytest.approx(expected)
+    assert value == pytest.approx(calc.safe_eval(expr))
+
+
+def test_matrix_sqrt_of_negative_entries():
+    np.testing.assert_allclose(calc.safe_eval_matrix("sqrt([4,-9])"), np.array([2, 3j]))
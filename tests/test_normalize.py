@@ -0,0 +1,47 @@
+import pytest
+
+import Калькулятор as calc
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("2,5+1,5", "2.5+1.5"),
+    ("sin(2,5)", "sin(2.5)"),
+    ("sqrt((2,25))", "sqrt((2.25))"),
+    ("log(8,2)", "log(8,2)"),
+    ("max(1,2,3)", "max(1,2,3)"),
+    ("sum(2^k,k,0,10)", "sum(2**k,k,0,10)"),
+    ("prod(k,k,1,10)", "prod(k,k,1,10)"),
+    ("sum(1/k^2;k;1;10)", "sum(1/k**2,k,1,10)"),
+    ("max(sin(0,5), 1)", "max(sin(0.5), 1)"),
+    ("max(1/3;0,3)", "max(1/3,0.3)"),
+    ("round(2,567;2)", "round(2.567,2)"),
+    ("sum(0,5^k;k;0;10)", "sum(0.5**k,k,0,10)"),
+    ("heaviside(-1;0,5)", "heaviside(-1,0.5)"),
+    ("max(sin(1,5);log(8,2))", "max(sin(1.5),log(8,2))"),
+])
+def test_decimal_commas(expr, expected):
+    assert calc._normalize_expr(expr) == expected
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("sum(2^k,k,0,10)", 2047),
+    ("prod(k,k,1,10)", 3628800),
+    ("sum(k, k, 1,3)", 6),
+    ("log(8,2)", 3.0),
+    ("2,5*2", 5.0),
+    ("max(1/3;0,3)", 1 / 3),
+    ("round(2,567;2)", 2.57),
+    ("heaviside(-1;0,5)", 0.0),
+])
+def test_unspaced_calls_evaluate(expr, expected):
+    assert calc.safe_eval(expr) == expected
+    assert float(calc.safe_eval_precise(expr)) == pytest.approx(expected)
+
+
+def test_session_functions_follow_the_builtin_rule():
+    session = calc.Session()
+    session.define("f(t) = 2*t")
+    session.define("g(a, b) = a - b")
+    assert session.evaluate("f(2,5)") == 5.0
+    assert session.evaluate("g(3,1)") == 2
+    assert session.evaluate("g(3,5;1)") == pytest.approx(2.5)
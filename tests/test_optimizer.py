@@ -0,0 +1,135 @@
+import ast
+import math
+
+import pytest
+
+import Калькулятор as calc
+
+
+def _unoptimized(tree, names, variables=()):
+    return ast.fix_missing_locations(tree)
+
+
+@pytest.fixture
+def compile_both(monkeypatch):
+    """
+    compile_safe with the optimizer and with optimize_safe_ast replaced by a no-op.
+    """
+    def compile_pair(src, variables=()):
+        calc.compile_safe.cache_clear()
+        optimized = calc.compile_safe(src, variables)
+        with monkeypatch.context() as m:
+            m.setattr(calc, "optimize_safe_ast", _unoptimized)
+            calc.compile_safe.cache_clear()
+            plain = calc.compile_safe(src, variables)
+        calc.compile_safe.cache_clear()
+        return optimized, plain
+    yield compile_pair
+    calc.compile_safe.cache_clear()
+
+
+def _outcome(fn, **values):
+    try:
+        return "ok", fn(**values)
+    except Exception as exc:
+        return "error", type(exc)
+
+
+@pytest.mark.parametrize("src", [
+    "2*3+1",
+    "2**10 - 7 % 3 + 9 // 2",
+    "1/3 + 2/3",
+    "-(-5) + +2.5",
+    "0.1 + 0.2 + 0.3",
+    "sqrt(16) + cos(0) * 2",
+    "log(8, 2) + hypot(3, 4)",
+    "max(1, 2.5, -3) - min(4, 2)",
+    "2*pi*e",
+    "tau / pi",
+    "round(2.675, 2)",
+])
+def test_constant_folding_matches(compile_both, src):
+    optimized, plain = compile_both(src)
+    assert _outcome(optimized) == _outcome(plain)
+    assert not optimized.code.co_names
+
+
+@pytest.mark.parametrize("src, values", [
+    ("2*pi*x", {"x": 1.5}),
+    ("x**2 + 3*x*pi - e", {"x": -2.25}),
+    ("sin(x)**2 + cos(x)**2", {"x": 0.7}),
+    ("sqrt(x) + sqrt(x) * sqrt(x)", {"x": 2.0}),
+    ("log(x, 2) + log(x, 2)", {"x": 1024}),
+    ("atan2(y, x) + atan2(y, x) - hypot(x, y)", {"x": 3.0, "y": -4.0}),
+    ("(1 + 2) * x / (4 - 1)", {"x": 7}),
+])
+def test_variables_match(compile_both, src, values):
+    optimized, plain = compile_both(src, tuple(values))
+    assert _outcome(optimized, **values) == _outcome(plain, **values)
+
+
+def test_numeric_names_are_pre_resolved(compile_both):
+    optimized, plain = compile_both("2*pi*x", ("x",))
+    assert "pi" in plain.code.co_names
+    assert "pi" not in optimized.code.co_names
+    assert "pi" not in optimized.namespace
+    assert optimized(x=1.0) == plain(x=1.0) == 2 * math.pi
+
+
+def test_variable_shadows_constant(compile_both):
+    optimized, plain = compile_both("e * 2", ("e",))
+    assert optimized(e=5) == plain(e=5) == 10
+
+
+def test_repeated_calls_are_hoisted(compile_both):
+    optimized, plain = compile_both("sin(x)**2 + sin(x) + sin(x)", ("x",))
+    calls = []
+
+    def counting_sin(v):
+        calls.append(v)
+        return math.sin(v)
+
+    optimized.namespace["sin"] = counting_sin
+    plain.namespace["sin"] = counting_sin
+    assert optimized(x=0.3) == plain(x=0.3)
+    assert len(calls) == 4
+    assert "_c0" in optimized.code.co_names
+
+
+def test_distinct_calls_are_not_hoisted(compile_both):
+    optimized, plain = compile_both("sin(x) + sin(y)", ("x", "y"))
+    assert not any(n.startswith("_c") for n in optimized.code.co_names)
+    assert optimized(x=0.1, y=0.2) == plain(x=0.1, y=0.2)
+
+
+def test_large_factorial_is_left_for_runtime(compile_both):
+    src = "factorial(1001)"
+    optimized, plain = compile_both(src)
+    assert "factorial" in optimized.code.co_names
+    assert optimized() == plain()
+
+
+def test_small_factorial_is_folded(compile_both):
+    optimized, plain = compile_both("factorial(20) + comb(10, 3)")
+    assert not optimized.code.co_names
+    assert optimized() == plain() == math.factorial(20) + 120
+
+
+def test_huge_integer_power_is_not_folded(compile_both):
+    optimized, plain = compile_both("2**100000 % 7")
+    assert optimized.code.co_consts.count(2 ** 100000) == 0
+    assert optimized() == plain() == pow(2, 100000, 7)
+
+
+@pytest.mark.parametrize("src", [
+    "1/0",
+    "5 // 0 + 1",
+    "fmod(1, 0)",
+    "10.0**400",
+    "exp(1000) * 0",
+    "factorial(-1)",
+])
+def test_folding_errors_are_raised_at_runtime(compile_both, src):
+    optimized, plain = compile_both(src)
+    assert _outcome(optimized) == _outcome(plain)
+    assert _outcome(optimized)[0] == "error"
@@ -0,0 +1,64 @@
+import decimal
+import math
+from fractions import Fraction
+
+import pytest
+
+import Калькулятор as calc
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("isqrt(16)", 4),
+    ("isqrt(10^40)", 10 ** 20),
+    ("comb(5; 2)", 10),
+    ("perm(5; 2)", 20),
+    ("perm(4)", 24),
+    ("gcd(12; 18)", 6),
+    ("lcm(4; 6)", 12),
+    ("comb(10/2; 2)", 10),
+])
+def test_integer_functions(expr, expected):
+    assert calc.safe_eval_precise(expr) == expected
+    assert calc.safe_eval(expr.replace("10/2", "5")) == expected
+
+
+def test_integer_functions_reject_fractions():
+    with pytest.raises(ValueError):
+        calc.safe_eval_precise("isqrt(1/2)")
+
+
+def test_float_functions_take_rationals():
+    assert calc.safe_eval_precise("sin(1/2)") == math.sin(0.5)
+    assert calc.safe_eval_precise("hypot(3; 4)") == 5
+
+
+def test_decimal_comma_is_exact():
+    assert calc.safe_eval_precise("0,1+0,2") == calc._precise_result(Fraction(3, 10))
+
+
+@pytest.mark.parametrize("expr, expected", [
+    ("log2(8)", 3),
+    ("log(8; 2)", 3),
+    ("log(1/8; 2)", -3),
+    ("log(9; 1/3)", -2),
+    ("log2(1024)", 10),
+    ("log10(1000)", 3),
+])
+def test_exact_logarithms(expr, expected):
+    assert calc.safe_eval_precise(expr) == expected
+    assert calc.safe_eval(expr) == expected
+
+
+def test_inexact_logarithm_is_rounded_once():
+    with decimal.localcontext() as ctx:
+        ctx.prec = 60
+        reference = decimal.Decimal(10).ln() / decimal.Decimal(3).ln()
+        ctx.prec = 30
+        reference = +reference
+    assert calc.safe_eval_precise("log(10; 3)", prec=30) == reference
+
+
+@pytest.mark.parametrize("expr", ["sqrt(-1)", "log(0)", "log(-2)", "log(8; 1)", "log2(-4)", "acos(2)"])
+def test_domain_errors(expr):
+    with pytest.raises(ValueError, match="Вне области определения"):
+        calc.safe_eval_precise(expr)
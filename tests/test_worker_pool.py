@@ -0,0 +1,81 @@
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+import Калькулятор as calc
+
+
+@pytest.fixture
+def pool():
+    p = calc.EvalWorkerPool(size=1, timeout_s=2.0)
+    yield p
+    p.shutdown()
+
+
+def test_evaluates_and_times_out(pool):
+    assert pool.submit("eval", "2^10") == 1024
+    with pytest.raises(calc.EvaluationAborted):
+        pool.submit("eval", "9^9^9", timeout_s=0.5)
+    assert pool.submit("eval", "1+1") == 2
+
+
+def test_shutdown_during_submit_drops_the_worker(pool):
+    result = {}
+
+    def run():
+        try:
+            pool.submit("eval", "9^9^9", timeout_s=5.0)
+        except Exception as exc:
+            result["exc"] = exc
+
+    t = threading.Thread(target=run)
+    t.start()
+    time.sleep(0.3)
+    pool.shutdown()
+    t.join(10)
+    assert isinstance(result.get("exc"), calc.EvaluationAborted)
+    assert not pool._idle and not pool._all
+
+
+def test_memory_watch_without_rlimits(monkeypatch):
+    monkeypatch.setattr(calc, "resource", None)
+    watched = calc.EvalWorkerPool(size=1, timeout_s=5.0, mem_mb=64)
+    try:
+        assert watched.submit("eval", "2+2") == 4
+        with pytest.raises(calc.EvaluationAborted, match="памяти"):
+            watched.submit("matrix", "det(ones([4000, 4000]) + eye(4000))")
+    finally:
+        watched.shutdown()
+
+
+def test_spawned_workers_import_without_gui(monkeypatch):
+    monkeypatch.setattr(calc, "_mp_context", lambda: multiprocessing.get_context("spawn"))
+    p = calc.EvalWorkerPool(size=1, timeout_s=30.0)
+    try:
+        assert p.submit("eval", "sqrt(16)") == 4.0
+    finally:
+        p.shutdown()
+
+
+@pytest.mark.skipif(not calc.HAVE_NUMPY, reason="needs NumPy")
+def test_table_chunks_from_the_grid_task(pool):
+    session = calc.Session()
+    session.define("f(t) = t^2")
+    src = calc._normalize_expr("f(x) + 1")
+    fn = session.compile(src, ("x",), bind=False)
+    texts = session.texts()
+    xs, ys = calc.value_table_chunk(fn, 0.0, 0.5, 0, 4, lambda v: pool.submit("grid", (texts, src, v)))
+    assert list(ys) == [1.0, 1.25, 2.0, 3.25]
+
+
+@pytest.mark.skipif(not calc.HAVE_NUMPY, reason="needs NumPy")
+def test_root_search_in_the_worker(pool):
+    session = calc.Session()
+    session.define("c = 2")
+    roots = pool.submit("roots", (session.texts(), "x^2 = c", -5.0, 5.0))
+    assert roots == pytest.approx([-2 ** 0.5, 2 ** 0.5])
+    with pytest.raises(calc.EvaluationAborted):
+        pool.submit("roots", ((), "sum(sin(k*x), k, 1, 10^6)", -1.0, 1.0), timeout_s=0.5)
+    assert pool.submit("eval", "1+1") == 2
@@ -1,17 +1,32 @@
 from __future__ import annotations
 
 import ast
+import cmath
+import decimal
+import functools
 import importlib
+import io
+import itertools
 import math
+import mmap
+import multiprocessing
+import operator
+import os
 import random
+import re
+import struct
 import subprocess
 import sys
 import threading
+import time
+from collections import ChainMap, OrderedDict
+from collections.abc import Mapping
 from dataclasses import dataclass
-from typing import Callable, Dict, List, Optional, Tuple, Union
+from fractions import Fraction
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, TextIO, Tuple, Union
 
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import filedialog, messagebox
 
 try:
     import customtkinter as ctk
@@ -227,7 +242,13 @@ def ensure_and_import_with_gui(pkgs: List[Tuple[str, str]]) -> Dict[str, Optiona
             pass
     return imported
 
-_imported_optional = ensure_and_import_with_gui(DEPENDENCIES)
+# Only the app itself offers to install missing packages: evaluation workers
+# started with "spawn" (Windows) import this file as __mp_main__ and must not
+# create Tk roots or dialogs.
+if __name__ == "__main__":
+    _imported_optional = ensure_and_import_with_gui(DEPENDENCIES)
+else:
+    _imported_optional = {module: _try_import_module(module) for _pip, module in DEPENDENCIES}
 _np = _imported_optional.get("numpy")
 _pt = _imported_optional.get("pytweening")
 _easing_mod = _imported_optional.get("easing_functions")
@@ -261,7 +282,7 @@ class Config:
     appearance_mode: str = "dark"
     color_theme: str = "dark-blue"
     win_w: int = 300
-    win_h: int = 420
+    win_h: int = 440
     win_alpha: float = 0.97
     resizable: Tuple[bool, bool] = (False, False)
     entry_h: int = 38
@@ -271,6 +292,41 @@ class Config:
     container_pad: int = 8
     max_input: int = 64
 
+    eval_sandbox: bool = True
+    eval_workers: int = 2
+    eval_timeout_s: float = 3.0
+    eval_cpu_s: int = 3
+    eval_mem_mb: int = 512
+    preview_debounce_ms: int = 180
+    anim_frame_ms: int = 16
+    anim_frame_budget_ms: float = 8.0
+    anim_recover_s: float = 5.0
+    reduced_motion: bool = False
+    preview_timeout_s: float = 0.6
+    preview_cache_size: int = 256
+    precise_digits: int = 28
+    max_exact_pow_bits: int = 1 << 26
+    result_page_chars: int = 20000
+    prebuild_windows: bool = False
+    prebuild_delay_ms: int = 1500
+    batch_chunk_rows: int = 100_000
+    stl_chunk_triangles: int = 500_000
+    table_chunk_rows: int = 4096
+    table_max_rows: int = 100_000_000
+    root_scan_points: int = 20001
+    series_loop_terms: int = 4096
+    series_loop_max: int = 1_000_000
+    series_precise_terms: int = 100_000
+    series_chunk: int = 1 << 20
+    series_max_terms: int = 10 ** 10
+    stats_reservoir: int = 100_000
+    stats_chunk_values: int = 4_000_000
+    session_memo_size: int = 4096
+    history_limit: int = 10_000
+    history_window_rows: int = 200
+    fold_heavy_max: int = 1000
+    cheap_pow_max: int = 64
+
     panel: str = "#0d1114"
     surface: str = "#0b0d10"
     card: str = "#0f1316"
@@ -296,11 +352,12 @@ class Config:
 CFG = Config()
 FONTS = CFG.fonts()
 
-ctk.set_appearance_mode(CFG.appearance_mode)
-try:
-    ctk.set_default_color_theme(CFG.color_theme)
-except Exception:
-    pass
+if __name__ == "__main__":
+    ctk.set_appearance_mode(CFG.appearance_mode)
+    try:
+        ctk.set_default_color_theme(CFG.color_theme)
+    except Exception:
+        pass
 
 # ---------------------------
 # Helpers: colors, numbers
@@ -335,6 +392,48 @@ def hover_color(hex_color: str, factor: float = 0.06) -> str:
     except Exception:
         return hex_color
 
+class Palette:
+    """
+    Brightness ramps per base color, built once (vectorized with NumPy when
+    available) and served by index, so per-frame color effects do no hex
+    parsing or formatting. Entry i is adjust_brightness(color, lo + i * step).
+    """
+    def __init__(self, lo: float = 0.8, hi: float = 1.3, step: float = 0.01):
+        self.lo = lo
+        self.step = step
+        self.size = int(round((hi - lo) / step)) + 1
+        self._ramps: Dict[str, Tuple[str, ...]] = {}
+        self._hover: Dict[str, str] = {}
+
+    def index(self, factor: float) -> int:
+        return max(0, min(self.size - 1, int(round((factor - self.lo) / self.step))))
+
+    def ramp(self, color: str) -> Tuple[str, ...]:
+        ramp = self._ramps.get(color)
+        if ramp is None:
+            ramp = self._ramps[color] = self._build_ramp(color)
+        return ramp
+
+    def _build_ramp(self, color: str) -> Tuple[str, ...]:
+        if not isinstance(color, str) or not color.startswith("#"):
+            return (color,) * self.size
+        if HAVE_NUMPY:
+            factors = self.lo + _np.arange(self.size) * self.step
+            channels = _np.clip(_np.outer(factors, hex_to_rgb(color)).astype(int), 0, 255)
+            return tuple(map("#%02x%02x%02x".__mod__, map(tuple, channels.tolist())))
+        return tuple(adjust_brightness(color, self.lo + i * self.step) for i in range(self.size))
+
+    def shade(self, color: str, factor: float) -> str:
+        return self.ramp(color)[self.index(factor)]
+
+    def hover(self, color: str) -> str:
+        shade = self._hover.get(color)
+        if shade is None:
+            shade = self._hover[color] = hover_color(color)
+        return shade
+
+PALETTE = Palette()
+
 def format_number(val: Union[int, float], decimals: int = 5, use_comma: bool = True) -> str:
     s = f"{float(val):.{decimals}f}"
     return s.replace(".", ",") if use_comma else s
@@ -353,16 +452,294 @@ def parse_number(s: str) -> Union[float, complex]:
     except Exception:
         raise ValueError("Invalid float")
 
+# ---------------------------
+# Big integers: summaries and fast decimal conversion
+# ---------------------------
+_BIG_INT_BITS = 10000  # ~3000 digits: below this str() is cheap and within int_max_str_digits
+
+def is_big_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value.bit_length() > _BIG_INT_BITS
+
+def int_digit_summary(n: int, edge: int = 20) -> Tuple[int, str, str]:
+    """
+    Digit count and leading/trailing digits of |n| without converting it to a string.
+    """
+    n = abs(n)
+    if n.bit_length() <= _BIG_INT_BITS:
+        s = str(n)
+        return len(s), s[:edge], s[-edge:]
+    tail = str(n % 10 ** edge).zfill(edge)
+    shift = n.bit_length() - 256
+    with decimal.localcontext() as ctx:
+        ctx.prec = edge + 30
+        ctx.Emax = decimal.MAX_EMAX
+        ctx.rounding = decimal.ROUND_DOWN
+        approx = decimal.Decimal(n >> shift) * (decimal.Decimal(2) ** shift)
+    digits = approx.adjusted() + 1
+    lead = "".join(map(str, approx.as_tuple().digits))[:edge]
+    if lead == "9" * len(lead) and n >= pow(10, digits):
+        # top-bit truncation can only hide a carry into a new leading digit
+        digits += 1
+        lead = "1" + "0" * (edge - 1)
+    return digits, lead, tail
+
+def int_to_decimal_str(n: int) -> str:
+    """
+    Full decimal string of an int of any size, not subject to int_max_str_digits.
+    Divide and conquer on the binary representation with Decimal arithmetic
+    (libmpdec multiplies huge numbers in subquadratic time), unlike str(int).
+    """
+    if not is_big_int(n):
+        return str(n)
+    D = decimal.Decimal
+    two = D(2)
+    bitlim = 128
+    pow_cache: Dict[int, decimal.Decimal] = {}
+
+    def w2pow(w: int) -> decimal.Decimal:
+        r = pow_cache.get(w)
+        if r is None:
+            if w <= bitlim:
+                r = two ** w
+            elif w - 1 in pow_cache:
+                r = pow_cache[w - 1] + pow_cache[w - 1]
+            else:
+                half = w >> 1
+                r = w2pow(half) * w2pow(w - half)
+            pow_cache[w] = r
+        return r
+
+    def inner(x: int, w: int) -> decimal.Decimal:
+        if w <= bitlim:
+            return D(x)
+        half = w >> 1
+        hi = x >> half
+        lo = x - (hi << half)
+        return inner(lo, half) + inner(hi, w - half) * w2pow(half)
+
+    with decimal.localcontext() as ctx:
+        ctx.prec = decimal.MAX_PREC
+        ctx.Emax = decimal.MAX_EMAX
+        ctx.Emin = decimal.MIN_EMIN
+        ctx.traps[decimal.Inexact] = True
+        out = str(inner(abs(n), abs(n).bit_length()))
+    return "-" + out if n < 0 else out
+
+def big_int_short_text(n: int) -> str:
+    digits, lead, _tail = int_digit_summary(n, edge=8)
+    sign = "-" if n < 0 else ""
+    return f"≈{sign}{lead[0]}.{lead[1:]}e+{digits - 1}"
+
+def result_text(value) -> str:
+    """
+    str() of a result with big ints, also inside tuples and lists, shown as
+    digit summaries: str() of an int past int_max_str_digits raises.
+    """
+    if is_big_int(value):
+        return big_int_short_text(value)
+    if isinstance(value, (list, tuple)):
+        items = ", ".join(result_text(v) for v in value)
+        if isinstance(value, list):
+            return f"[{items}]"
+        return f"({items},)" if len(value) == 1 else f"({items})"
+    return str(value)
+
+def _parse_exact_number(s: str) -> Union[int, float, complex]:
+    t = (s or "").strip()
+    body = t[1:] if t[:1] in "+-" else t
+    if body and all(ch in "0123456789" for ch in body):
+        return int(t)
+    return parse_number(t)
+
+def exact_power(args: Tuple[str, str]):
+    """
+    x ** y for the power window: an exact int when both operands are integers
+    and y >= 0, complex arithmetic when either is complex, float otherwise.
+    """
+    xs, ys = args
+    try:
+        x = _parse_exact_number(xs)
+        y = _parse_exact_number(ys)
+    except ValueError:
+        raise ValueError("Ошибка ввода: ожидаются числа")
+    if isinstance(x, complex) or isinstance(y, complex):
+        try:
+            return _real_if_exact(complex(x) ** complex(y))
+        except OverflowError:
+            raise ValueError("Ошибка: переполнение результата")
+        except ZeroDivisionError:
+            raise ValueError("Ошибка при вычислении")
+    if isinstance(x, int) and isinstance(y, int) and y >= 0:
+        if abs(x) > 1 and abs(x).bit_length() * y > CFG.max_exact_pow_bits:
+            raise ValueError("Ошибка: результат слишком велик")
+        return x ** y
+    try:
+        return float(x) ** float(y)
+    except OverflowError:
+        raise ValueError("Ошибка: переполнение результата")
+    except ZeroDivisionError:
+        raise ValueError("Ошибка при вычислении")
+
+# ---------------------------
+# Function registry (lazy, with arity / cost / vectorization metadata)
+# ---------------------------
+COST_CHEAP, COST_MODERATE, COST_HEAVY = 0, 1, 2
+
+@dataclass(frozen=True)
+class FunctionInfo:
+    """
+    Metadata of a callable name. `module`.`attr` is the implementation,
+    adapted by `wrap` if given; `max_args` None means variadic. `vectorizable`
+    means NumPy has an element-wise equivalent (no np.vectorize fallback).
+    """
+    name: str
+    module: str
+    attr: str
+    min_args: int = 1
+    max_args: Optional[int] = 1
+    cost: int = COST_CHEAP
+    vectorizable: bool = True
+    wrap: Optional[Callable[[Callable], Callable]] = None
+
+class FunctionRegistry(Mapping):
+    """
+    Names of the expression dialect. Registering stores metadata only:
+    membership tests never import anything, and a function's module is
+    imported the first time its value is looked up.
+    """
+    def __init__(self):
+        self._infos: Dict[str, FunctionInfo] = {}
+        self._constants: Dict[str, object] = {}
+        self._resolved: Dict[str, Callable] = {}
+
+    def register(self, name: str, module: str, attr: Optional[str] = None, min_args: int = 1,
+                 max_args: Optional[int] = 1, cost: int = COST_CHEAP, vectorizable: bool = True,
+                 wrap: Optional[Callable[[Callable], Callable]] = None):
+        self._infos[name] = FunctionInfo(name, module, attr or name, min_args, max_args, cost, vectorizable, wrap)
+        self._resolved.pop(name, None)
+
+    def register_constant(self, name: str, value):
+        self._constants[name] = value
+
+    def info(self, name: str) -> Optional[FunctionInfo]:
+        return self._infos.get(name)
+
+    def check_call(self, name: str, nargs: int):
+        info = self._infos.get(name)
+        if info is not None and (nargs < info.min_args or (info.max_args is not None and nargs > info.max_args)):
+            raise ValueError(f"{name}: неверное число аргументов")
+
+    def __contains__(self, name) -> bool:
+        return name in self._infos or name in self._constants
+
+    def __iter__(self):
+        return itertools.chain(self._constants, self._infos)
+
+    def __len__(self) -> int:
+        return len(self._constants) + len(self._infos)
+
+    def __getitem__(self, name: str):
+        if name in self._constants:
+            return self._constants[name]
+        try:
+            return self._resolved[name]
+        except KeyError:
+            pass
+        info = self._infos[name]
+        try:
+            fn = getattr(importlib.import_module(info.module), info.attr)
+        except (ImportError, AttributeError) as exc:
+            raise ValueError(f"Функция '{name}' недоступна: нужен модуль {info.module}") from exc
+        if info.wrap is not None:
+            fn = info.wrap(fn)
+        self._resolved[name] = fn
+        return fn
+
+FUNCTIONS = FunctionRegistry()
+register_function = FUNCTIONS.register
+
+_MATH_ARITY: Dict[str, Tuple[int, Optional[int]]] = {
+    "atan2": (2, 2), "copysign": (2, 2), "fmod": (2, 2), "ldexp": (2, 2), "pow": (2, 2), "remainder": (2, 2),
+    "isclose": (2, 2), "dist": (2, 2), "sumprod": (2, 2), "comb": (2, 2), "nextafter": (2, 3),
+    "log": (1, 2), "perm": (1, 2), "hypot": (0, None), "gcd": (0, None), "lcm": (0, None),
+}
+# cost grows with the size of integer arguments
+_MATH_HEAVY = frozenset({"factorial", "comb", "perm", "isqrt", "gcd", "lcm"})
+# no element-wise NumPy equivalent (or not element-wise at all)
+_MATH_SCALAR_ONLY = frozenset({"factorial", "comb", "perm", "isqrt", "fsum", "prod", "dist", "sumprod", "frexp",
+                               "modf", "gamma", "lgamma", "erf", "erfc", "nextafter", "ulp", "isclose"})
+
+def _pack_args(fn: Callable) -> Callable:
+    return lambda *xs: fn(xs)
+
+def _python_scalar(fn: Callable) -> Callable:
+    return lambda *args: fn(*args).item()
+
+for _name in dir(math):
+    if _name.startswith("__"):
+        continue
+    if not callable(getattr(math, _name)):
+        FUNCTIONS.register_constant(_name, getattr(math, _name))
+        continue
+    _lo, _hi = _MATH_ARITY.get(_name, (1, 1))
+    FUNCTIONS.register(_name, "math", min_args=_lo, max_args=_hi,
+                       cost=COST_HEAVY if _name in _MATH_HEAVY else COST_CHEAP,
+                       vectorizable=_name not in _MATH_SCALAR_ONLY)
+for _name, _lo, _hi in (("abs", 1, 1), ("round", 1, 2), ("min", 1, None), ("max", 1, None)):
+    FUNCTIONS.register(_name, "builtins", min_args=_lo, max_args=_hi)
+FUNCTIONS.register("phase", "cmath")
+FUNCTIONS.register("rect", "cmath", min_args=2, max_args=2, vectorizable=False)
+for _name, _lo in (("mean", 1), ("fmean", 1), ("median", 1), ("mode", 1), ("harmonic_mean", 1),
+                   ("geometric_mean", 1), ("stdev", 2), ("variance", 2), ("pstdev", 1), ("pvariance", 1)):
+    FUNCTIONS.register(_name, "statistics", min_args=_lo, max_args=None, cost=COST_MODERATE,
+                       vectorizable=False, wrap=_pack_args)
+for _name, _lo in (("sign", 1), ("sinc", 1), ("heaviside", 2), ("logaddexp", 2)):
+    FUNCTIONS.register(_name, "numpy", min_args=_lo, max_args=_lo, wrap=_python_scalar)
+
+_ALLOWED_NAMES = FUNCTIONS
+
+# Complex dialect: cmath versions layered over FUNCTIONS for expressions that
+# are complex at compile time (complex literals, or real-domain errors such as
+# sqrt(-1) while folding constants).
+COMPLEX_FUNCTIONS = FunctionRegistry()
+for _name in ("sqrt", "exp", "log", "log10", "sin", "cos", "tan", "asin", "acos", "atan",
+              "sinh", "cosh", "tanh", "asinh", "acosh", "atanh", "isfinite", "isinf", "isnan", "isclose"):
+    _info = FUNCTIONS.info(_name)
+    COMPLEX_FUNCTIONS.register(_name, "cmath", min_args=_info.min_args, max_args=_info.max_args)
+COMPLEX_FUNCTIONS.register("log2", "cmath", "log", wrap=lambda log: lambda z: log(z) / math.log(2))
+COMPLEX_FUNCTIONS.register("pow", "builtins", min_args=2, max_args=2)
+COMPLEX_NAMES = ChainMap(COMPLEX_FUNCTIONS, FUNCTIONS)
+
+def _reraise_domain_error(exc: ValueError):
+    """
+    A real-dialect function hit a value outside its domain at run time (the
+    dialect was fixed at compile time); point at the complex dialect.
+    """
+    if str(exc) == "math domain error":
+        raise ValueError("Вне области определения; для комплексного результата добавьте +0j") from exc
+
+def _real_if_exact(value):
+    """
+    Complex-dialect results with a zero imaginary part come back as floats.
+    """
+    if isinstance(value, complex) and value.imag == 0:
+        return value.real
+    return value
+
 # ---------------------------
 # Safe evaluation using AST
 # ---------------------------
-_ALLOWED_MATH = {k: getattr(math, k) for k in dir(math) if not k.startswith("__")}
-_ALLOWED_EXTRA = {"abs": abs, "round": round, "min": min, "max": max}
-_ALLOWED_NAMES = {**_ALLOWED_MATH, "pi": math.pi, "e": math.e, **_ALLOWED_EXTRA}
 
 class _SafeEvalVisitor(ast.NodeVisitor):
     ALLOWED_BINOPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod, ast.FloorDiv)
     ALLOWED_UNARY = (ast.UAdd, ast.USub)
+
+    def __init__(self, variables: Tuple[str, ...] = (), names: Optional[Dict[str, object]] = None,
+                 matmul: bool = False):
+        self.variables = frozenset(variables)
+        self.names = _ALLOWED_NAMES if names is None else names
+        self.binops = self.ALLOWED_BINOPS + ((ast.MatMult,) if matmul else ())
+
     def visit(self, node):
         nodetype = type(node)
         if nodetype in (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Constant,
@@ -377,7 +754,7 @@ class _SafeEvalVisitor(ast.NodeVisitor):
         self.visit(node.body)
 
     def visit_BinOp(self, node: ast.BinOp):
-        if not isinstance(node.op, self.ALLOWED_BINOPS):
+        if not isinstance(node.op, self.binops):
             raise ValueError("Оператор не разрешён")
         self.visit(node.left)
         self.visit(node.right)
@@ -388,10 +765,21 @@ class _SafeEvalVisitor(ast.NodeVisitor):
         self.visit(node.operand)
 
     def visit_Call(self, node: ast.Call):
+        if _is_series_call(node):
+            index = node.args[1]
+            if not isinstance(index, ast.Name) or index.id in self.names or index.id in self.variables:
+                raise ValueError("Второй аргумент sum/prod — новая переменная, например k")
+            _SafeEvalVisitor(tuple(self.variables) + (index.id,), names=self.names).visit(node.args[0])
+            self.visit(node.args[2])
+            self.visit(node.args[3])
+            return
+        if isinstance(node.func, ast.Name) and node.func.id == "sum":
+            raise ValueError("sum(выражение; k; от; до): нужно 4 аргумента")
         if isinstance(node.func, ast.Name):
             func_name = node.func.id
-            if func_name not in _ALLOWED_NAMES:
+            if func_name not in self.names:
                 raise ValueError(f"Функция '{func_name}' не разрешена")
+            FUNCTIONS.check_call(func_name, len(node.args))
         else:
             raise ValueError("Разрешены только прямые вызовы разрешённых функций")
         for a in node.args:
@@ -400,7 +788,7 @@ class _SafeEvalVisitor(ast.NodeVisitor):
             raise ValueError("Ключевые аргументы не разрешены")
 
     def visit_Name(self, node: ast.Name):
-        if node.id not in _ALLOWED_NAMES:
+        if node.id not in self.names and node.id not in self.variables:
             raise ValueError(f"Имя '{node.id}' не разрешено")
 
     def visit_Constant(self, node: ast.Constant):
@@ -415,24 +803,1761 @@ class _SafeEvalVisitor(ast.NodeVisitor):
         for elt in node.elts:
             self.visit(elt)
 
-def safe_eval(expr: str):
+# ---------------------------
+# AST optimizer: constant folding, name pre-resolution, call hoisting
+# ---------------------------
+_FOLD_BINOPS: Dict[type, Callable] = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.Pow: operator.pow, ast.Mod: operator.mod, ast.FloorDiv: operator.floordiv,
+}
+_FOLD_UNARY: Dict[type, Callable] = {ast.UAdd: operator.pos, ast.USub: operator.neg}
+_FOLD_MAX_INT_BITS = 4096
+
+def _is_number(v) -> bool:
+    return isinstance(v, (int, float, complex)) and not isinstance(v, bool)
+
+def _foldable_result(v) -> bool:
+    if not _is_number(v):
+        return False
+    return not (isinstance(v, int) and v.bit_length() > _FOLD_MAX_INT_BITS)
+
+class _SafeEvalOptimizer(ast.NodeTransformer):
     """
-    Safely evaluate a math expression using AST validation.
+    Folds constant subtrees, replaces numeric names (pi, e, ...) with their
+    values and evaluates calls whose arguments are all constants. Anything that
+    raises while folding is left in place so the runtime error is unchanged.
     """
+    def __init__(self, names: Dict[str, object], variables: Tuple[str, ...] = ()):
+        self.names = names
+        self.variables = frozenset(variables)
+
+    def visit_Name(self, node: ast.Name):
+        if node.id not in self.variables:
+            value = self.names.get(node.id)
+            if _is_number(value):
+                return ast.copy_location(ast.Constant(value=value), node)
+        return node
+
+    def visit_UnaryOp(self, node: ast.UnaryOp):
+        self.generic_visit(node)
+        fn = _FOLD_UNARY.get(type(node.op))
+        if fn is not None and isinstance(node.operand, ast.Constant):
+            try:
+                value = fn(node.operand.value)
+            except Exception:
+                return node
+            if _foldable_result(value):
+                return ast.copy_location(ast.Constant(value=value), node)
+        return node
+
+    def visit_BinOp(self, node: ast.BinOp):
+        self.generic_visit(node)
+        fn = _FOLD_BINOPS.get(type(node.op))
+        if fn is None or not (isinstance(node.left, ast.Constant) and isinstance(node.right, ast.Constant)):
+            return node
+        a, b = node.left.value, node.right.value
+        if isinstance(node.op, ast.Pow) and isinstance(a, int) and isinstance(b, int):
+            if b > 0 and abs(a) > 1 and a.bit_length() * b > _FOLD_MAX_INT_BITS:
+                return node
+        try:
+            value = fn(a, b)
+        except Exception:
+            return node
+        if _foldable_result(value):
+            return ast.copy_location(ast.Constant(value=value), node)
+        return node
+
+    def visit_Call(self, node: ast.Call):
+        self.generic_visit(node)
+        if not isinstance(node.func, ast.Name) or node.func.id in self.variables or node.keywords:
+            return node
+        fn = self.names.get(node.func.id)
+        if not callable(fn) or not all(isinstance(a, ast.Constant) for a in node.args):
+            return node
+        info = FUNCTIONS.info(node.func.id)
+        if info is not None and info.cost >= COST_HEAVY and any(
+                isinstance(a.value, int) and abs(a.value) > CFG.fold_heavy_max for a in node.args):
+            return node
+        try:
+            value = fn(*[a.value for a in node.args])
+        except Exception:
+            return node
+        if _foldable_result(value):
+            return ast.copy_location(ast.Constant(value=value), node)
+        return node
+
+class _CallHoister(ast.NodeTransformer):
+    """
+    Common-subexpression reuse for calls: the first evaluation of a repeated
+    call becomes `(_cN := call)` and later occurrences read `_cN`. Traversal
+    follows Python's left-to-right evaluation order, so the temporary is always
+    bound before it is read. Temporaries start with '_', which user input can't contain.
+    """
+    def __init__(self, repeated: set):
+        self.repeated = repeated
+        self.bound: Dict[str, str] = {}
+
+    def visit_Call(self, node: ast.Call):
+        key = ast.dump(node)
+        if key in self.bound:
+            return ast.copy_location(ast.Name(id=self.bound[key], ctx=ast.Load()), node)
+        self.generic_visit(node)
+        if key not in self.repeated:
+            return node
+        tmp = f"_c{len(self.bound)}"
+        self.bound[key] = tmp
+        return ast.copy_location(ast.NamedExpr(target=ast.Name(id=tmp, ctx=ast.Store()), value=node), node)
+
+def _hoist_repeated_calls(tree: ast.Expression) -> ast.Expression:
+    counts: Dict[str, int] = {}
+    for n in ast.walk(tree):
+        if isinstance(n, ast.Call):
+            key = ast.dump(n)
+            counts[key] = counts.get(key, 0) + 1
+    repeated = {k for k, c in counts.items() if c > 1}
+    if not repeated:
+        return tree
+    return _CallHoister(repeated).visit(tree)
+
+def optimize_safe_ast(tree: ast.Expression, names: Dict[str, object], variables: Tuple[str, ...] = ()) -> ast.Expression:
+    """
+    Optimization stage between validation and `compile`.
+    """
+    tree = _SafeEvalOptimizer(names, variables).visit(tree)
+    tree = _hoist_repeated_calls(tree)
+    return ast.fix_missing_locations(tree)
+
+class SafeExpression:
+    """
+    Validated, optimized and compiled expression. The namespace holds only the
+    allowed names the expression actually references; call it with keyword
+    values for its declared variables.
+    """
+    __slots__ = ("source", "variables", "code", "namespace", "complex_mode", "_vector_ns")
+
+    def __init__(self, source: str, variables: Tuple[str, ...], code, namespace: Dict[str, object],
+                 complex_mode: bool = False):
+        self.source = source
+        self.variables = variables
+        self.code = code
+        self.namespace = namespace
+        self.complex_mode = complex_mode
+        self._vector_ns: Optional[Dict[str, object]] = None
+
+    def __call__(self, **values):
+        return eval(self.code, self.namespace, dict(values))
+
+    def vectorized(self, **values):
+        """
+        Evaluate element-wise over NumPy arrays (math functions are swapped for
+        their NumPy equivalents, np.emath ones in the complex dialect). Requires NumPy.
+        """
+        if self._vector_ns is None:
+            self._vector_ns = _vector_namespace(self.namespace, self.complex_mode)
+        return eval(self.code, self._vector_ns, dict(values))
+
+    def bind(self, env: Dict[str, object]) -> "SafeExpression":
+        """
+        Copy whose namespace also provides `env` (session values and functions);
+        the bound names stop being call-time variables.
+        """
+        if not env:
+            return self
+        variables = tuple(v for v in self.variables if v not in env)
+        return SafeExpression(self.source, variables, self.code, {**self.namespace, **env}, self.complex_mode)
+
+    def __repr__(self) -> str:
+        return f"SafeExpression({self.source!r}, variables={self.variables!r})"
+
+_NUMPY_EQUIV: Dict[str, str] = {
+    "fabs": "abs", "asin": "arcsin", "acos": "arccos", "atan": "arctan", "atan2": "arctan2",
+    "asinh": "arcsinh", "acosh": "arccosh", "atanh": "arctanh", "pow": "power", "phase": "angle",
+}
+
+# np.emath variants return complex results outside the real domain
+_EMATH_EQUIV: Dict[str, str] = {
+    "sqrt": "sqrt", "log10": "log10", "log2": "log2", "asin": "arcsin", "acos": "arccos",
+    "atanh": "arctanh", "pow": "power",
+}
+
+def _numpy_function(name: str, scalar_fn, complex_mode: bool = False):
+    np = _np
+    if complex_mode and name in _EMATH_EQUIV:
+        return getattr(np.emath, _EMATH_EQUIV[name])
+    if name == "log":
+        log = np.emath.log if complex_mode else np.log
+        def _log(x, base=None):
+            return log(x) if base is None else log(x) / log(base)
+        return _log
+    if name in ("min", "max"):
+        pair = np.minimum if name == "min" else np.maximum
+        return lambda *args: functools.reduce(pair, args) if len(args) > 1 else scalar_fn(*args)
+    info = FUNCTIONS.info(name)
+    target = getattr(np, _NUMPY_EQUIV.get(name, name), None) if info is None or info.vectorizable else None
+    if isinstance(target, np.ufunc) or name in ("round", "abs"):
+        return target
+    return np.vectorize(scalar_fn, otypes=[complex if complex_mode else float])
+
+def _vector_namespace(namespace: Dict[str, object], complex_mode: bool = False) -> Dict[str, object]:
+    if not HAVE_NUMPY:
+        raise ValueError("Для векторных вычислений нужен numpy")
+    out: Dict[str, object] = {}
+    for name, value in namespace.items():
+        if callable(value) and not getattr(value, "vectorizes", False):
+            value = _numpy_function(name, value, complex_mode)
+        out[name] = value
+    return out
+
+def _referenced_names(tree: ast.AST) -> set:
+    return {n.id for n in ast.walk(tree) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load)}
+
+def expression_cost(tree: ast.AST, functions: FrozenSet[str] = frozenset()) -> int:
+    """
+    Cost class of a validated expression: the costliest registered function
+    it calls (unknown callables and series count as heavy), and heavy for any
+    power other than a small constant exponent over a power-free base.
+    Calls to `functions` are not counted; the caller rates their bodies.
+    """
+    cost = COST_CHEAP
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            if node.func.id in functions:
+                continue
+            info = FUNCTIONS.info(node.func.id)
+            if info is None or node.func.id in _SERIES_FUNCS:
+                return COST_HEAVY
+            cost = max(cost, info.cost)
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            exponent = node.right
+            while isinstance(exponent, ast.UnaryOp):
+                exponent = exponent.operand
+            small = (isinstance(exponent, ast.Constant) and _is_number(exponent.value)
+                     and abs(exponent.value) <= CFG.cheap_pow_max)
+            if not small or any(isinstance(n, ast.BinOp) and isinstance(n.op, ast.Pow) for n in ast.walk(node.left)):
+                return COST_HEAVY
+    return cost
+
+@functools.lru_cache(maxsize=512)
+def source_cost(expr: str) -> int:
+    """
+    expression_cost of raw input; anything that doesn't validate counts as heavy.
+    """
+    try:
+        tree = ast.parse(_normalize_expr(expr), mode="eval")
+        _SafeEvalVisitor().visit(tree)
+    except Exception:
+        return COST_HEAVY
+    return expression_cost(tree)
+
+def _is_complex_tree(tree: ast.AST) -> bool:
+    """
+    After real-dialect folding: a complex constant, or a constant-argument call
+    the folder had to leave in place (sqrt(-1), log(-2), acos(2), ...).
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, complex):
+            return True
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in COMPLEX_FUNCTIONS
+                and node.args and all(isinstance(a, ast.Constant) for a in node.args)):
+            return True
+    return False
+
+@functools.lru_cache(maxsize=512)
+def compile_safe(src: str, variables: Tuple[str, ...] = (), functions: Tuple[str, ...] = (),
+                 complex_mode: bool = False) -> SafeExpression:
+    """
+    Parse, validate, optimize and compile normalized source. Cached, so that
+    re-evaluating an unchanged expression (or an edited one returning to a
+    prefix) skips the AST work. `functions` are extra callable names supplied
+    at call time like variables (user-defined functions).
+
+    The dialect is fixed here: expressions that are complex at compile time
+    (or `complex_mode`, for complex variable values) bind the cmath functions,
+    so calls never try math first and fall back.
+    """
+    names = ChainMap(dict.fromkeys(functions), _ALLOWED_NAMES) if functions else _ALLOWED_NAMES
+    while True:
+        table = COMPLEX_NAMES if complex_mode else _ALLOWED_NAMES
+        tree = ast.parse(src, mode="eval")
+        _SafeEvalVisitor(variables, names=names).visit(tree)
+        lowering = _SeriesLowering(tuple(variables), tuple(functions), complex_mode)
+        tree = ast.fix_missing_locations(lowering.visit(tree))
+        tree = optimize_safe_ast(tree, table, tuple(variables) + tuple(functions))
+        if complex_mode or not _is_complex_tree(tree):
+            break
+        complex_mode = True
+    namespace: Dict[str, object] = {"__builtins__": None}
+    for name in _referenced_names(tree):
+        if name in table and name not in variables:
+            namespace[name] = table[name]
+    namespace.update(lowering.namespace)
+    return SafeExpression(src, tuple(variables), compile(tree, "<safe>", "eval"), namespace, complex_mode)
+
+# ---------------------------
+# Series: sum(expr, k, a, b) and prod(expr, k, a, b)
+# ---------------------------
+_SERIES_FUNCS = frozenset({"sum", "prod"})
+
+def _is_series_call(node) -> bool:
+    return (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _SERIES_FUNCS
+            and len(node.args) == 4 and not node.keywords)
+
+def _poly_degree(node: ast.AST, var: str, max_degree: int = 12) -> Optional[int]:
+    """
+    Degree of `node` as a polynomial in `var`, or None if it is not one.
+    """
+    if var not in _referenced_names(node):
+        return 0
+    if isinstance(node, ast.Name):
+        return 1
+    if isinstance(node, ast.UnaryOp):
+        return _poly_degree(node.operand, var, max_degree)
+    if not isinstance(node, ast.BinOp):
+        return None
+    left = _poly_degree(node.left, var, max_degree)
+    if left is None:
+        return None
+    if isinstance(node.op, (ast.Add, ast.Sub, ast.Mult)):
+        right = _poly_degree(node.right, var, max_degree)
+        if right is None:
+            return None
+        degree = left + right if isinstance(node.op, ast.Mult) else max(left, right)
+        return degree if degree <= max_degree else None
+    if isinstance(node.op, ast.Div):
+        return left if var not in _referenced_names(node.right) else None
+    if isinstance(node.op, ast.Pow) and isinstance(node.right, ast.Constant):
+        n = node.right.value
+        if isinstance(n, int) and 0 <= n and left * n <= max_degree:
+            return left * n
+    return None
+
+def _is_geometric(node: ast.AST, var: str) -> bool:
+    """
+    True if `node` is c * r**k: products and quotients of factors that are
+    constant in `var` or exponentials of an expression linear in it.
+    """
+    if var not in _referenced_names(node):
+        return True
+    if isinstance(node, ast.UnaryOp):
+        return _is_geometric(node.operand, var)
+    if isinstance(node, ast.BinOp):
+        if isinstance(node.op, (ast.Mult, ast.Div)):
+            return _is_geometric(node.left, var) and _is_geometric(node.right, var)
+        if isinstance(node.op, ast.Pow):
+            return var not in _referenced_names(node.left) and _poly_degree(node.right, var) == 1
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "exp" and len(node.args) == 1:
+        return _poly_degree(node.args[0], var) == 1
+    return False
+
+def _series_shape(body: ast.AST, var: str) -> Tuple[str, int]:
+    degree = _poly_degree(body, var)
+    if degree is not None:
+        return "poly", degree
+    return ("geom", 0) if _is_geometric(body, var) else ("", 0)
+
+def _series_bound(v) -> int:
+    try:
+        if isinstance(v, int) and not isinstance(v, bool):
+            return v
+        if isinstance(v, (float, Fraction, decimal.Decimal)) and v == int(v):
+            return int(v)
+    except (TypeError, ValueError, OverflowError, decimal.InvalidOperation):
+        pass
+    raise ValueError("Границы sum/prod должны быть целыми числами")
+
+class _SeriesOps:
+    """
+    Arithmetic for the series closed forms in the float dialect. Integer terms
+    stay exact (ratios become Fraction) until a power would exceed
+    CFG.max_exact_pow_bits; the precise evaluator substitutes its own rules.
+    """
+    add = staticmethod(operator.add)
+    sub = staticmethod(operator.sub)
+    mul = staticmethod(operator.mul)
+
+    @staticmethod
+    def div(a, b):
+        if isinstance(a, (int, Fraction)) and isinstance(b, (int, Fraction)):
+            return Fraction(a) / Fraction(b)
+        return a / b
+
+    @staticmethod
+    def pow(r, n: int):
+        if isinstance(r, (int, Fraction)):
+            f = Fraction(r)
+            if max(abs(f.numerator).bit_length(), f.denominator.bit_length()) * abs(n) > CFG.max_exact_pow_bits:
+                r = float(r)
+        return r ** n
+
+    @staticmethod
+    def loop_limit() -> int:
+        return CFG.series_loop_max
+
+    @staticmethod
+    def total(kind: str, values: List[object]):
+        if kind == "prod":
+            return math.prod(values)
+        if all(isinstance(v, int) for v in values) or any(isinstance(v, complex) for v in values):
+            return sum(values)
+        return math.fsum(values)
+
+    @staticmethod
+    def finish(v):
+        if isinstance(v, Fraction):
+            return v.numerator if v.denominator == 1 else float(v)
+        return v
+
+_SERIES_OPS = _SeriesOps()
+
+def _series_closed_form(kind: str, term: Callable[[int], object], a: int, n: int, shape: Tuple[str, int], ops: _SeriesOps):
+    form, degree = shape
+    if form == "poly" and kind == "sum":
+        # Newton's forward differences: sum_{i<n} p(a+i) = sum_j D^j p(a) * C(n, j+1)
+        diffs = [term(a + i) for i in range(degree + 1)]
+        total = 0
+        for j in range(degree + 1):
+            total = ops.add(total, ops.mul(diffs[0], math.comb(n, j + 1)))
+            diffs = [ops.sub(diffs[i + 1], diffs[i]) for i in range(len(diffs) - 1)]
+        return total
+    if form == "poly" and degree == 0:
+        return ops.pow(term(a), n)
+    if form == "geom":
+        t0 = term(a)
+        if t0 == 0:
+            return None
+        r = ops.div(term(a + 1), t0)
+        if kind == "prod":
+            return ops.mul(ops.pow(t0, n), ops.pow(r, n * (n - 1) // 2))
+        if r == 1:
+            return ops.mul(t0, n)
+        if isinstance(r, float) and r > 0:
+            return t0 * math.expm1(n * math.log(r)) / (r - 1)
+        return ops.div(ops.mul(t0, ops.sub(ops.pow(r, n), 1)), ops.sub(r, 1))
+    return None
+
+def _series_vectorized(kind: str, vector: Callable, a: int, b: int):
+    np = _np
+    chunk = CFG.series_chunk
+    partial: List[object] = []
+    product = 1.0
+    with np.errstate(all="ignore"):
+        for lo in range(a, b + 1, chunk):
+            ks = np.arange(lo, min(b + 1, lo + chunk), dtype=np.float64)
+            values = np.broadcast_to(np.asarray(vector(ks)), ks.shape)
+            if kind == "sum":
+                partial.append(values.sum().item())
+            else:
+                product *= values.prod().item()
+    if kind == "sum":
+        result = sum(partial) if any(isinstance(p, complex) for p in partial) else math.fsum(partial)
+    else:
+        result = product
+    if not cmath.isfinite(result):
+        raise ValueError("Ряд не определён или слишком велик")
+    return result
+
+def series_value(kind: str, term: Callable[[int], object], a, b, shape: Tuple[str, int] = ("", 0),
+                 ops: _SeriesOps = _SERIES_OPS, vector: Optional[Callable] = None):
+    """
+    sum/prod of term(k) for integer k in [a, b]. Polynomial and geometric
+    terms use closed forms; other terms are evaluated in NumPy chunks over
+    `arange` when `vector` is given and the range is long, else term by term.
+    """
+    a, b = _series_bound(a), _series_bound(b)
+    n = b - a + 1
+    if n <= 0:
+        return 0 if kind == "sum" else 1
+    if n > CFG.series_max_terms:
+        raise ValueError("Слишком много членов ряда")
+    try:
+        result = _series_closed_form(kind, term, a, n, shape, ops)
+        if result is None:
+            if vector is not None and n > CFG.series_loop_terms and max(abs(a), abs(b)) < 2 ** 53:
+                return _series_vectorized(kind, vector, a, b)
+            if n > ops.loop_limit():
+                raise ValueError("Слишком много членов ряда для этого режима")
+            result = ops.total(kind, [term(k) for k in range(a, b + 1)])
+        return ops.finish(result)
+    except OverflowError:
+        raise ValueError("Результат слишком велик")
+
+class _SeriesCall:
+    """
+    Runtime for a lowered sum/prod call: `_sN(a, b, *outer variable values)`.
+    """
+    __slots__ = ("kind", "var", "body", "outer", "shape")
+
+    def __init__(self, kind: str, var: str, body: SafeExpression, outer: Tuple[str, ...], shape: Tuple[str, int]):
+        self.kind = kind
+        self.var = var
+        self.body = body
+        self.outer = outer
+        self.shape = shape
+
+    def __call__(self, a, b, *outer):
+        env = dict(zip(self.outer, outer))
+        var, body = self.var, self.body
+        vector = (lambda ks: body.vectorized(**env, **{var: ks})) if HAVE_NUMPY else None
+        return series_value(self.kind, lambda k: body(**env, **{var: k}), a, b, self.shape, _SERIES_OPS, vector)
+
+class _SeriesLowering(ast.NodeTransformer):
+    """
+    Replaces validated sum/prod calls with calls to `_SeriesCall` objects. The
+    body is compiled on its own (through the compile_safe cache) with the index
+    as an extra variable, and outer variables it uses are passed explicitly.
+    """
+    def __init__(self, variables: Tuple[str, ...], functions: Tuple[str, ...] = (), complex_mode: bool = False):
+        self.variables = tuple(variables)
+        self.functions = tuple(functions)
+        self.complex_mode = complex_mode
+        self.namespace: Dict[str, _SeriesCall] = {}
+
+    def visit_Call(self, node: ast.Call):
+        if not _is_series_call(node):
+            self.generic_visit(node)
+            return node
+        body, var = node.args[0], node.args[1].id
+        used = _referenced_names(body)
+        outer = tuple(v for v in self.variables + self.functions if v in used)
+        compiled = compile_safe(ast.unparse(body), self.variables + (var,), self.functions, self.complex_mode)
+        name = f"_s{len(self.namespace)}"
+        self.namespace[name] = _SeriesCall(node.func.id, var, compiled, outer, _series_shape(body, var))
+        args = [self.visit(node.args[2]), self.visit(node.args[3])] + [ast.Name(id=v, ctx=ast.Load()) for v in outer]
+        return ast.copy_location(ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=args, keywords=[]), node)
+
+# ---------------------------
+# Fast path: pure keypad arithmetic
+# ---------------------------
+_FAST_DIGITS = frozenset("0123456789")
+_FAST_BINOPS: Dict[str, Tuple[int, Callable]] = {
+    "+": (1, operator.add),
+    "-": (1, operator.sub),
+    "*": (2, operator.mul),
+    "/": (2, operator.truediv),
+    "%": (2, operator.mod),
+    "//": (2, operator.floordiv),
+}
+_FAST_UNARY_BP = 3
+
+class _FastPathUnsupported(Exception):
+    pass
+
+def _fast_tokenize(src: str) -> List[object]:
+    """
+    Split normalized source into numbers (imaginary literals like 2j included)
+    and operator strings. Anything outside digits, '.', 'j', + - * / % // and
+    parentheses (names, calls, '**', exponents, literals Python would reject)
+    makes the caller fall back to the AST path.
+    """
+    tokens: List[object] = []
+    i, n = 0, len(src)
+    while i < n:
+        ch = src[i]
+        if ch == " " or ch == "\t":
+            i += 1
+            continue
+        if ch in _FAST_DIGITS or ch == ".":
+            j = i
+            while j < n and (src[j] in _FAST_DIGITS or src[j] == "."):
+                j += 1
+            imaginary = j < n and src[j] in "jJ"
+            if imaginary:
+                j += 1
+            if j < n and (src[j].isalnum() or src[j] == "_"):
+                raise _FastPathUnsupported
+            lit = src[i:j - 1] if imaginary else src[i:j]
+            dots = lit.count(".")
+            if dots > 1 or lit == ".":
+                raise _FastPathUnsupported
+            if imaginary:
+                tokens.append(complex(0.0, float(lit)))
+            elif dots:
+                tokens.append(float(lit))
+            else:
+                if len(lit) > 1 and lit[0] == "0" and lit.strip("0"):
+                    raise _FastPathUnsupported
+                tokens.append(int(lit))
+            i = j
+            continue
+        if ch in "+-%()":
+            tokens.append(ch)
+            i += 1
+            continue
+        if ch == "*":
+            if i + 1 < n and src[i + 1] == "*":
+                raise _FastPathUnsupported
+            tokens.append("*")
+            i += 1
+            continue
+        if ch == "/":
+            if i + 1 < n and src[i + 1] == "/":
+                tokens.append("//")
+                i += 2
+            else:
+                tokens.append("/")
+                i += 1
+            continue
+        raise _FastPathUnsupported
+    return tokens
+
+def _fast_arith_eval(src: str):
+    """
+    Pratt evaluator for the keypad subset of the dialect. Uses the same Python
+    operators and precedence as the compiled path, so results are identical.
+    Returns None when the source is outside the subset.
+    """
+    try:
+        tokens = _fast_tokenize(src)
+    except _FastPathUnsupported:
+        return None
+    if not tokens:
+        return None
+    pos = 0
+    ntok = len(tokens)
+
+    def parse(min_bp: int):
+        nonlocal pos
+        if pos >= ntok:
+            raise _FastPathUnsupported
+        tok = tokens[pos]
+        pos += 1
+        if tok == "(":
+            left = parse(0)
+            if pos >= ntok or tokens[pos] != ")":
+                raise _FastPathUnsupported
+            pos += 1
+        elif tok == "-":
+            left = -parse(_FAST_UNARY_BP)
+        elif tok == "+":
+            left = +parse(_FAST_UNARY_BP)
+        elif isinstance(tok, (int, float, complex)):
+            left = tok
+        else:
+            raise _FastPathUnsupported
+        while pos < ntok:
+            op = tokens[pos]
+            if op == ")":
+                break
+            spec = _FAST_BINOPS.get(op) if isinstance(op, str) else None
+            if spec is None:
+                raise _FastPathUnsupported
+            bp, fn = spec
+            if bp <= min_bp:
+                break
+            pos += 1
+            left = fn(left, parse(bp))
+        return left
+
+    try:
+        result = parse(0)
+        if pos != ntok:
+            return None
+        return _real_if_exact(result)
+    except _FastPathUnsupported:
+        return None
+    except RecursionError:
+        return None
+    except Exception as exc:
+        raise ValueError("Неверное выражение") from exc
+
+def _call_name(src: str, i: int) -> str:
+    """
+    Identifier right before the '(' at `i` ("" for a grouping parenthesis).
+    """
+    j = i
+    while j > 0 and src[j - 1].isspace():
+        j -= 1
+    k = j
+    while k > 0 and (src[k - 1].isalnum() or src[k - 1] == "_"):
+        k -= 1
+    name = src[k:j]
+    return name if name and not name[0].isdigit() else ""
+
+def _semicolon_brackets(src: str) -> set:
+    """
+    Positions of the opening brackets whose own arguments are separated by ';'.
+    """
+    found: set = set()
+    stack: List[int] = []
+    for i, ch in enumerate(src):
+        if ch in "([":
+            stack.append(i)
+        elif ch in ")]":
+            if stack:
+                stack.pop()
+        elif ch == ";" and stack:
+            found.add(stack[-1])
+    return found
+
+def _decimal_commas(src: str, unary: FrozenSet[str] = frozenset()) -> str:
+    """
+    Rewrite "2,5" to "2.5" where a comma can't separate arguments: outside
+    calls, inside calls of one-argument functions (built-in or the names in
+    `unary`) and inside calls whose arguments are separated by ';'. In other
+    calls and in [...] a comma always separates, so "log(8,2)",
+    "sum(k,k,1,10)" and "[1,2]" read as usual.
+    """
+    if "," not in src:
+        return src
+    out = list(src)
+    semicolons = _semicolon_brackets(src) if ";" in src else set()
+    decimal_ok: List[bool] = []  # per open bracket
+    for i, ch in enumerate(src):
+        if ch == "(":
+            name = _call_name(src, i)
+            info = FUNCTIONS.info(name) if name and name not in _SERIES_FUNCS else None
+            decimal_ok.append(not name or i in semicolons or name in unary
+                              or (info is not None and info.max_args == 1))
+        elif ch == "[":
+            decimal_ok.append(i in semicolons)
+        elif ch in ")]":
+            if decimal_ok:
+                decimal_ok.pop()
+        elif (ch == "," and 0 < i < len(src) - 1 and src[i - 1].isdigit() and src[i + 1].isdigit()
+              and (not decimal_ok or decimal_ok[-1])):
+            out[i] = "."
+    return "".join(out)
+
+def _normalize_expr(expr: str, decimal_comma: bool = True, unary: FrozenSet[str] = frozenset()) -> str:
     if not expr or not isinstance(expr, str):
         raise ValueError("Пустое выражение")
-    src = expr.replace("^", "**").replace("×", "*").replace("÷", "/").replace(",", ".").strip()
+    src = expr.replace("^", "**").replace("×", "*").replace("÷", "/").strip()
+    # "2,5" is a decimal comma; commas between call arguments and ';' separate arguments
+    if decimal_comma:
+        src = _decimal_commas(src, unary)
+    src = src.replace(";", ",")
     if "_" in src:
         raise ValueError("Символ '_' запрещён в выражениях")
+    return src
+
+def fast_eval(expr: str):
+    """
+    Evaluate `expr` with the arithmetic fast path only; None if it needs the full evaluator.
+    """
+    return _fast_arith_eval(_normalize_expr(expr))
+
+def safe_eval(expr: str):
+    """
+    Safely evaluate a math expression using AST validation.
+    """
+    src = _normalize_expr(expr)
+    fast = _fast_arith_eval(src)
+    if fast is not None:
+        return fast
+    try:
+        fn = compile_safe(src)
+        return _real_if_exact(fn()) if fn.complex_mode else fn()
+    except ValueError as exc:
+        _reraise_domain_error(exc)
+        raise
+    except Exception as exc:
+        raise ValueError("Неверное выражение") from exc
+
+# ---------------------------
+# Precise evaluation (Fraction / Decimal)
+# ---------------------------
+@functools.lru_cache(maxsize=256)
+def _parse_validated(src: str) -> ast.AST:
+    tree = ast.parse(src, mode="eval")
+    _SafeEvalVisitor().visit(tree)
+    return tree.body
+
+@functools.lru_cache(maxsize=8)
+def _decimal_pi(prec: int) -> decimal.Decimal:
+    # Series from the decimal module documentation, run with guard digits.
+    with decimal.localcontext() as ctx:
+        ctx.prec = prec + 4
+        three = decimal.Decimal(3)
+        lasts, t, s, n, na, d, da = 0, three, 3, 1, 0, 0, 24
+        while s != lasts:
+            lasts = s
+            n, na = n + na, na + 8
+            d, da = d + da, da + 32
+            t = (t * n) / d
+            s += t
+    with decimal.localcontext() as ctx:
+        ctx.prec = prec
+        return +s
+
+_PRECISE_DOMAIN_ERROR = "Вне области определения"
+
+class _PreciseEvaluator:
+    """
+    Evaluates a validated AST exactly where possible: integers stay int,
+    decimal literals become Fraction, +-*/ and integer powers stay rational.
+    Irrational results use Decimal at the context precision (sqrt, exp, ln,
+    log10, non-integer powers); other transcendental functions fall back to float.
+    Node handlers are looked up in a type -> method table.
+    """
+    _DECIMAL_FUNCS = {"sqrt", "exp", "log", "log10", "log2"}
+    _EXACT_FUNCS = {"abs", "fabs", "floor", "ceil", "trunc", "round", "min", "max", "factorial"}
+
+    def __init__(self, prec: int):
+        self.prec = prec
+        self.env: Dict[str, object] = {}
+        self._dispatch = {
+            ast.Constant: self._constant,
+            ast.Name: self._name,
+            ast.UnaryOp: self._unary,
+            ast.BinOp: self._binop,
+            ast.Call: self._call,
+            ast.Tuple: self._sequence,
+            ast.List: self._sequence,
+        }
+
+    def eval(self, node):
+        handler = self._dispatch.get(type(node))
+        if handler is None:
+            raise ValueError(f"Недопустимый элемент выражения: {type(node).__name__}")
+        return handler(node)
+
+    # ---- conversions ----
+    def _dec(self, v) -> decimal.Decimal:
+        if isinstance(v, decimal.Decimal):
+            return v
+        if isinstance(v, Fraction):
+            return decimal.Decimal(v.numerator) / decimal.Decimal(v.denominator)
+        return decimal.Decimal(v)
+
+    @staticmethod
+    def _is_rational(v) -> bool:
+        return isinstance(v, (int, Fraction)) and not isinstance(v, bool)
+
+    @staticmethod
+    def _is_inexact(v) -> bool:
+        return isinstance(v, (float, complex))
+
+    # ---- handlers ----
+    def _constant(self, node: ast.Constant):
+        v = node.value
+        if isinstance(v, float):
+            return Fraction(decimal.Decimal(repr(v))) if math.isfinite(v) else v
+        return v
+
+    def _name(self, node: ast.Name):
+        if node.id in self.env:
+            return self.env[node.id]
+        if node.id == "pi":
+            return _decimal_pi(self.prec)
+        if node.id == "tau":
+            return 2 * _decimal_pi(self.prec)
+        if node.id == "e":
+            return decimal.Decimal(1).exp()
+        return _ALLOWED_NAMES[node.id]
+
+    def _unary(self, node: ast.UnaryOp):
+        v = self.eval(node.operand)
+        return -v if isinstance(node.op, ast.USub) else +v
+
+    def _sequence(self, node):
+        items = [self.eval(elt) for elt in node.elts]
+        return tuple(items) if isinstance(node, ast.Tuple) else items
+
+    def _binop(self, node: ast.BinOp):
+        return self._arith(type(node.op), self.eval(node.left), self.eval(node.right))
+
+    def _arith(self, op: type, a, b):
+        if self._is_inexact(a) or self._is_inexact(b):
+            return _FOLD_BINOPS[op](complex(a) if isinstance(a, complex) else float(a),
+                                    complex(b) if isinstance(b, complex) else float(b))
+        if op is ast.Pow:
+            return self._pow(a, b)
+        if self._is_rational(a) and self._is_rational(b):
+            if op is ast.Div:
+                return Fraction(a) / Fraction(b)
+            return _FOLD_BINOPS[op](a, b)
+        return _FOLD_BINOPS[op](self._dec(a), self._dec(b))
+
+    def _pow(self, a, b):
+        if self._is_rational(b) and Fraction(b).denominator == 1 and self._is_rational(a):
+            return Fraction(a) ** int(b) if int(b) < 0 else a ** int(b)
+        return self._dec(a) ** self._dec(b)
+
+    def _series(self, node: ast.Call):
+        var, body = node.args[1].id, node.args[0]
+        a, b = self.eval(node.args[2]), self.eval(node.args[3])
+        saved = self.env.get(var)
+
+        def term(k: int):
+            self.env[var] = k
+            return self.eval(body)
+
+        try:
+            return series_value(node.func.id, term, a, b, _series_shape(body, var), _PreciseSeriesOps(self))
+        finally:
+            self.env.pop(var, None)
+            if saved is not None:
+                self.env[var] = saved
+
+    def _log_ratio(self, x, base):
+        """
+        log(x, base): an exact int when base**k == x, else ln(x) / ln(base)
+        with guard digits, rounded once to the context precision.
+        """
+        b = self._dec(base)
+        if b <= 0 or b == 1:
+            raise ValueError(_PRECISE_DOMAIN_ERROR)
+        with decimal.localcontext() as ctx:
+            ctx.prec += 10
+            ratio = self._dec(x).ln() / b.ln()
+        k = ratio.to_integral_value()
+        if self._is_rational(x) and self._is_rational(base) and abs(ratio - k) < decimal.Decimal("1e-6"):
+            fx, fb = Fraction(x), Fraction(base)
+            # base**k can only equal x if it is about as large as x
+            x_bits = fx.numerator.bit_length() + fx.denominator.bit_length()
+            if abs(int(k)) * max(fb.numerator.bit_length(), fb.denominator.bit_length()) <= 2 * x_bits + 64:
+                if fb ** int(k) == fx:
+                    return int(k)
+        return +ratio
+
+    def _call(self, node: ast.Call):
+        if _is_series_call(node):
+            return self._series(node)
+        name = node.func.id
+        args = [self.eval(a) for a in node.args]
+        if not any(self._is_inexact(a) for a in args):
+            if name in self._DECIMAL_FUNCS and len(args) in (1, 2):
+                x = self._dec(args[0])
+                if name == "sqrt":
+                    if x < 0:
+                        raise ValueError(_PRECISE_DOMAIN_ERROR)
+                    return x.sqrt()
+                if name == "exp":
+                    return x.exp()
+                if x <= 0:
+                    raise ValueError(_PRECISE_DOMAIN_ERROR)
+                if name == "log10":
+                    return x.log10()
+                if name == "log2":
+                    return self._log_ratio(args[0], 2)
+                if len(args) == 2:
+                    return self._log_ratio(args[0], args[1])
+                return x.ln()
+            if name in self._EXACT_FUNCS:
+                if name in ("fabs", "abs"):
+                    return abs(args[0])
+                if name == "factorial":
+                    return math.factorial(int(args[0]))
+                if name in ("min", "max"):
+                    return (min if name == "min" else max)(*args)
+                if name == "round" and len(args) == 2:
+                    return round(args[0], int(args[1]))
+                return {"floor": math.floor, "ceil": math.ceil, "trunc": math.trunc, "round": round}[name](args[0])
+        fn = _ALLOWED_NAMES[name]
+        return fn(*[self._plain_arg(a) for a in args])
+
+    @staticmethod
+    def _plain_arg(v):
+        """
+        Argument for a float-domain function: integral values stay int (isqrt,
+        comb, gcd, ... reject floats), other rationals and Decimals become float.
+        """
+        if isinstance(v, Fraction) and v.denominator == 1:
+            return v.numerator
+        if isinstance(v, (int, complex, list, tuple)):
+            return v
+        return float(v)
+
+class _PreciseSeriesOps(_SeriesOps):
+    """
+    Series arithmetic with the precise evaluator's mixing rules (Fraction and
+    Decimal never meet directly). Closed forms stay rational; long numeric
+    sums of fractions go through Decimal, whose denominators don't grow.
+    """
+    def __init__(self, ev: _PreciseEvaluator):
+        self.dec = ev._dec
+        self.add = lambda a, b: ev._arith(ast.Add, a, b)
+        self.sub = lambda a, b: ev._arith(ast.Sub, a, b)
+        self.mul = lambda a, b: ev._arith(ast.Mult, a, b)
+        self.div = lambda a, b: ev._arith(ast.Div, a, b)
+        self.pow = lambda a, n: ev._pow(a, n)
+
+    @staticmethod
+    def loop_limit() -> int:
+        return CFG.series_precise_terms
+
+    def total(self, kind: str, values: List[object]):
+        if any(isinstance(v, Fraction) for v in values):
+            values = [self.dec(v) if isinstance(v, Fraction) else v for v in values]
+        return functools.reduce(self.add if kind == "sum" else self.mul, values)
+
+    @staticmethod
+    def finish(v):
+        return v
+
+def _precise_result(v):
+    if isinstance(v, Fraction):
+        if v.denominator == 1:
+            return v.numerator
+        return +(decimal.Decimal(v.numerator) / decimal.Decimal(v.denominator))
+    if isinstance(v, decimal.Decimal):
+        if v == v.to_integral_value() and v.adjusted() < decimal.getcontext().prec:
+            return int(v)
+        return +v
+    return v
+
+def safe_eval_precise(expr: str, prec: Optional[int] = None):
+    """
+    Evaluate in arbitrary precision: `0,1+0,2` gives exactly 0.3.
+    """
+    src = _normalize_expr(expr)
+    prec = CFG.precise_digits if prec is None else int(prec)
     try:
-        node = ast.parse(src, mode="eval")
-        _SafeEvalVisitor().visit(node)
-        code = compile(node, "<safe>", "eval")
-        return eval(code, {"__builtins__": None}, _ALLOWED_NAMES)
+        tree = _parse_validated(src)
+        with decimal.localcontext() as ctx:
+            ctx.prec = prec
+            ctx.traps[decimal.InvalidOperation] = True
+            ctx.traps[decimal.DivisionByZero] = True
+            return _precise_result(_PreciseEvaluator(prec).eval(tree))
+    except ValueError as exc:
+        if str(exc) == "math domain error":
+            raise ValueError(_PRECISE_DOMAIN_ERROR) from exc
+        raise
+    except decimal.InvalidOperation as exc:
+        raise ValueError(_PRECISE_DOMAIN_ERROR) from exc
+    except Exception as exc:
+        raise ValueError("Неверное выражение") from exc
+
+# ---------------------------
+# Matrix mode (NumPy arrays)
+# ---------------------------
+_MATRIX_FUNCS: Dict[str, str] = {
+    "dot": "dot", "transpose": "transpose", "eye": "eye", "zeros": "zeros", "ones": "ones", "trace": "trace",
+    "det": "linalg.det", "inv": "linalg.inv", "solve": "linalg.solve", "norm": "linalg.norm", "rank": "linalg.matrix_rank",
+}
+
+def _matrix_function(name: str):
+    target = _np
+    for part in _MATRIX_FUNCS[name].split("."):
+        target = getattr(target, part)
+    return target
+
+def _as_array(*items):
+    return _np.array(items)
+
+class _ArrayLiterals(ast.NodeTransformer):
+    """
+    `[a, b]` / `(a, b)` become `_array(a, b)`, so literals are NumPy arrays and
+    operators act element-wise instead of repeating or concatenating lists.
+    """
+    def _wrap(self, node):
+        self.generic_visit(node)
+        call = ast.Call(func=ast.Name(id="_array", ctx=ast.Load()), args=list(node.elts), keywords=[])
+        return ast.copy_location(call, node)
+
+    visit_List = _wrap
+    visit_Tuple = _wrap
+
+@functools.lru_cache(maxsize=128)
+def compile_matrix(src: str) -> SafeExpression:
+    """
+    compile_safe for the matrix dialect: list literals are arrays, `@` is
+    matrix product, math functions are their NumPy ufuncs and the linear
+    algebra functions in _MATRIX_FUNCS are allowed. sqrt, log and the other
+    np.emath functions go complex outside the real domain instead of nan.
+    """
+    if not HAVE_NUMPY:
+        raise ValueError("Для матриц нужен numpy")
+    names = ChainMap(dict.fromkeys(_MATRIX_FUNCS), _ALLOWED_NAMES)
+    tree = ast.parse(src, mode="eval")
+    _SafeEvalVisitor(names=names, matmul=True).visit(tree)
+    lowering = _SeriesLowering(())
+    tree = lowering.visit(tree)
+    tree = ast.fix_missing_locations(_ArrayLiterals().visit(tree))
+    tree = optimize_safe_ast(tree, _ALLOWED_NAMES)
+    namespace: Dict[str, object] = {"__builtins__": None, "_array": _as_array}
+    for name in _referenced_names(tree):
+        if name in _MATRIX_FUNCS:
+            namespace[name] = _matrix_function(name)
+        elif name in _ALLOWED_NAMES:
+            value = _ALLOWED_NAMES[name]
+            emath = name in _EMATH_EQUIV or name == "log"
+            namespace[name] = _numpy_function(name, value, emath) if callable(value) else value
+    namespace.update(lowering.namespace)
+    return SafeExpression(src, (), compile(tree, "<matrix>", "eval"), namespace)
+
+_SHAPE_ERROR_HINTS = ("shape", "broadcast", "aligned", "dimension", "square")
+
+def safe_eval_matrix(expr: str):
+    """
+    Evaluate in the matrix dialect. 0-d results come back as Python scalars.
+    Every comma separates elements here, since (a, b) is an array too.
+    """
+    src = _normalize_expr(expr, decimal_comma=False)
+    try:
+        fn = compile_matrix(src)
     except ValueError:
         raise
     except Exception as exc:
         raise ValueError("Неверное выражение") from exc
+    try:
+        with _np.errstate(all="ignore"):
+            value = fn()
+    except _np.linalg.LinAlgError as exc:
+        raise ValueError("Матрица вырождена или не квадратная") from exc
+    except ValueError as exc:
+        if any(h in str(exc) for h in _SHAPE_ERROR_HINTS):
+            raise ValueError("Размеры матриц не согласованы") from exc
+        raise
+    except Exception as exc:
+        raise ValueError("Неверное выражение") from exc
+    if isinstance(value, _np.ndarray) and value.ndim == 0:
+        value = value.item()
+    elif isinstance(value, _np.generic):
+        value = value.item()
+    return value
+
+def is_array(value) -> bool:
+    return HAVE_NUMPY and isinstance(value, _np.ndarray)
+
+def array_inline_text(a) -> str:
+    return _np.array2string(a, separator=", ", precision=6, suppress_small=True, max_line_width=10 ** 6).replace("\n", "")
+
+def array_summary(a) -> str:
+    kind = "вектор" if a.ndim == 1 else "матрица"
+    return f"{kind} {'×'.join(str(n) for n in a.shape)}"
+
+# ---------------------------
+# Session definitions (user variables and functions)
+# ---------------------------
+_IDENTIFIER = re.compile(r"[^\W\d]\w*")
+
+@dataclass(frozen=True)
+class Definition:
+    name: str
+    params: Tuple[str, ...]
+    source: str
+    text: str
+    deps: FrozenSet[str]
+
+def _has_complex(env: Dict[str, object]) -> bool:
+    return any(isinstance(v, complex) for v in env.values())
+
+class UserFunction:
+    """
+    A compiled `f(x) = ...` definition. Scalar calls are memoized (bounded);
+    NumPy array arguments evaluate the body element-wise in one pass. Complex
+    arguments use a complex-dialect body, compiled on first need.
+    """
+    vectorizes = True
+
+    def __init__(self, name: str, params: Tuple[str, ...], compile_body: Callable[[bool], SafeExpression]):
+        self.name = name
+        self.params = params
+        self.body = compile_body(False)
+        self._compile_body = compile_body
+        self._complex_body: Optional[SafeExpression] = None
+        self._memo: Dict[tuple, object] = {}
+
+    def _body_for(self, args) -> SafeExpression:
+        if self.body.complex_mode or not any(
+                isinstance(a, complex) or (HAVE_NUMPY and isinstance(a, _np.ndarray) and _np.iscomplexobj(a))
+                for a in args):
+            return self.body
+        if self._complex_body is None:
+            self._complex_body = self._compile_body(True)
+        return self._complex_body
+
+    def __call__(self, *args):
+        if len(args) != len(self.params):
+            raise ValueError(f"{self.name}: ожидается аргументов: {len(self.params)}")
+        values = dict(zip(self.params, args))
+        body = self._body_for(args)
+        if HAVE_NUMPY and any(isinstance(a, _np.ndarray) for a in args):
+            return body.vectorized(**values)
+        key = tuple((type(a), a) for a in args)
+        try:
+            return self._memo[key]
+        except (KeyError, TypeError):
+            pass
+        result = body(**values)
+        if len(self._memo) < CFG.session_memo_size:
+            try:
+                self._memo[key] = result
+            except TypeError:
+                pass
+        return result
+
+    def __repr__(self) -> str:
+        return f"{self.name}({', '.join(self.params)})"
+
+class Session:
+    """
+    User variables (`r = 3,5`) and functions (`f(x) = x^2+1`). Definitions form
+    a dependency graph: redefining a name drops the cached results of exactly
+    the definitions that depend on it, everything else stays cached.
+    """
+    def __init__(self):
+        self.defs: Dict[str, Definition] = {}
+        self._cache: Dict[str, object] = {}
+        self.version = 0
+
+    @staticmethod
+    def is_definition(text: str) -> bool:
+        return "=" in (text or "")
+
+    def uses(self, text: str) -> bool:
+        """
+        Cheap check whether `text` mentions any defined name.
+        """
+        return bool(self.defs) and any(n in self.defs for n in _IDENTIFIER.findall(text or ""))
+
+    def normalize(self, text: str) -> str:
+        """
+        _normalize_expr where one-parameter session functions read "f(2,5)"
+        with a decimal comma, like "sin(2,5)".
+        """
+        return _normalize_expr(text, unary=frozenset(n for n, d in self.defs.items() if len(d.params) == 1))
+
+    def parse(self, text: str) -> Definition:
+        lhs, _sep, rhs = (text or "").partition("=")
+        if "=" in rhs:
+            raise ValueError("В определении должен быть один знак '='")
+        src = self.normalize(rhs)
+        try:
+            head = ast.parse(_normalize_expr(lhs), mode="eval").body
+            tree = ast.parse(src, mode="eval")
+        except SyntaxError as exc:
+            raise ValueError("Неверное определение") from exc
+        if isinstance(head, ast.Name):
+            name, params = head.id, ()
+        elif (isinstance(head, ast.Call) and isinstance(head.func, ast.Name) and head.args
+              and not head.keywords and all(isinstance(a, ast.Name) for a in head.args)):
+            name, params = head.func.id, tuple(a.id for a in head.args)
+        else:
+            raise ValueError("Слева от '=' должно быть имя или f(x)")
+        for n in (name,) + params:
+            if n in _ALLOWED_NAMES or n in _SERIES_FUNCS:
+                raise ValueError(f"Имя '{n}' занято встроенной функцией")
+        if len(set(params)) != len(params) or name in params:
+            raise ValueError("Повторяющиеся имена в определении")
+        deps = frozenset(n for n in _referenced_names(tree)
+                         if (n in self.defs or n == name) and n not in params)
+        return Definition(name, params, src, text.strip(), deps)
+
+    def _split(self, names) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        names = sorted(names)
+        return (tuple(n for n in names if not self.defs[n].params),
+                tuple(n for n in names if self.defs[n].params))
+
+    def _compile(self, d: Definition, complex_mode: bool = False) -> SafeExpression:
+        variables, functions = self._split(d.deps)
+        return compile_safe(d.source, d.params + variables, functions, complex_mode)
+
+    def dependents(self, name: str) -> set:
+        """
+        Definitions that depend on `name`, directly or transitively.
+        """
+        out: set = set()
+        frontier = [name]
+        while frontier:
+            current = frontier.pop()
+            for other, d in self.defs.items():
+                if current in d.deps and other not in out:
+                    out.add(other)
+                    frontier.append(other)
+        return out
+
+    def _check(self, d: Definition):
+        if d.name in d.deps or d.deps & self.dependents(d.name):
+            raise ValueError("Циклическая зависимость")
+        old = self.defs.get(d.name)
+        if old is not None and bool(old.params) != bool(d.params) and self.dependents(d.name):
+            raise ValueError(f"На '{d.name}' ссылаются другие определения")
+        try:
+            self._compile(d)
+        except ValueError:
+            raise
+        except Exception as exc:
+            raise ValueError("Неверное определение") from exc
+
+    def define(self, text: str) -> Definition:
+        d = self.parse(text)
+        self._check(d)
+        self._invalidate(d.name)
+        self.defs[d.name] = d
+        self.version += 1
+        return d
+
+    def _invalidate(self, name: str):
+        for n in self.dependents(name) | {name}:
+            self._cache.pop(n, None)
+
+    def remove(self, name: str):
+        if name not in self.defs:
+            raise ValueError(f"Нет определения '{name}'")
+        if self.dependents(name):
+            raise ValueError(f"На '{name}' ссылаются другие определения")
+        self._drop(name)
+
+    def _drop(self, name: str):
+        self._invalidate(name)
+        self.defs.pop(name, None)
+        self.version += 1
+
+    def clear(self):
+        self.defs.clear()
+        self._cache.clear()
+        self.version += 1
+
+    def texts(self) -> Tuple[str, ...]:
+        """
+        Definition texts in dependency order, so replaying them rebuilds the session.
+        """
+        ordered: List[str] = []
+        seen: set = set()
+
+        def visit(name: str):
+            if name in seen:
+                return
+            seen.add(name)
+            for dep in sorted(self.defs[name].deps):
+                visit(dep)
+            ordered.append(self.defs[name].text)
+
+        for name in self.defs:
+            visit(name)
+        return tuple(ordered)
+
+    def sync(self, texts: Tuple[str, ...]):
+        """
+        Make this session hold exactly `texts` (as produced by texts()),
+        redefining only what changed so unaffected cached values survive.
+        """
+        if texts == self.texts():
+            return
+        wanted = {}
+        for text in texts:
+            lhs = text.partition("=")[0]
+            wanted[_IDENTIFIER.findall(lhs)[0]] = text
+        for name in [n for n in self.defs if n not in wanted]:
+            self._drop(name)
+        for name, text in wanted.items():
+            if name not in self.defs or self.defs[name].text != text:
+                if name in self.defs and bool(self.defs[name].params) != ("(" in text.partition("=")[0]):
+                    self._drop(name)
+                self.define(text)
+
+    def get(self, name: str):
+        """
+        Value of a variable or the UserFunction of a function; cached until invalidated.
+        """
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+        d = self.defs[name]
+        env = self._env(d.deps)
+        complex_env = _has_complex(env)
+        if d.params:
+            value = UserFunction(name, d.params, lambda c: self._compile(d, c or complex_env).bind(env))
+        else:
+            expr = self._compile(d, complex_env).bind(env)
+            value = _real_if_exact(expr()) if expr.complex_mode else expr()
+        self._cache[name] = value
+        return value
+
+    def _env(self, names) -> Dict[str, object]:
+        return {n: self.get(n) for n in names}
+
+    def compile(self, src: str, variables: Tuple[str, ...] = (), bind: bool = True) -> SafeExpression:
+        """
+        compile_safe for normalized `src` with the session's names bound.
+        With `bind` off nothing is evaluated: the result validates `src` and
+        carries its source, for callers that evaluate in a worker's mirror.
+        """
+        try:
+            tree = ast.parse(src, mode="eval")
+        except SyntaxError as exc:
+            raise ValueError("Неверное выражение") from exc
+        names = [n for n in _referenced_names(tree) if n in self.defs and n not in variables]
+        session_vars, functions = self._split(names)
+        if not bind:
+            return compile_safe(src, tuple(variables) + session_vars, functions)
+        env = self._env(names)
+        expr = compile_safe(src, tuple(variables) + session_vars, functions, _has_complex(env))
+        return expr.bind(env)
+
+    def cost(self, src: str) -> int:
+        """
+        expression_cost of normalized `src` together with the definitions it
+        needs: function bodies always, variables only until their value is cached.
+        """
+        functions = frozenset(n for n, d in self.defs.items() if d.params)
+        try:
+            cost = expression_cost(ast.parse(src, mode="eval"), functions)
+        except SyntaxError:
+            return COST_HEAVY
+        pending = [n for n in _IDENTIFIER.findall(src) if n in self.defs]
+        seen: set = set()
+        while pending and cost < COST_HEAVY:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            d = self.defs[name]
+            if not d.params and name in self._cache:
+                continue
+            cost = max(cost, expression_cost(ast.parse(d.source, mode="eval"), functions))
+            pending.extend(d.deps)
+        return cost
+
+    def evaluate(self, text: str):
+        """
+        Evaluate an expression, or apply a definition (returning the variable's
+        value, None for a function).
+        """
+        try:
+            if self.is_definition(text):
+                d = self.define(text)
+                return None if d.params else self.get(d.name)
+            src = self.normalize(text)
+            fast = _fast_arith_eval(src)
+            if fast is not None:
+                return fast
+            expr = self.compile(src)
+            return _real_if_exact(expr()) if expr.complex_mode else expr()
+        except ValueError as exc:
+            _reraise_domain_error(exc)
+            raise
+        except Exception as exc:
+            raise ValueError("Неверное выражение") from exc
+
+    def preview(self, text: str):
+        """
+        Like evaluate(), but definitions are only tried: the would-be value of
+        a variable, None for functions and invalid definitions.
+        """
+        if not self.is_definition(text):
+            return self.evaluate(text)
+        d = self.parse(text)
+        if d.params:
+            return None
+        try:
+            self._check(d)
+            env = self._env(d.deps)
+            expr = self._compile(d, _has_complex(env)).bind(env)
+            return _real_if_exact(expr()) if expr.complex_mode else expr()
+        except ValueError:
+            return None
+
+_SESSION_MIRROR: Optional[Session] = None
+
+def _session_mirror(texts: Tuple[str, ...]) -> Session:
+    global _SESSION_MIRROR
+    if _SESSION_MIRROR is None:
+        _SESSION_MIRROR = Session()
+    _SESSION_MIRROR.sync(texts)
+    return _SESSION_MIRROR
+
+def session_eval(payload):
+    """
+    Worker task for (definition texts, expression, preview). The worker keeps
+    a mirror Session, so cached definition values survive between requests.
+    """
+    texts, expr, preview = payload
+    mirror = _session_mirror(texts)
+    value = mirror.preview(expr) if preview else mirror.evaluate(expr)
+    if isinstance(value, UserFunction):
+        raise ValueError(f"{value!r} — функция, укажите аргументы")
+    return value
+
+def session_grid(payload):
+    """
+    Worker task for (definition texts, normalized f(x) source, xs): samples
+    f over the xs array with evaluate_on_grid.
+    """
+    texts, src, xs = payload
+    return evaluate_on_grid(_session_mirror(texts).compile(src, ("x",)), xs)
+
+def session_roots(payload) -> List[float]:
+    """
+    Worker task for (definition texts, equation text, a, b): find_roots of the
+    equation compiled against the worker's mirror session.
+    """
+    texts, equation, a, b = payload
+    return find_roots(compile_equation(equation, _session_mirror(texts)), a, b)
+
+# ---------------------------
+# Out-of-process evaluation (hard time / memory limits)
+# ---------------------------
+try:
+    import resource  # type: ignore
+except Exception:
+    resource = None
+
+class EvaluationAborted(ValueError):
+    """
+    Raised when a sandboxed evaluation overran its time or memory budget.
+    """
+
+_WORKER_TASKS: Dict[str, Callable] = {
+    "eval": safe_eval,
+    "precise": safe_eval_precise,
+    "matrix": safe_eval_matrix,
+    "session": session_eval,
+    "grid": session_grid,
+    "roots": session_roots,
+    "power": exact_power,
+    "int_str": int_to_decimal_str,
+}
+
+def _current_vm_bytes(pid: Union[int, str] = "self") -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/statm", "r") as fh:
+            pages = int(fh.read().split()[0])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return None
+
+@functools.lru_cache(maxsize=1)
+def _win_memory_api():
+    import ctypes
+    from ctypes import wintypes
+
+    class Counters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+    kernel32.K32GetProcessMemoryInfo.argtypes = (wintypes.HANDLE, ctypes.POINTER(Counters), wintypes.DWORD)
+    kernel32.CloseHandle.argtypes = (wintypes.HANDLE,)
+    return ctypes, kernel32, Counters
+
+def _process_vm_bytes(pid: int) -> Optional[int]:
+    """
+    Committed memory of a worker process, for the parent-side memory watch
+    where RLIMIT_AS does not exist (Windows); None if it can't be read.
+    """
+    if sys.platform != "win32":
+        return _current_vm_bytes(pid)
+    try:
+        ctypes, kernel32, Counters = _win_memory_api()
+        handle = kernel32.OpenProcess(0x1000 | 0x0010, False, pid)  # query limited information | VM read
+        if not handle:
+            return None
+        try:
+            counters = Counters()
+            counters.cb = ctypes.sizeof(counters)
+            if not kernel32.K32GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return None
+            return int(counters.PagefileUsage)
+        finally:
+            kernel32.CloseHandle(handle)
+    except Exception:
+        return None
+
+def _eval_worker_main(conn, cpu_s: int, mem_mb: int):
+    """
+    Worker loop: receives (kind, payload) requests and answers (ok, value).
+    CPU time is limited per request via RLIMIT_CPU (SIGXCPU kills the worker),
+    memory via RLIMIT_AS on top of what the process already maps.
+    """
+    if resource is not None and mem_mb > 0:
+        base = _current_vm_bytes()
+        if base is not None:
+            try:
+                limit = base + mem_mb * 1024 * 1024
+                _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+                if hard != resource.RLIM_INFINITY:
+                    limit = min(limit, hard)
+                resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+            except Exception:
+                pass
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            return
+        if msg is None:
+            return
+        kind, payload = msg
+        if resource is not None and cpu_s > 0:
+            try:
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                used = usage.ru_utime + usage.ru_stime
+                _soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+                soft = int(math.ceil(used)) + int(cpu_s)
+                if hard != resource.RLIM_INFINITY:
+                    soft = min(soft, hard)
+                resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+            except Exception:
+                pass
+        try:
+            fn = _WORKER_TASKS[kind]
+            reply = (True, fn(payload))
+        except MemoryError:
+            reply = (False, "Недостаточно памяти для вычисления")
+        except ValueError as exc:
+            reply = (False, str(exc) or "Неверное выражение")
+        except Exception:
+            reply = (False, "Неверное выражение")
+        try:
+            conn.send(reply)
+        except Exception:
+            try:
+                conn.send((False, "Результат не удалось передать"))
+            except Exception:
+                return
+
+def _mp_context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+
+class _EvalWorker:
+    """
+    One worker process. Without the `resource` module (Windows) there are no
+    rlimits: the wall-clock timeout bounds CPU time, and the parent polls the
+    worker's memory while it waits and kills it past `mem_mb` over its idle size.
+    """
+    _MEMORY_POLL_S = 0.05
+
+    def __init__(self, ctx, cpu_s: int, mem_mb: int):
+        self._ctx = ctx
+        self._cpu_s = cpu_s
+        self._mem_mb = mem_mb
+        self.memory_watch = resource is None and mem_mb > 0
+        self.stopped = False
+        self.proc = None
+        self.conn = None
+        self.start()
+
+    def start(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(target=_eval_worker_main, args=(child_conn, self._cpu_s, self._mem_mb), daemon=True)
+        proc.start()
+        child_conn.close()
+        self.proc = proc
+        self.conn = parent_conn
+
+    def kill(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        try:
+            self.proc.kill()
+            self.proc.join(1.0)
+        except Exception:
+            pass
+
+    def restart(self):
+        self.kill()
+        if not self.stopped:
+            self.start()
+
+    def _memory_limit(self) -> Optional[int]:
+        if not self.memory_watch:
+            return None
+        base = _process_vm_bytes(self.proc.pid)
+        return None if base is None else base + self._mem_mb * 1024 * 1024
+
+    def _wait(self, timeout_s: float, limit: Optional[int]) -> bool:
+        """
+        Wait for the answer; False on timeout. Raises if the memory watch trips.
+        """
+        if limit is None:
+            return self.conn.poll(timeout_s)
+        deadline = time.monotonic() + timeout_s
+        while True:
+            left = deadline - time.monotonic()
+            if self.conn.poll(max(0.0, min(left, self._MEMORY_POLL_S))):
+                return True
+            if left <= 0:
+                return False
+            if (_process_vm_bytes(self.proc.pid) or 0) > limit:
+                self.restart()
+                raise EvaluationAborted("Вычисление прервано: превышен лимит памяти")
+
+    def call(self, kind: str, payload, timeout_s: float):
+        try:
+            limit = self._memory_limit()
+            self.conn.send((kind, payload))
+            ready = self._wait(timeout_s, limit)
+        except EvaluationAborted:
+            raise
+        except Exception:
+            ready = False
+        if not ready:
+            self.restart()
+            raise EvaluationAborted("Вычисление прервано: превышено время")
+        try:
+            ok, value = self.conn.recv()
+        except Exception:
+            self.restart()
+            raise EvaluationAborted("Вычисление прервано: превышен лимит ресурсов")
+        if not ok:
+            raise ValueError(value)
+        return value
+
+    def stop(self):
+        self.stopped = True
+        try:
+            self.conn.send(None)
+        except Exception:
+            pass
+        self.kill()
+
+class EvalWorkerPool:
+    """
+    Warm pool of pre-started evaluation processes. Each request runs under a
+    wall-clock timeout; a worker that overruns is killed and respawned, so a
+    stuck `eval` never blocks the caller longer than `timeout_s`.
+    """
+    def __init__(self, size: int = 2, timeout_s: float = 3.0, cpu_s: int = 3, mem_mb: int = 512):
+        self.size = max(1, int(size))
+        self.timeout_s = timeout_s
+        self._cpu_s = cpu_s
+        self._mem_mb = mem_mb
+        self._idle: List[_EvalWorker] = []
+        self._all: List[_EvalWorker] = []
+        self._cond = threading.Condition()
+        self._started = False
+
+    def start(self):
+        with self._cond:
+            if self._started:
+                return
+            ctx = _mp_context()
+            for _ in range(self.size):
+                w = _EvalWorker(ctx, self._cpu_s, self._mem_mb)
+                self._all.append(w)
+                self._idle.append(w)
+            self._started = True
+
+    def submit(self, kind: str, payload, timeout_s: Optional[float] = None):
+        """
+        Run a registered worker task and block until it answers or times out.
+        """
+        if not self._started:
+            self.start()
+        with self._cond:
+            while not self._idle:
+                if not self._started:
+                    raise EvaluationAborted("Вычисление прервано")
+                self._cond.wait()
+            worker = self._idle.pop()
+        try:
+            return worker.call(kind, payload, self.timeout_s if timeout_s is None else timeout_s)
+        finally:
+            with self._cond:
+                # a worker stopped by shutdown() while busy is not reused
+                if worker in self._all:
+                    self._idle.append(worker)
+                    self._cond.notify()
+
+    def shutdown(self):
+        with self._cond:
+            for w in self._all:
+                w.stop()
+            self._all.clear()
+            self._idle.clear()
+            self._started = False
+            self._cond.notify_all()
 
 # ---------------------------
 # Animator
@@ -441,6 +2566,52 @@ class Animator:
     def __init__(self, root: tk.Tk | tk.Toplevel):
         self.root = root
         self._jobs: Dict[str, int] = {}
+        self._factor_cache: Dict[Tuple[int, float, float], List[float]] = {}
+        self._press_origin: Dict[str, Tuple[int, int]] = {}
+        self._flash_origin: Dict[str, object] = {}
+        # measured cost per animation frame (ms, moving average) and the
+        # quality it allows: 2 full, 1 fewer frames, 0 color-only / no ambient
+        self.reduced_motion = CFG.reduced_motion
+        self.frame_cost_ms = 0.0
+        self._auto_quality = 2
+        self._quality_changed = 0.0
+
+    @property
+    def quality(self) -> int:
+        return 0 if self.reduced_motion else self._auto_quality
+
+    @property
+    def ambient_allowed(self) -> bool:
+        return self.quality == 2
+
+    def _record_cost(self, ms: float):
+        """
+        Update the frame-cost average and the automatic quality level. Quality
+        drops as soon as the average exceeds the budget, and only comes back
+        one level at a time after a quiet period, so it does not oscillate.
+        """
+        budget = CFG.anim_frame_budget_ms
+        # one stall (window creation, a long callback) must not degrade alone
+        self.frame_cost_ms += (min(ms, 4 * budget) - self.frame_cost_ms) * 0.25
+        level = 2 if self.frame_cost_ms <= budget else (1 if self.frame_cost_ms <= 2 * budget else 0)
+        now = time.monotonic()
+        if level < self._auto_quality:
+            self._auto_quality = level
+            self._quality_changed = now
+        elif (level > self._auto_quality and self.frame_cost_ms < budget / 2
+              and now - self._quality_changed > CFG.anim_recover_s):
+            self._auto_quality += 1
+            self._quality_changed = now
+
+    def _measure(self, start: float):
+        """
+        Record the cost of a change made at `start` (perf_counter) once Tk has
+        handled it: the idle callback runs after the redraw it queued.
+        """
+        try:
+            self.root.after_idle(lambda: self._record_cost((time.perf_counter() - start) * 1000.0))
+        except Exception:
+            pass
 
     def cancel(self, name: str):
         job = self._jobs.pop(name, None)
@@ -464,7 +2635,43 @@ class Animator:
             t = threading.Thread(target=_delayed, daemon=True)
             t.start()
 
-    def fade_in(self, win: tk.Toplevel | tk.Tk, target_alpha: float = 1.0, duration: int = 220, steps: int = 12):
+    def animate(self, name: str, duration_ms: int, frame: Callable[[float], None], frame_ms: Optional[int] = None,
+                measure: bool = True):
+        """
+        Drive `frame(t)` by wall-clock time, t from 0 to 1. Each tick samples the
+        curve at the elapsed fraction, so late ticks skip the frames in between,
+        and the final call is frame(1.0) once the deadline has passed: the
+        duration holds however busy the Tk loop is. A frame that raises ends
+        the animation. Each tick's cost (the frame itself plus how late the
+        tick ran, which includes the relayout it caused) feeds `quality`
+        unless `measure` is off.
+        """
+        self.cancel(name)
+        start = time.perf_counter()
+        duration = max(1, duration_ms) / 1000.0
+        interval = frame_ms or CFG.anim_frame_ms
+        due = [start]
+
+        def tick():
+            now = time.perf_counter()
+            t = min(1.0, (now - start) / duration)
+            try:
+                frame(t)
+            except Exception:
+                t = 1.0
+            done = time.perf_counter()
+            if measure:
+                self._record_cost((done - now + max(0.0, now - due[0])) * 1000.0)
+            if t < 1.0:
+                due[0] = done + interval / 1000.0
+                self._jobs[name] = self.root.after(interval, tick)
+            else:
+                self._jobs.pop(name, None)
+
+        tick()
+
+    def fade_in(self, win: tk.Toplevel | tk.Tk, target_alpha: float = 1.0, duration: int = 220, steps: int = 12,
+                measure: bool = True):
         try:
             win.attributes("-alpha", 0.0)
         except Exception:
@@ -472,21 +2679,16 @@ class Animator:
                 win.wm_attributes("-alpha", 0.0)
             except Exception:
                 return
-        step_ms = max(1, duration // steps)
 
-        def step(i: int = 0):
-            a = (i + 1) / steps * target_alpha
+        def frame(t: float):
+            a = t * target_alpha
             try:
                 win.attributes("-alpha", a)
             except Exception:
-                try:
-                    win.wm_attributes("-alpha", a)
-                except Exception:
-                    return
-            if i + 1 < steps:
-                self.schedule(f"fade_{id(win)}", step_ms, lambda: step(i + 1))
+                win.wm_attributes("-alpha", a)
 
-        step(0)
+        # `steps` only sets the frame interval now; the duration is fixed
+        self.animate(f"fade_{id(win)}", duration, frame, max(CFG.anim_frame_ms, duration // max(1, steps)), measure)
 
     @staticmethod
     def _ease_out_cubic(t: float) -> float:
@@ -578,50 +2780,100 @@ class Animator:
             factors[-1] = 1.0
         return factors
 
+    @staticmethod
+    def _sample_factors(factors: List[float], t: float) -> float:
+        """
+        The press curve at time t: factors[i] is the value at (i + 1) / n,
+        starting from 1.0 at t = 0, linearly interpolated in between.
+        """
+        n = len(factors)
+        x = t * n
+        i = min(n - 1, int(x))
+        prev = factors[i - 1] if i > 0 else 1.0
+        return prev + (factors[i] - prev) * min(1.0, x - i)
+
+    def press_flash(self, widget, factor: float = 1.25, dur_ms: int = 120):
+        """
+        Color-only press feedback: no size change, so no relayout. Its cost is
+        still measured, so quality can climb back from level 0.
+        """
+        name = f"flash_{id(widget)}"
+        self.cancel(name)
+        base = self._flash_origin.get(name)
+        start = time.perf_counter()
+        try:
+            if base is None:
+                base = widget.cget("fg_color")
+            if not isinstance(base, str):
+                return
+            widget.configure(fg_color=PALETTE.shade(base, factor))
+        except Exception:
+            return
+        self._flash_origin[name] = base
+        self._measure(start)
+
+        def restore():
+            self._jobs.pop(name, None)
+            self._flash_origin.pop(name, None)
+            start = time.perf_counter()
+            try:
+                widget.configure(fg_color=base)
+            except Exception:
+                return
+            self._measure(start)
+
+        self._jobs[name] = self.root.after(dur_ms, restore)
+
     def press_animation(self, widget, shrink_factor: float = 0.92, overshoot: float = 1.03,
                         dur_ms: int = 220, steps: int = 36):
         name = f"press_{id(widget)}"
+        quality = self.quality
+        if quality == 0 and name not in self._press_origin:
+            self.press_flash(widget)
+            return
         self.cancel(name)
 
-        try:
-            widget.update_idletasks()
-            orig_w = int(widget.winfo_width())
-            orig_h = int(widget.winfo_height())
-        except Exception:
-            orig_w = orig_h = 0
-
+        # a press restarted mid-animation must scale from the real size
+        origin = self._press_origin.get(name)
+        if origin is None:
+            try:
+                widget.update_idletasks()
+                origin = (int(widget.winfo_width()), int(widget.winfo_height()))
+            except Exception:
+                origin = (0, 0)
+        orig_w, orig_h = origin
         if orig_w <= 2 or orig_h <= 2:
             return
+        self._press_origin[name] = origin
 
-        total_frames = max(6, steps)
-        step_ms = max(4, dur_ms // total_frames)
-        factors = self._compute_factors(total_frames, shrink_factor, overshoot)
-        if factors and factors[-1] != 1.0:
+        key = (max(6, steps), shrink_factor, overshoot)
+        factors = self._factor_cache.get(key)
+        if factors is None:
+            factors = self._compute_factors(*key)
             factors[-1] = 1.0
-
-        def frame(i: int = 0):
-            if i >= len(factors):
-                try:
-                    widget.configure(width=orig_w, height=orig_h)
-                except Exception:
-                    pass
-                self._jobs.pop(name, None)
+            self._factor_cache[key] = factors
+        last = [origin]
+
+        def frame(t: float):
+            f = 1.0 if t >= 1.0 else self._sample_factors(factors, t)
+            size = (max(1, int(orig_w * f)), max(1, int(orig_h * f)))
+            if t >= 1.0:
+                self._press_origin.pop(name, None)
+            if size == last[0]:
                 return
-            f = factors[i]
-            new_w = max(1, int(orig_w * f))
-            new_h = max(1, int(orig_h * f))
+            last[0] = size
             try:
-                widget.configure(width=new_w, height=new_h)
+                widget.configure(width=size[0], height=size[1])
             except Exception:
+                self._press_origin.pop(name, None)
                 try:
                     widget.configure(width=orig_w, height=orig_h)
                 except Exception:
                     pass
-                self._jobs.pop(name, None)
-                return
-            self._jobs[name] = self.root.after(step_ms, lambda: frame(i + 1))
+                raise
 
-        frame(0)
+        # at reduced quality, half the frame rate halves the relayouts
+        self.animate(name, dur_ms, frame, CFG.anim_frame_ms * (1 if quality == 2 else 2))
 
     def animate_numeric_change(self, entry, start: float, end: float, steps: int = 8, step_ms: int = 25,
                                decimals: int = 5, use_comma: bool = True):
@@ -650,27 +2902,127 @@ class Animator:
                 pass
             return
 
-        def frame(i: int):
-            t = i / steps
-            val = start_f + (end_f - start_f) * t
-            txt = f"{val:.{decimals}f}"
-            if use_comma:
-                txt = txt.replace(".", ",")
-            try:
-                entry.delete(0, "end"); entry.insert(0, txt)
-            except Exception:
-                pass
-            if i < steps:
-                self.schedule(name, step_ms, lambda: frame(i + 1))
-            else:
-                final_txt = f"{end_f:.{decimals}f}"
-                if use_comma:
-                    final_txt = final_txt.replace(".", ",")
-                try:
-                    entry.delete(0, "end"); entry.insert(0, final_txt)
-                except Exception:
-                    pass
-                self._jobs.pop(name, None)
+        shown = [None]
+
+        def frame(t: float):
+            val = end_f if t >= 1.0 else start_f + (end_f - start_f) * t
+            txt = f"{val:.{decimals}f}"
+            if use_comma:
+                txt = txt.replace(".", ",")
+            if txt == shown[0]:
+                return
+            shown[0] = txt
+            try:
+                entry.delete(0, "end"); entry.insert(0, txt)
+            except Exception:
+                pass
+
+        self.animate(name, steps * step_ms, frame, step_ms)
+
+# ---------------------------
+# Window pool: build secondary windows once, hide instead of destroy
+# ---------------------------
+class WindowPool:
+    """
+    Secondary windows are built lazily on first open (or ahead of time during
+    idle), closed with `withdraw` and restored with their state intact.
+    """
+    def __init__(self, root: tk.Tk, anim: Animator):
+        self.root = root
+        self.anim = anim
+        self._specs: Dict[str, Tuple[str, int, int, Callable[[ctk.CTkToplevel], None]]] = {}
+        self._windows: Dict[str, ctk.CTkToplevel] = {}
+
+    def register(self, key: str, title: str, width: int, height: int, build: Callable[[ctk.CTkToplevel], None]):
+        self._specs[key] = (title, width, height, build)
+
+    def _alive(self, key: str) -> Optional[ctk.CTkToplevel]:
+        win = self._windows.get(key)
+        if win is None:
+            return None
+        try:
+            if win.winfo_exists():
+                return win
+        except Exception:
+            pass
+        self._windows.pop(key, None)
+        return None
+
+    def get(self, key: str) -> ctk.CTkToplevel:
+        win = self._alive(key)
+        if win is not None:
+            return win
+        title, _w, _h, build = self._specs[key]
+        win = ctk.CTkToplevel(self.root)
+        win.withdraw()
+        win.title(title)
+        win.resizable(False, False)
+        build(win)
+        win.protocol("WM_DELETE_WINDOW", lambda k=key: self.hide(k))
+        self._windows[key] = win
+        return win
+
+    def _center(self, win: ctk.CTkToplevel, win_w: int, win_h: int):
+        try:
+            rx = self.root.winfo_rootx(); ry = self.root.winfo_rooty()
+            rw = self.root.winfo_width(); rh = self.root.winfo_height()
+            x = rx + max(0, (rw - win_w) // 2); y = ry + max(0, (rh - win_h) // 2)
+            win.geometry(f"{win_w}x{win_h}+{x}+{y}")
+        except Exception:
+            sw = win.winfo_screenwidth(); sh = win.winfo_screenheight()
+            x = (sw - win_w) // 2; y = (sh - win_h) // 2
+            win.geometry(f"{win_w}x{win_h}+{x}+{y}")
+
+    def show(self, key: str) -> ctk.CTkToplevel:
+        win = self.get(key)
+        _title, win_w, win_h, _build = self._specs[key]
+        self._center(win, win_w, win_h)
+        try:
+            win.attributes("-alpha", 0.0)
+        except Exception:
+            pass
+        win.deiconify()
+        win.transient(self.root)
+        try:
+            win.lift()
+            win.grab_set()
+        except Exception:
+            pass
+        try:
+            self.anim.fade_in(win, target_alpha=1.0, duration=220, steps=12)
+        except Exception:
+            pass
+        return win
+
+    def hide(self, key: str):
+        win = self._alive(key)
+        if win is None:
+            return
+        try:
+            win.grab_release()
+        except Exception:
+            pass
+        win.withdraw()
+
+    def prebuild(self, keys: List[str]):
+        """
+        Build the given windows hidden, one per idle slot, so the Tk loop stays responsive.
+        """
+        pending = [k for k in keys if k in self._specs]
+
+        def step():
+            while pending:
+                key = pending.pop(0)
+                if self._alive(key) is None:
+                    try:
+                        self.get(key)
+                    except Exception:
+                        pass
+                    break
+            if pending:
+                self.root.after_idle(step)
+
+        self.root.after_idle(step)
 
 # ---------------------------
 # Improved Examples Generator (unique, pleasant, answer-type constraint)
@@ -896,22 +3248,1173 @@ def generate_problems_improved(op_type: str, operand_digits: int, operands_count
 
     return results
 
+# ---------------------------
+# Figure registry: parameters and formulas as safe expressions
+# ---------------------------
+@dataclass(frozen=True)
+class FigureSpec:
+    name: str
+    params: Tuple[Tuple[str, str], ...]  # (label, variable)
+    area: Optional[str] = None
+    perimeter: Optional[str] = None
+    volume: Optional[str] = None
+
+    @property
+    def labels(self) -> List[str]:
+        return [label for label, _var in self.params]
+
+    @property
+    def variables(self) -> Tuple[str, ...]:
+        return tuple(var for _label, var in self.params)
+
+FIGURE_QUANTITIES: Tuple[Tuple[str, str], ...] = (
+    ("area", "📐 Площадь"),
+    ("perimeter", "📏 Периметр/Стороны"),
+    ("volume", "📦 Объём"),
+)
+
+FIGURES: Dict[str, FigureSpec] = {spec.name: spec for spec in (
+    FigureSpec("Прямоугольник", (("Длина", "a"), ("Ширина", "b")), area="a*b", perimeter="2*(a+b)"),
+    FigureSpec("Круг", (("Радиус", "r"),), area="pi*r*r", perimeter="2*pi*r"),
+    FigureSpec("Треуг. (осн.,выс.)", (("Основание", "a"), ("Высота", "h")), area="0.5*a*h"),
+    FigureSpec("Треуг. (3 стороны)", (("a", "a"), ("b", "b"), ("c", "c")), perimeter="a+b+c"),
+    FigureSpec("Куб", (("a", "a"),), area="6*a*a", volume="a**3"),
+    FigureSpec("Параллелепипед", (("Длина", "a"), ("Ширина", "b"), ("Высота", "c")),
+               area="2*(a*b+b*c+a*c)", volume="a*b*c"),
+    FigureSpec("Шар", (("R", "r"),), area="4*pi*r*r", volume="4.0/3.0*pi*r**3"),
+    FigureSpec("Цилиндр", (("R", "r"), ("H", "h")), area="2*pi*r*(r+h)", volume="pi*r*r*h"),
+    FigureSpec("Конус", (("R", "r"), ("H", "h")), area="pi*r*(r+sqrt(r*r+h*h))", volume="1.0/3.0*pi*r*r*h"),
+    FigureSpec("Пирамида", (("Sосн", "S"), ("H", "h")), volume="1.0/3.0*S*h"),
+)}
+
+@functools.lru_cache(maxsize=None)
+def figure_formulas(spec: FigureSpec) -> Dict[str, SafeExpression]:
+    """
+    Formulas of a figure compiled once through the safe-evaluation pipeline.
+    """
+    out: Dict[str, SafeExpression] = {}
+    for kind, _label in FIGURE_QUANTITIES:
+        src = getattr(spec, kind)
+        if src:
+            out[kind] = compile_safe(src, spec.variables)
+    return out
+
+def evaluate_figure(spec: FigureSpec, values: Dict[str, object], vectorized: bool = False) -> Dict[str, object]:
+    """
+    Area/perimeter/volume for scalar values, or for NumPy arrays when `vectorized`.
+    """
+    out: Dict[str, object] = {}
+    for kind, expr in figure_formulas(spec).items():
+        out[kind] = expr.vectorized(**values) if vectorized else expr(**values)
+    return out
+
+# ---------------------------
+# Batch geometry over tables of dimensions
+# ---------------------------
+@dataclass
+class ColumnSummary:
+    count: int = 0
+    total: float = 0.0
+    minimum: float = math.inf
+    maximum: float = -math.inf
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else math.nan
+
+    def add_array(self, arr):
+        finite = arr[_np.isfinite(arr)]
+        if finite.size:
+            self.count += int(finite.size)
+            self.total += float(finite.sum())
+            self.minimum = min(self.minimum, float(finite.min()))
+            self.maximum = max(self.maximum, float(finite.max()))
+
+    def add(self, v: float):
+        if math.isfinite(v):
+            self.count += 1
+            self.total += v
+            self.minimum = min(self.minimum, v)
+            self.maximum = max(self.maximum, v)
+
+@dataclass
+class BatchResult:
+    rows: int
+    skipped: int
+    columns: Dict[str, ColumnSummary]
+
+_BATCH_HEADERS: Dict[str, str] = {"area": "Площадь", "perimeter": "Периметр", "volume": "Объём"}
+
+def _detect_row_format(line: str, ncols: int) -> Tuple[Optional[str], bool]:
+    """
+    (delimiter, decimal_comma) for a data row: ';' and tab tables may use
+    decimal commas; ',' is a delimiter only when it splits exactly ncols fields.
+    """
+    if ";" in line:
+        return ";", True
+    if "\t" in line:
+        return "\t", True
+    if ncols > 1 and line.count(",") == ncols - 1:
+        return ",", False
+    return None, True
+
+def _split_row(line: str, delimiter: Optional[str], decimal_comma: bool) -> List[str]:
+    if decimal_comma:
+        line = line.replace(",", ".")
+    return line.split(delimiter) if delimiter else line.split()
+
+def _parse_chunk_numpy(lines: List[str], delimiter: Optional[str], decimal_comma: bool, ncols: int):
+    if decimal_comma:
+        lines = [ln.replace(",", ".") for ln in lines]
+    try:
+        arr = _np.loadtxt(lines, delimiter=delimiter, ndmin=2, usecols=range(ncols), dtype=float)
+        return arr, 0
+    except Exception:
+        pass
+    rows: List[List[float]] = []
+    skipped = 0
+    for ln in lines:
+        parts = ln.split(delimiter) if delimiter else ln.split()
+        try:
+            rows.append([float(x) for x in parts[:ncols]])
+            if len(rows[-1]) != ncols:
+                rows.pop(); skipped += 1
+        except ValueError:
+            skipped += 1
+    arr = _np.array(rows, dtype=float).reshape(-1, ncols)
+    return arr, skipped
+
+def batch_figure_table(spec: FigureSpec, source: Iterable[str], out: Optional[TextIO] = None,
+                       chunk_rows: Optional[int] = None, progress: Optional[Callable[[int], None]] = None,
+                       cancel: Optional[threading.Event] = None) -> BatchResult:
+    """
+    Compute the figure's formulas for every row of `source` (lines of numbers,
+    one column per parameter). Rows are processed in chunks, vectorized with
+    NumPy when available, and written to `out` as they are produced, so
+    memory stays bounded regardless of the table size.
+    """
+    chunk_rows = max(1000, int(chunk_rows or CFG.batch_chunk_rows))
+    variables = spec.variables
+    ncols = len(variables)
+    kinds = list(figure_formulas(spec).keys())
+    summaries = {k: ColumnSummary() for k in kinds}
+    total_rows = skipped = 0
+    fmt: Optional[Tuple[Optional[str], bool]] = None
+    out_delim = ";"
+
+    lines_iter = (ln for ln in source if ln.strip())
+    if out is not None:
+        out.write(out_delim.join(spec.labels + [_BATCH_HEADERS[k] for k in kinds]) + "\n")
+
+    while True:
+        if cancel is not None and cancel.is_set():
+            break
+        lines = list(itertools.islice(lines_iter, chunk_rows))
+        if not lines:
+            break
+        if fmt is None:
+            probe = next((ln for ln in lines if any(ch.isdigit() for ch in ln)), lines[0])
+            fmt = _detect_row_format(probe, ncols)
+        delimiter, decimal_comma = fmt
+
+        if HAVE_NUMPY:
+            arr, bad = _parse_chunk_numpy(lines, delimiter, decimal_comma, ncols)
+            skipped += bad
+            if arr.shape[0] == 0:
+                continue
+            with _np.errstate(all="ignore"):
+                results = evaluate_figure(spec, {v: arr[:, i] for i, v in enumerate(variables)}, vectorized=True)
+            cols = [arr[:, i] for i in range(ncols)]
+            for k in kinds:
+                col = _np.broadcast_to(_np.asarray(results[k], dtype=float), (arr.shape[0],))
+                summaries[k].add_array(col)
+                cols.append(col)
+            if out is not None:
+                buf = io.StringIO()
+                _np.savetxt(buf, _np.column_stack(cols), fmt="%.10g", delimiter=out_delim)
+                text = buf.getvalue()
+                out.write(text.replace(".", ",") if decimal_comma else text)
+            total_rows += arr.shape[0]
+        else:
+            out_lines: List[str] = []
+            for ln in lines:
+                try:
+                    vals = [float(parse_number(x)) for x in (ln.split(delimiter) if delimiter else ln.split())[:ncols]]
+                    if len(vals) != ncols:
+                        raise ValueError("columns")
+                    res = evaluate_figure(spec, dict(zip(variables, vals)))
+                except (ValueError, TypeError, ArithmeticError):
+                    skipped += 1
+                    continue
+                for k in kinds:
+                    summaries[k].add(float(res[k]))
+                if out is not None:
+                    row = out_delim.join(f"{x:.10g}" for x in vals + [float(res[k]) for k in kinds])
+                    out_lines.append(row.replace(".", ",") if decimal_comma else row)
+                total_rows += 1
+            if out is not None and out_lines:
+                out.write("\n".join(out_lines) + "\n")
+        if progress is not None:
+            progress(total_rows)
+    return BatchResult(rows=total_rows, skipped=skipped, columns=summaries)
+
+# ---------------------------
+# Polygons from vertex lists
+# ---------------------------
+def read_vertices(source: Iterable[str], chunk_rows: Optional[int] = None):
+    """
+    Stream "x y" (or "x;y", "x,y") rows into coordinate arrays chunk by chunk.
+    Returns NumPy arrays when available, lists otherwise.
+    """
+    chunk_rows = max(1000, int(chunk_rows or CFG.batch_chunk_rows))
+    lines_iter = (ln for ln in source if ln.strip())
+    fmt: Optional[Tuple[Optional[str], bool]] = None
+    xs_parts: list = []
+    ys_parts: list = []
+    while True:
+        lines = list(itertools.islice(lines_iter, chunk_rows))
+        if not lines:
+            break
+        if fmt is None:
+            probe = next((ln for ln in lines if any(ch.isdigit() for ch in ln)), lines[0])
+            fmt = _detect_row_format(probe, 2)
+        delimiter, decimal_comma = fmt
+        if HAVE_NUMPY:
+            arr, _bad = _parse_chunk_numpy(lines, delimiter, decimal_comma, 2)
+            xs_parts.append(arr[:, 0])
+            ys_parts.append(arr[:, 1])
+        else:
+            for ln in lines:
+                parts = _split_row(ln, delimiter, decimal_comma)
+                try:
+                    x, y = float(parts[0]), float(parts[1])
+                except (ValueError, IndexError):
+                    continue
+                xs_parts.append(x)
+                ys_parts.append(y)
+    if HAVE_NUMPY:
+        if not xs_parts:
+            return _np.empty(0), _np.empty(0)
+        return _np.concatenate(xs_parts), _np.concatenate(ys_parts)
+    return xs_parts, ys_parts
+
+def polygon_metrics(xs, ys) -> Tuple[float, float, Tuple[float, float]]:
+    """
+    (area, perimeter, centroid) of a simple polygon via the shoelace formula.
+    Coordinates are shifted to their mean first to keep the cross products small.
+    """
+    n = len(xs)
+    if n >= 2 and xs[0] == xs[-1] and ys[0] == ys[-1]:
+        xs, ys, n = xs[:-1], ys[:-1], n - 1
+    if n < 3:
+        raise ValueError("Нужно минимум 3 вершины")
+    if HAVE_NUMPY:
+        x = _np.asarray(xs, dtype=float)
+        y = _np.asarray(ys, dtype=float)
+        mx, my = float(x.mean()), float(y.mean())
+        x = x - mx
+        y = y - my
+        x1 = _np.roll(x, -1)
+        y1 = _np.roll(y, -1)
+        cross = x * y1 - x1 * y
+        a2 = float(cross.sum())
+        perimeter = float(_np.hypot(x1 - x, y1 - y).sum())
+        if a2 == 0.0:
+            return 0.0, perimeter, (mx, my)
+        cx = float(((x + x1) * cross).sum()) / (3.0 * a2)
+        cy = float(((y + y1) * cross).sum()) / (3.0 * a2)
+        return abs(a2) / 2.0, perimeter, (cx + mx, cy + my)
+    mx = math.fsum(xs) / n
+    my = math.fsum(ys) / n
+    x = [v - mx for v in xs]
+    y = [v - my for v in ys]
+    cross = [x[i] * y[(i + 1) % n] - x[(i + 1) % n] * y[i] for i in range(n)]
+    a2 = math.fsum(cross)
+    perimeter = math.fsum(math.hypot(x[(i + 1) % n] - x[i], y[(i + 1) % n] - y[i]) for i in range(n))
+    if a2 == 0.0:
+        return 0.0, perimeter, (mx, my)
+    cx = math.fsum((x[i] + x[(i + 1) % n]) * cross[i] for i in range(n)) / (3.0 * a2)
+    cy = math.fsum((y[i] + y[(i + 1) % n]) * cross[i] for i in range(n)) / (3.0 * a2)
+    return abs(a2) / 2.0, perimeter, (cx + mx, cy + my)
+
+# ---------------------------
+# Mesh volume / surface area from STL
+# ---------------------------
+_STL_RECORD = struct.Struct("<12fH")  # normal, 3 vertices, attribute byte count: 50 bytes
+
+def _stl_binary_count(path: str) -> Optional[int]:
+    size = os.path.getsize(path)
+    with open(path, "rb") as fh:
+        header = fh.read(84)
+    if len(header) < 84:
+        return None
+    n = struct.unpack("<I", header[80:84])[0]
+    return n if 84 + 50 * n == size else None
+
+class _MeshAccumulator:
+    """
+    Sums signed tetrahedron volumes and triangle areas. Vertices are taken
+    relative to the first vertex seen, which keeps the cross products small
+    for meshes far from the origin (the volume of a closed mesh is translation invariant).
+    """
+    def __init__(self):
+        self.volume6 = 0.0
+        self.area2 = 0.0
+        self.triangles = 0
+        self.origin = None
+
+    def add_numpy(self, v):
+        if v.shape[0] == 0:
+            return
+        v = v.astype(_np.float64)
+        if self.origin is None:
+            self.origin = v[0, 0].copy()
+        v -= self.origin
+        a, b, c = v[:, 0], v[:, 1], v[:, 2]
+        self.volume6 += float(_np.einsum("ij,ij->", a, _np.cross(b, c)))
+        self.area2 += float(_np.linalg.norm(_np.cross(b - a, c - a), axis=1).sum())
+        self.triangles += v.shape[0]
+
+    def add_triangle(self, p1, p2, p3):
+        if self.origin is None:
+            self.origin = p1
+        o = self.origin
+        ax, ay, az = p1[0] - o[0], p1[1] - o[1], p1[2] - o[2]
+        bx, by, bz = p2[0] - o[0], p2[1] - o[1], p2[2] - o[2]
+        cx, cy, cz = p3[0] - o[0], p3[1] - o[1], p3[2] - o[2]
+        self.volume6 += ax * (by * cz - bz * cy) - ay * (bx * cz - bz * cx) + az * (bx * cy - by * cx)
+        ux, uy, uz = bx - ax, by - ay, bz - az
+        wx, wy, wz = cx - ax, cy - ay, cz - az
+        self.area2 += math.sqrt((uy * wz - uz * wy) ** 2 + (uz * wx - ux * wz) ** 2 + (ux * wy - uy * wx) ** 2)
+        self.triangles += 1
+
+def stl_mesh_metrics(path: str, chunk_triangles: Optional[int] = None) -> Tuple[float, float, int]:
+    """
+    (volume, surface area, triangle count) of an STL mesh. Binary files are
+    memory-mapped and processed in vectorized chunks; ASCII files are streamed.
+    """
+    chunk = max(1000, int(chunk_triangles or CFG.stl_chunk_triangles))
+    acc = _MeshAccumulator()
+    count = _stl_binary_count(path)
+    if count is not None:
+        if count == 0:
+            raise ValueError("Пустой STL-файл")
+        if HAVE_NUMPY:
+            dtype = _np.dtype([("normal", "<f4", (3,)), ("v", "<f4", (3, 3)), ("attr", "<u2")])
+            mm = _np.memmap(path, dtype=dtype, mode="r", offset=84, shape=(count,))
+            for i in range(0, count, chunk):
+                acc.add_numpy(_np.array(mm["v"][i:i + chunk]))
+            del mm
+        else:
+            with open(path, "rb") as fh:
+                fh.seek(84)
+                while True:
+                    data = fh.read(_STL_RECORD.size * chunk)
+                    if not data:
+                        break
+                    for rec in _STL_RECORD.iter_unpack(data[:len(data) - len(data) % _STL_RECORD.size]):
+                        acc.add_triangle(rec[3:6], rec[6:9], rec[9:12])
+    else:
+        with open(path, "r", encoding="ascii", errors="replace") as fh:
+            if not fh.read(5).lower().startswith("solid"):
+                raise ValueError("Файл не похож на STL")
+            verts: List[Tuple[float, float, float]] = []
+            for line in fh:
+                parts = line.split()
+                if not parts or parts[0] != "vertex":
+                    continue
+                try:
+                    verts.append((float(parts[1]), float(parts[2]), float(parts[3])))
+                except (ValueError, IndexError):
+                    raise ValueError("Повреждённая строка vertex в STL")
+                if len(verts) >= chunk * 3:
+                    _flush_ascii_vertices(acc, verts)
+            _flush_ascii_vertices(acc, verts)
+    if acc.triangles == 0:
+        raise ValueError("В STL нет треугольников")
+    return abs(acc.volume6) / 6.0, acc.area2 / 2.0, acc.triangles
+
+def _flush_ascii_vertices(acc: _MeshAccumulator, verts: List[Tuple[float, float, float]]):
+    usable = len(verts) - len(verts) % 3
+    if HAVE_NUMPY:
+        acc.add_numpy(_np.array(verts[:usable], dtype=_np.float64).reshape(-1, 3, 3))
+    else:
+        for i in range(0, usable, 3):
+            acc.add_triangle(verts[i], verts[i + 1], verts[i + 2])
+    del verts[:usable]
+
+# ---------------------------
+# Function plotting
+# ---------------------------
+def evaluate_on_grid(fn: SafeExpression, xs):
+    """
+    f(xs) as a float array with NaN wherever the function is undefined. Uses the
+    vectorized namespace and falls back to per-point evaluation if it raises.
+    """
+    np = _np
+    with np.errstate(all="ignore"):
+        try:
+            ys = np.asarray(fn.vectorized(x=xs))
+            if np.iscomplexobj(ys):
+                ys = np.where(np.abs(ys.imag) < 1e-12, ys.real, np.nan)
+            ys = np.broadcast_to(ys.astype(np.float64, copy=False), xs.shape).copy()
+        except Exception:
+            ys = np.empty(xs.shape, dtype=np.float64)
+            for i, x in enumerate(xs.tolist()):
+                try:
+                    v = fn(x=x)
+                    ys[i] = float(v) if not isinstance(v, complex) else math.nan
+                except Exception:
+                    ys[i] = math.nan
+    ys[~np.isfinite(ys)] = np.nan
+    return ys
+
+class PlotSampler:
+    """
+    Samples f(x) on a power-of-two grid. Each zoom level keeps its samples, and
+    because grid points coincide between levels (x = i * 2**k), zooming reuses
+    every other point and panning only evaluates the newly exposed indices.
+    `evaluate(xs) -> ys` replaces evaluate_on_grid(fn, xs), e.g. to sample in a worker.
+    """
+    def __init__(self, fn: Optional[SafeExpression], max_levels: int = 6, max_level_points: int = 200_000,
+                 evaluate: Optional[Callable] = None):
+        if not HAVE_NUMPY:
+            raise ValueError("Для графиков нужен numpy")
+        self.fn = fn
+        self.evaluate = evaluate if evaluate is not None else functools.partial(evaluate_on_grid, fn)
+        self.max_levels = max_levels
+        self.max_level_points = max_level_points
+        self._levels: "OrderedDict[int, Tuple[int, object]]" = OrderedDict()
+        self.evaluated = 0
+
+    def _lookup(self, k: int, idx):
+        np = _np
+        ys = np.full(idx.shape, np.nan)
+        known = np.zeros(idx.shape, dtype=bool)
+        for k2, (j0, arr) in self._levels.items():
+            if k2 <= k:
+                j = idx << (k - k2)
+                ok = ~known
+            else:
+                shift = k2 - k
+                ok = ~known & ((idx & ((1 << shift) - 1)) == 0)
+                j = idx >> shift
+            ok &= (j >= j0) & (j < j0 + arr.shape[0])
+            if ok.any():
+                ys[ok] = arr[j[ok] - j0]
+                known |= ok
+        return ys, known
+
+    def grid(self, x0: float, x1: float, width_px: int, oversample: int = 2):
+        """
+        Uniform samples covering [x0, x1] with about `oversample` points per pixel.
+        """
+        np = _np
+        k = math.floor(math.log2((x1 - x0) / max(1, width_px * oversample)))
+        h = 2.0 ** k
+        i0, i1 = math.floor(x0 / h) - 1, math.ceil(x1 / h) + 1
+        idx = np.arange(i0, i1 + 1, dtype=np.int64)
+        ys, known = self._lookup(k, idx)
+        missing = ~known
+        if missing.any():
+            ys[missing] = self.evaluate(idx[missing] * h)
+            self.evaluated += int(missing.sum())
+        self._store(k, i0, ys)
+        return idx * h, ys
+
+    def _store(self, k: int, i0: int, ys):
+        np = _np
+        prev = self._levels.pop(k, None)
+        if prev is not None:
+            j0, arr = prev
+            lo, hi = min(i0, j0), max(i0 + ys.shape[0], j0 + arr.shape[0])
+            if hi - lo <= self.max_level_points and j0 <= i0 + ys.shape[0] and i0 <= j0 + arr.shape[0]:
+                merged = np.full(hi - lo, np.nan)
+                merged[j0 - lo:j0 - lo + arr.shape[0]] = arr
+                merged[i0 - lo:i0 - lo + ys.shape[0]] = ys
+                i0, ys = lo, merged
+        self._levels[k] = (i0, ys)
+        while len(self._levels) > self.max_levels:
+            self._levels.popitem(last=False)
+
+    def refine(self, xs, ys, y_scale: float, height_px: int, depth: int = 4, budget: int = 4096):
+        """
+        Insert midpoints where the curve bends by more than a pixel, jumps by a
+        large fraction of the screen, or enters/leaves its domain.
+        """
+        np = _np
+        for _ in range(depth):
+            if xs.shape[0] < 3 or budget <= 0:
+                break
+            finite = np.isfinite(ys)
+            py = np.where(finite, ys, 0.0) * y_scale
+            dx = np.diff(xs)
+            t = dx[:-1] / (dx[:-1] + dx[1:])
+            bend = np.abs(py[1:-1] - (py[:-2] + (py[2:] - py[:-2]) * t)) > 1.0
+            bend &= finite[:-2] & finite[1:-1] & finite[2:]
+            flag = np.zeros(xs.shape[0] - 1, dtype=bool)
+            flag[:-1] |= bend
+            flag[1:] |= bend
+            flag |= finite[:-1] != finite[1:]
+            flag |= (np.abs(np.diff(py)) > height_px / 4) & finite[:-1] & finite[1:]
+            flag &= dx > (xs[-1] - xs[0]) * 1e-9
+            at = np.flatnonzero(flag)[:budget]
+            if at.shape[0] == 0:
+                break
+            mid = (xs[at] + xs[at + 1]) / 2
+            xs = np.insert(xs, at + 1, mid)
+            ys = np.insert(ys, at + 1, self.evaluate(mid))
+            self.evaluated += at.shape[0]
+            budget -= at.shape[0]
+        return xs, ys
+
+def plot_polylines(xs, ys, x0: float, x1: float, y0: float, y1: float, width: int, height: int) -> List[List[float]]:
+    """
+    Canvas polylines for the samples: split at gaps and vertical asymptotes,
+    and decimated to first/min/max/last per pixel column.
+    """
+    np = _np
+    sx = width / (x1 - x0)
+    sy = height / (y1 - y0)
+    px = (xs - x0) * sx
+    py = (y1 - ys) * sy
+    finite = np.isfinite(py)
+    breaks = ~finite[:-1] | ~finite[1:]
+    with np.errstate(invalid="ignore"):
+        breaks |= ((py[:-1] < 0) & (py[1:] > height)) | ((py[:-1] > height) & (py[1:] < 0))
+    py = np.clip(np.where(finite, py, 0.0), -2.0 * height, 3.0 * height)
+    cuts = np.flatnonzero(breaks) + 1
+    lines: List[List[float]] = []
+    for a, b in zip(np.concatenate(([0], cuts)), np.concatenate((cuts, [xs.shape[0]]))):
+        if b - a < 2 or not finite[a]:
+            continue
+        sx_seg, sy_seg = px[a:b], py[a:b]
+        if b - a > 4 * width:
+            col = np.floor(sx_seg).astype(np.int64)
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(col)) + 1))
+            ends = np.concatenate((starts[1:], [sx_seg.shape[0]])) - 1
+            cx = sx_seg[starts]
+            pts = np.empty((starts.shape[0], 4, 2))
+            pts[:, :, 0] = cx[:, None]
+            pts[:, 3, 0] = sx_seg[ends]
+            pts[:, 0, 1] = sy_seg[starts]
+            pts[:, 1, 1] = np.minimum.reduceat(sy_seg, starts)
+            pts[:, 2, 1] = np.maximum.reduceat(sy_seg, starts)
+            pts[:, 3, 1] = sy_seg[ends]
+            flat = pts.reshape(-1)
+        else:
+            flat = np.column_stack((sx_seg, sy_seg)).reshape(-1)
+        lines.append(flat.tolist())
+    return lines
+
+def nice_ticks(lo: float, hi: float, target: int = 6) -> List[float]:
+    raw = (hi - lo) / max(1, target)
+    mag = 10.0 ** math.floor(math.log10(raw))
+    step = next(m * mag for m in (1, 2, 5, 10) if m * mag >= raw)
+    first = math.ceil(lo / step)
+    return [i * step for i in range(first, int(math.floor(hi / step)) + 1)]
+
+# ---------------------------
+# Equation solving
+# ---------------------------
+def compile_equation(text: str, session: Optional[Session] = None, bind: bool = True) -> SafeExpression:
+    """
+    "f(x) = g(x)" (or just "f(x)", meaning f(x) = 0) compiled as f(x) - (g(x)),
+    with the names of `session` available (see Session.compile for `bind`).
+    """
+    parts = (text or "").split("=")
+    if len(parts) > 2:
+        raise ValueError("В уравнении должен быть один знак '='")
+    normalize = session.normalize if session is not None else _normalize_expr
+    left = normalize(parts[0])
+    right = normalize(parts[1]) if len(parts) == 2 else "0"
+    if session is not None:
+        return session.compile(f"({left})-({right})", ("x",), bind)
+    return compile_safe(f"({left})-({right})", ("x",))
+
+def _refine_brackets(fn: SafeExpression, lo, hi, flo, fhi, tol: float, max_iter: int):
+    """
+    Narrow all sign-change brackets at once, alternating bisection (guaranteed
+    halving) with false position (fast near simple roots). Brackets whose
+    midpoint leaves the domain are marked dead.
+    """
+    np = _np
+    dead = np.zeros(lo.shape, dtype=bool)
+    for it in range(max_iter):
+        idx = np.flatnonzero(~dead & ((hi - lo) > tol))
+        if idx.size == 0:
+            break
+        a, b, fa, fb = lo[idx], hi[idx], flo[idx], fhi[idx]
+        m = (a + b) / 2
+        if it % 2:
+            with np.errstate(all="ignore"):
+                fp = a - fa * (b - a) / (fb - fa)
+            m = np.where(np.isfinite(fp) & (fp > a) & (fp < b), fp, m)
+        fm = evaluate_on_grid(fn, m)
+        nan = np.isnan(fm)
+        dead[idx[nan]] = True
+        zero = fm == 0
+        left = ~nan & ~zero & (np.sign(fm) == np.sign(fa))
+        right = ~nan & ~zero & ~left
+        lo[idx[left]], flo[idx[left]] = m[left], fm[left]
+        hi[idx[right]], fhi[idx[right]] = m[right], fm[right]
+        lo[idx[zero]] = hi[idx[zero]] = m[zero]
+        flo[idx[zero]] = fhi[idx[zero]] = 0.0
+    return dead
+
+def find_roots(fn: SafeExpression, a: float, b: float, samples: Optional[int] = None,
+               max_iter: int = 200) -> List[float]:
+    """
+    Roots of fn(x) = 0 on [a, b] at the scan resolution. The range is scanned
+    vectorized for sign changes and all brackets are refined together;
+    brackets that close on a pole (|f| grows instead of vanishing) are dropped.
+    Touching roots without a sign change come from a vectorized golden-section
+    search on local minima of |f|.
+    """
+    if not HAVE_NUMPY:
+        raise ValueError("Для решения уравнений нужен numpy")
+    if not (math.isfinite(a) and math.isfinite(b)) or b <= a:
+        raise ValueError("Диапазон задан неверно")
+    np = _np
+    n = max(16, int(samples or CFG.root_scan_points))
+    xs = np.linspace(a, b, n)
+    ys = evaluate_on_grid(fn, xs)
+    finite = np.isfinite(ys)
+    sign = np.sign(np.where(finite, ys, 0.0))
+    tol = 4 * np.finfo(float).eps * max(abs(a), abs(b), 1.0)
+    found = [xs[ys == 0]]
+
+    cross = np.flatnonzero(finite[:-1] & finite[1:] & (sign[:-1] * sign[1:] < 0))
+    if cross.size:
+        lo, hi = xs[cross].copy(), xs[cross + 1].copy()
+        flo, fhi = ys[cross].copy(), ys[cross + 1].copy()
+        edge = np.maximum(np.abs(flo), np.abs(fhi))
+        dead = _refine_brackets(fn, lo, hi, flo, fhi, tol, max_iter)
+        r = np.where(np.abs(flo) <= np.abs(fhi), lo, hi)
+        fr = np.abs(evaluate_on_grid(fn, r))
+        found.append(r[~dead & (fr < edge)])
+
+    ay = np.where(finite, np.abs(ys), np.inf)
+    inner = slice(1, -1)
+    touch = (ay[inner] < ay[:-2]) & (ay[inner] <= ay[2:]) & (sign[inner] != 0)
+    touch &= (sign[:-2] == sign[inner]) & (sign[2:] == sign[inner])
+    mins = np.flatnonzero(touch) + 1
+    if mins.size:
+        lo, hi = xs[mins - 1].copy(), xs[mins + 1].copy()
+        g = (math.sqrt(5) - 1) / 2
+        for _ in range(max_iter):
+            if ((hi - lo) <= tol).all():
+                break
+            c, d = hi - g * (hi - lo), lo + g * (hi - lo)
+            keep_left = ~(np.abs(evaluate_on_grid(fn, c)) > np.abs(evaluate_on_grid(fn, d)))
+            hi, lo = np.where(keep_left, d, hi), np.where(keep_left, lo, c)
+        m = (lo + hi) / 2
+        fm = np.abs(evaluate_on_grid(fn, m))
+        scale = float(np.median(ay[np.isfinite(ay)])) if np.isfinite(ay).any() else 1.0
+        found.append(m[fm <= 1e-12 * max(1.0, scale)])
+
+    out = np.sort(np.concatenate(found))
+    if out.size > 1:
+        out = out[np.concatenate(([True], np.diff(out) > tol))]
+    return [float(v) for v in out]
+
+
+# ---------------------------
+# Value tables
+# ---------------------------
+def value_table_rows(start: float, stop: float, step: float) -> int:
+    if step == 0 or not all(math.isfinite(v) for v in (start, stop, step)):
+        raise ValueError("Шаг должен быть ненулевым числом")
+    if (stop - start) * step < 0:
+        raise ValueError("Шаг направлен не в сторону конца диапазона")
+    rows = int(math.floor((stop - start) / step * (1 + 1e-12) + 1e-9)) + 1
+    if rows > CFG.table_max_rows:
+        raise ValueError(f"Слишком много строк (макс. {CFG.table_max_rows})")
+    return rows
+
+def value_table_chunk(fn: SafeExpression, start: float, step: float, i0: int, i1: int,
+                      evaluate: Optional[Callable] = None):
+    """
+    x and f(x) for rows [i0, i1). x is computed as start + i*step rather than
+    accumulated, so rows far down the table carry no drift. `evaluate(xs) -> ys`
+    replaces evaluate_on_grid(fn, xs), e.g. to sample in a worker.
+    """
+    if HAVE_NUMPY:
+        xs = start + _np.arange(i0, i1, dtype=_np.float64) * step
+        return xs, (evaluate or functools.partial(evaluate_on_grid, fn))(xs)
+    xs = [start + i * step for i in range(i0, i1)]
+    ys: List[float] = []
+    for x in xs:
+        try:
+            v = float(fn(x=x))
+        except Exception:
+            v = math.nan
+        ys.append(v if math.isfinite(v) else math.nan)
+    return xs, ys
+
+def format_table_value(v: float) -> str:
+    return "" if v != v else f"{v:.10g}".replace(".", ",")
+
+def export_value_table(fn: SafeExpression, start: float, step: float, rows: int, out: TextIO,
+                       chunk_rows: Optional[int] = None, progress: Optional[Callable[[int], None]] = None,
+                       cancel: Optional[threading.Event] = None, evaluate: Optional[Callable] = None) -> int:
+    """
+    Write the table as "x;f(x)" CSV with decimal commas, one chunk at a time.
+    Undefined values are left empty. Returns the number of rows written.
+    """
+    chunk_rows = max(1000, int(chunk_rows or CFG.batch_chunk_rows))
+    out.write(f"x;{fn.source}\n")
+    done = 0
+    while done < rows:
+        if cancel is not None and cancel.is_set():
+            break
+        end = min(rows, done + chunk_rows)
+        xs, ys = value_table_chunk(fn, start, step, done, end, evaluate)
+        if HAVE_NUMPY:
+            xs, ys = xs.tolist(), ys.tolist()
+        # one %-format per row is ~2.5x faster than numpy.savetxt
+        text = "\n".join(map("%.10g;%.10g".__mod__, zip(xs, ys))) + "\n"
+        out.write(text.replace("nan", "").replace(".", ","))
+        done = end
+        if progress is not None:
+            progress(done)
+    return done
+
+# ---------------------------
+# Streaming statistics
+# ---------------------------
+@dataclass
+class StreamStats:
+    """
+    Single-pass statistics with bounded memory: count/mean/M2 merged per chunk
+    (Welford / Chan et al.), min/max, and a uniform reservoir sample for the
+    median and quantiles (exact while count <= reservoir size).
+    """
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    minimum: float = math.inf
+    maximum: float = -math.inf
+    skipped: int = 0
+    reservoir_size: int = 0
+    sample: object = None
+    _rng: object = None
+
+    def __post_init__(self):
+        self.reservoir_size = self.reservoir_size or CFG.stats_reservoir
+        if HAVE_NUMPY:
+            self.sample = _np.empty(0, dtype=_np.float64)
+            self._rng = _np.random.default_rng()
+        else:
+            self.sample = []
+            self._rng = random.Random()
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def stddev(self) -> float:
+        return math.sqrt(self.variance) if self.count > 1 else math.nan
+
+    @property
+    def exact_quantiles(self) -> bool:
+        return self.count <= self.reservoir_size
+
+    def add_array(self, arr):
+        np = _np
+        arr = arr[np.isfinite(arr)]
+        n = int(arr.size)
+        if not n:
+            return
+        mean_b = float(arr.mean())
+        m2_b = float(np.square(arr - mean_b).sum())
+        total = self.count + n
+        delta = mean_b - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2_b + delta * delta * self.count * n / total
+        self.minimum = min(self.minimum, float(arr.min()))
+        self.maximum = max(self.maximum, float(arr.max()))
+        # Algorithm R, vectorized: item i (global index t) replaces slot j ~ U[0, t] if j < k
+        k = self.reservoir_size
+        free = max(0, k - self.sample.size)
+        if free:
+            self.sample = np.concatenate((self.sample, arr[:free]))
+        if n > free:
+            seen = np.arange(self.count + free, total, dtype=np.int64) + 1
+            slots = self._rng.integers(0, seen)
+            take = slots < k
+            self.sample[slots[take]] = arr[free:][take]
+        self.count = total
+
+    def add(self, v: float):
+        if not math.isfinite(v):
+            return
+        self.count += 1
+        delta = v - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (v - self.mean)
+        self.minimum = min(self.minimum, v)
+        self.maximum = max(self.maximum, v)
+        if len(self.sample) < self.reservoir_size:
+            self.sample.append(v)
+        else:
+            j = self._rng.randrange(self.count)
+            if j < self.reservoir_size:
+                self.sample[j] = v
+
+    def quantiles(self, qs: List[float]) -> List[float]:
+        if not self.count:
+            return [math.nan for _ in qs]
+        if HAVE_NUMPY:
+            return [float(v) for v in _np.quantile(self.sample, qs)]
+        data = sorted(self.sample)
+        out = []
+        for q in qs:
+            pos = q * (len(data) - 1)
+            lo = int(math.floor(pos))
+            hi = min(lo + 1, len(data) - 1)
+            out.append(data[lo] + (data[hi] - data[lo]) * (pos - lo))
+        return out
+
+def _detect_column_format(line: str, column: int) -> Tuple[Optional[str], bool]:
+    """
+    Like _detect_row_format, for files whose column count is unknown: a lone
+    comma in a single-field line is a decimal comma ("3,5").
+    """
+    if ";" in line or "\t" in line or len(line.split()) > 1:
+        return _detect_row_format(line, 0)
+    commas = line.count(",")
+    return _detect_row_format(line, commas + 1 if commas > 1 or column > 0 else 1)
+
+def _stats_text_chunk(stats: StreamStats, lines: List[str], fmt: Tuple[Optional[str], bool], column: int):
+    delimiter, decimal_comma = fmt
+    if HAVE_NUMPY:
+        if delimiter is None and column == 0:
+            text = "".join(lines)
+            tokens = (text.replace(",", ".") if decimal_comma else text).split()
+            if len(tokens) == len(lines):
+                try:
+                    stats.add_array(_np.array(tokens, dtype=_np.float64))
+                    return
+                except ValueError:
+                    pass
+        arr, bad = _parse_chunk_numpy(lines, delimiter, decimal_comma, column + 1)
+        stats.skipped += bad
+        stats.add_array(arr[:, column])
+        return
+    for ln in lines:
+        parts = ln.split(delimiter) if delimiter else ln.split()
+        try:
+            stats.add(float(parse_number(parts[column])))
+        except (ValueError, IndexError):
+            stats.skipped += 1
+
+def stream_stats(source: Iterable[str], column: int = 0, progress: Optional[Callable[[int], None]] = None,
+                 cancel: Optional[threading.Event] = None, chunk_rows: Optional[int] = None) -> StreamStats:
+    """
+    Statistics of one column (0-based) of a text table, read in chunks with the
+    same delimiter/decimal-comma detection as the batch tables.
+    """
+    chunk_rows = max(1000, int(chunk_rows or CFG.batch_chunk_rows))
+    stats = StreamStats()
+    fmt: Optional[Tuple[Optional[str], bool]] = None
+    lines_iter = (ln for ln in source if ln.strip())
+    while not (cancel is not None and cancel.is_set()):
+        lines = list(itertools.islice(lines_iter, chunk_rows))
+        if not lines:
+            break
+        if fmt is None:
+            probe = next((ln for ln in lines if any(ch.isdigit() for ch in ln)), lines[0])
+            fmt = _detect_column_format(probe, column)
+        _stats_text_chunk(stats, lines, fmt, column)
+        if progress is not None:
+            progress(stats.count)
+    return stats
+
+_RAW_FLOAT_SUFFIXES = (".f64", ".bin")
+
+def stream_file_stats(path: str, column: int = 0, progress: Optional[Callable[[int], None]] = None,
+                      cancel: Optional[threading.Event] = None) -> StreamStats:
+    """
+    Statistics of a numeric file: .npy arrays and raw little-endian float64
+    files (.f64/.bin) are memory-mapped and read in slices; anything else is
+    treated as a text table.
+    """
+    lower = path.lower()
+    if lower.endswith(".npy") or lower.endswith(_RAW_FLOAT_SUFFIXES):
+        if not HAVE_NUMPY:
+            raise ValueError("Для двоичных файлов нужен numpy")
+        if lower.endswith(".npy"):
+            data = _np.load(path, mmap_mode="r")
+        else:
+            data = _np.memmap(path, dtype="<f8", mode="r")
+        if data.ndim == 2:
+            if not 0 <= column < data.shape[1]:
+                raise ValueError("Нет такого столбца")
+            data = data[:, column]
+        elif data.ndim != 1:
+            data = data.reshape(-1)
+        stats = StreamStats()
+        step = CFG.stats_chunk_values
+        for i in range(0, data.shape[0], step):
+            if cancel is not None and cancel.is_set():
+                break
+            stats.add_array(_np.asarray(data[i:i + step], dtype=_np.float64))
+            if progress is not None:
+                progress(stats.count)
+        return stats
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as fh:
+        return stream_stats(fh, column, progress, cancel)
+
+# ---------------------------
+# Persistent history (append-only log + offset index)
+# ---------------------------
+def _history_dir() -> str:
+    base = os.environ.get("APPDATA") or os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "calculator")
+
+_HISTORY_ESCAPES = (("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r"))
+_HISTORY_UNESCAPE = re.compile(r"\\(.)")
+
+def _history_escape(text: str) -> str:
+    for raw, escaped in _HISTORY_ESCAPES:
+        text = text.replace(raw, escaped)
+    return text
+
+def _history_unescape(text: str) -> str:
+    return _HISTORY_UNESCAPE.sub(lambda m: {"t": "\t", "n": "\n", "r": "\r"}.get(m.group(1), m.group(1)), text)
+
+class HistoryStore:
+    """
+    Expressions and results in an append-only UTF-8 log, one "expr<TAB>result"
+    line per entry, plus an index of little-endian uint64 record offsets.
+    Nothing is touched until first use and both files are memory-mapped, so
+    startup cost does not depend on the history size. Past 1.25 × `limit`
+    entries the newest `limit` are compacted into fresh files.
+    """
+    _OFFSET = struct.Struct("<Q")
+
+    def __init__(self, directory: Optional[str] = None, limit: Optional[int] = None):
+        self.directory = directory or _history_dir()
+        self.log_path = os.path.join(self.directory, "history.log")
+        self.idx_path = os.path.join(self.directory, "history.idx")
+        self.limit = limit or CFG.history_limit
+        self._loaded = False
+        self._count = 0
+        self._log_size = 0
+        self._log_mm = None
+        self._idx_mm = None
+
+    # ---- files ----
+    def _load(self):
+        """
+        Reconcile the index with the log: index records appended after the
+        last indexed one, drop a torn trailing record, and rebuild the index
+        only if it does not match the log at all.
+        """
+        if self._loaded:
+            return
+        self._loaded = True
+        os.makedirs(self.directory, exist_ok=True)
+        for path in (self.log_path, self.idx_path):
+            if not os.path.exists(path):
+                open(path, "ab").close()
+        log_size = os.path.getsize(self.log_path)
+        count = os.path.getsize(self.idx_path) // self._OFFSET.size
+        start = 0
+        if count:
+            with open(self.idx_path, "rb") as fh:
+                fh.seek((count - 1) * self._OFFSET.size)
+                start = self._OFFSET.unpack(fh.read(self._OFFSET.size))[0]
+            with open(self.log_path, "rb") as fh:
+                if start > 0:
+                    fh.seek(start - 1)
+                valid = start < log_size and (start == 0 or fh.read(1) == b"\n")
+            if not valid:
+                count, start = 0, 0
+        with open(self.log_path, "rb") as fh:
+            fh.seek(start)
+            tail = fh.read()
+        offsets: List[int] = []
+        pos = 0
+        if count:
+            nl = tail.find(b"\n")
+            if nl < 0:
+                count -= 1
+            else:
+                pos = nl + 1
+        while pos < len(tail):
+            nl = tail.find(b"\n", pos)
+            if nl < 0:
+                break
+            offsets.append(start + pos)
+            pos = nl + 1
+        end = start + pos
+        if end != log_size:
+            with open(self.log_path, "r+b") as fh:
+                fh.truncate(end)
+        with open(self.idx_path, "r+b") as fh:
+            fh.truncate(count * self._OFFSET.size)
+            fh.seek(0, os.SEEK_END)
+            fh.write(b"".join(self._OFFSET.pack(o) for o in offsets))
+        self._count = count + len(offsets)
+        self._log_size = end
+
+    def _maps(self):
+        if self._log_mm is None:
+            self._log_mm = self._map(self.log_path, self._log_size)
+            self._idx_mm = self._map(self.idx_path, self._count * self._OFFSET.size)
+        return self._log_mm, self._idx_mm
+
+    @staticmethod
+    def _map(path: str, size: int):
+        if size <= 0:
+            return b""
+        with open(path, "rb") as fh:
+            return mmap.mmap(fh.fileno(), size, access=mmap.ACCESS_READ)
+
+    def _unmap(self):
+        for mm in (self._log_mm, self._idx_mm):
+            if isinstance(mm, mmap.mmap):
+                mm.close()
+        self._log_mm = self._idx_mm = None
+
+    def close(self):
+        self._unmap()
+
+    # ---- records ----
+    def __len__(self) -> int:
+        self._load()
+        return self._count
+
+    def _offset(self, i: int) -> int:
+        if i >= self._count:
+            return self._log_size
+        return self._OFFSET.unpack_from(self._maps()[1], i * self._OFFSET.size)[0]
+
+    def _record_at(self, pos: int) -> int:
+        lo, hi = 0, self._count - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self._offset(mid) <= pos:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def _line(self, i: int) -> bytes:
+        return self._maps()[0][self._offset(i):self._offset(i + 1) - 1]
+
+    def entry(self, i: int) -> Tuple[str, str]:
+        self._load()
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        expr, _tab, result = self._line(i).decode("utf-8", "replace").partition("\t")
+        return _history_unescape(expr), _history_unescape(result)
+
+    def append(self, expr: str, result: str):
+        """
+        Record an entry; an immediate repeat of the last expression is skipped.
+        """
+        self._load()
+        if self._count and self.entry(self._count - 1)[0] == expr:
+            return
+        record = f"{_history_escape(expr)}\t{_history_escape(result)}\n".encode("utf-8")
+        self._unmap()
+        with open(self.log_path, "ab") as fh:
+            fh.write(record)
+        with open(self.idx_path, "ab") as fh:
+            fh.write(self._OFFSET.pack(self._log_size))
+        self._log_size += len(record)
+        self._count += 1
+        if self._count > self.limit + self.limit // 4:
+            self._compact()
+
+    def _compact(self):
+        keep_from = self._count - self.limit
+        base = self._offset(keep_from)
+        offsets = [self._offset(i) - base for i in range(keep_from, self._count)]
+        log_mm = self._maps()[0]
+        data = bytes(log_mm[base:self._log_size])
+        self._unmap()
+        # log first: after a crash in between, the old index points past the
+        # shorter log (or mid-record), fails _load's check and is rebuilt
+        for path, payload in ((self.log_path, data),
+                              (self.idx_path, b"".join(self._OFFSET.pack(o) for o in offsets))):
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(payload)
+            os.replace(tmp, path)
+        self._count = len(offsets)
+        self._log_size = len(data)
+
+    # ---- search ----
+    def search(self, query: str, before: Optional[int] = None, prefix: bool = False) -> Optional[int]:
+        """
+        Index of the newest entry before `before` whose expression contains
+        (or, with `prefix`, starts with) `query`; None if there is none.
+        Matches are found with a backwards byte search over the mapped log.
+        """
+        self._load()
+        before = self._count if before is None else min(before, self._count)
+        if before <= 0:
+            return None
+        if not query:
+            return before - 1
+        needle = _history_escape(query).encode("utf-8")
+        log_mm = self._maps()[0]
+        end = self._offset(before)
+        while end > 0:
+            pos = log_mm.rfind(needle, 0, end)
+            if pos < 0:
+                return None
+            i = self._record_at(pos)
+            start = self._offset(i)
+            line = log_mm[start:self._offset(i + 1)]
+            tab = line.find(b"\t")
+            tab = len(line) if tab < 0 else tab
+            if prefix:
+                if pos == start:
+                    return i
+                end = start + len(needle)
+            else:
+                if pos + len(needle) <= start + tab:
+                    return i
+                end = start + tab
+        return None
+
+    def matches(self, query: str, limit: int, prefix: bool = False) -> List[Tuple[int, str, str]]:
+        """
+        Up to `limit` matching entries, newest first.
+        """
+        out: List[Tuple[int, str, str]] = []
+        before = None
+        while len(out) < limit:
+            i = self.search(query, before, prefix)
+            if i is None:
+                break
+            out.append((i, *self.entry(i)))
+            before = i
+        return out
+
 # ---------------------------
 # Calculator App (includes Examples window)
 # ---------------------------
 class CalculatorApp:
-    FIGURES_MAP: Dict[str, List[str]] = {
-        "Прямоугольник": ["Длина", "Ширина"],
-        "Круг": ["Радиус"],
-        "Треуг. (осн.,выс.)": ["Основание", "Высота"],
-        "Треуг. (3 стороны)": ["a", "b", "c"],
-        "Куб": ["a"],
-        "Параллелепипед": ["Длина", "Ширина", "Высота"],
-        "Шар": ["R"],
-        "Цилиндр": ["R", "H"],
-        "Конус": ["R", "H"],
-        "Пирамида": ["Sосн", "H"],
+    FIGURES_MAP: Dict[str, List[str]] = {name: spec.labels for name, spec in FIGURES.items()}
+    CUSTOM_FIGURE_PANELS: Dict[str, str] = {
+        "Многоугольник": "_build_polygon_panel",
+        "Объём из STL": "_build_stl_panel",
     }
+    TOOLS: List[Tuple[str, str]] = [
+        ("График функции", "plot_window"),
+        ("Таблица значений", "table_window"),
+        ("Решение уравнений", "roots_window"),
+        ("Статистика", "stats_window"),
+        ("Переменные", "session_window"),
+        ("История", "history_window"),
+    ]
 
     def __init__(self):
         self.root = ctk.CTk()
@@ -924,13 +4427,42 @@ class CalculatorApp:
             pass
 
         self.anim = Animator(self.root)
+        self.windows = WindowPool(self.root, self.anim)
+        self.windows.register("power", "Степень xʸ", 360, 260, self._build_power_window)
+        self.windows.register("figures", "Фигуры — компактно", 520, 300, self._build_figures_window)
+        self.windows.register("examples", "Генератор примеров", 720, 520, self._build_examples_window)
+        self.windows.register("plot", "График функции", 640, 480, self._build_plot_window)
+        self.windows.register("table", "Таблица значений", 480, 540, self._build_table_window)
+        self.windows.register("roots", "Решение уравнений", 460, 400, self._build_roots_window)
+        self.windows.register("stats", "Статистика", 480, 460, self._build_stats_window)
+        self.windows.register("session", "Переменные", 420, 380, self._build_session_window)
+        self.windows.register("history", "История", 460, 460, self._build_history_window)
         try:
-            self.anim.fade_in(self.root, target_alpha=CFG.win_alpha, duration=260, steps=14)
+            # not measured: _build_ui blocks the loop while it runs
+            self.anim.fade_in(self.root, target_alpha=CFG.win_alpha, duration=260, steps=14, measure=False)
         except Exception:
             pass
 
         self.max_input_chars = CFG.max_input
-        self._hover_cache: Dict[str, str] = {}
+        self.eval_pool: Optional[EvalWorkerPool] = None
+        if CFG.eval_sandbox:
+            try:
+                self.eval_pool = EvalWorkerPool(size=CFG.eval_workers, timeout_s=CFG.eval_timeout_s,
+                                                cpu_s=CFG.eval_cpu_s, mem_mb=CFG.eval_mem_mb)
+                self.eval_pool.start()
+            except Exception:
+                self.eval_pool = None
+        self._eval_seq = 0
+        self.session = Session()
+        self.history = HistoryStore()
+        self._history_nav: Optional[Dict[str, object]] = None
+        self._preview_seq = 0
+        self._preview_pending: Optional[Tuple[int, Tuple[str, str], str, object]] = None
+        self._preview_cond = threading.Condition()
+        self._preview_thread: Optional[threading.Thread] = None
+        self._preview_cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._figure_panels: Dict[str, Dict[str, ctk.CTkFrame]] = {}
+        self._figure_current: Dict[str, str] = {}
         self._accent_buttons: List[ctk.CTkButton] = []
         self._build_ui()
 
@@ -940,9 +4472,14 @@ class CalculatorApp:
             except Exception:
                 pass
 
+        if CFG.prebuild_windows:
+            self.root.after(CFG.prebuild_delay_ms, lambda: self.windows.prebuild(["power", "figures", "examples"]))
+
         self.root.bind("<Return>", lambda e: self._on_press("="))
         self.root.bind("<BackSpace>", lambda e: self.backspace())
         self.root.bind("<Escape>", lambda e: self.clear_all())
+        self.root.bind("<Up>", lambda e: self._history_step(-1))
+        self.root.bind("<Down>", lambda e: self._history_step(1))
 
     def _copy_to_clipboard(self, text: str):
         try:
@@ -979,9 +4516,7 @@ class CalculatorApp:
             pass
 
     def _hover_cached(self, color: str) -> str:
-        if color not in self._hover_cache:
-            self._hover_cache[color] = hover_color(color)
-        return self._hover_cache[color]
+        return PALETTE.hover(color)
 
     def _create_button(self, parent, text: str, fg_color: str, command: Callable[[], None], width: Optional[int] = None) -> ctk.CTkButton:
         btn = ctk.CTkButton(parent, text=text, corner_radius=CFG.btn_corner, fg_color=fg_color,
@@ -997,10 +4532,10 @@ class CalculatorApp:
     def _attach_focus_highlight(self, entry: ctk.CTkEntry):
         try:
             orig = entry.cget("fg_color")
-            focused = adjust_brightness(orig, 1.12)
+            focused = PALETTE.shade(orig, 1.12)
         except Exception:
             orig = CFG.surface
-            focused = adjust_brightness(orig, 1.12)
+            focused = PALETTE.shade(orig, 1.12)
         try:
             entry.bind("<FocusIn>", lambda e: entry.configure(fg_color=focused))
             entry.bind("<FocusOut>", lambda e: entry.configure(fg_color=orig))
@@ -1016,14 +4551,17 @@ class CalculatorApp:
         top_frame = ctk.CTkFrame(container, fg_color=container.cget("fg_color"), corner_radius=0)
         top_frame.grid(row=0, column=0, columnspan=4, padx=10, pady=(12, 6), sticky="we")
 
+        display_row = ctk.CTkFrame(top_frame, fg_color=top_frame.cget("fg_color"), corner_radius=0)
+        display_row.pack(fill="x")
+
         self.entry_var = tk.StringVar()
-        self.display = ctk.CTkEntry(top_frame, textvariable=self.entry_var, corner_radius=6,
+        self.display = ctk.CTkEntry(display_row, textvariable=self.entry_var, corner_radius=6,
                                     fg_color=CFG.surface, text_color=CFG.text, height=CFG.entry_h,
                                     font=FONTS["bold"])
         self.display.pack(side="left", fill="x", expand=True)
         self._attach_focus_highlight(self.display)
 
-        copy_main_btn = ctk.CTkButton(top_frame, text="⟡", width=max(32, min(42, CFG.entry_h)), height=max(32, min(42, CFG.entry_h)),
+        copy_main_btn = ctk.CTkButton(display_row, text="⟡", width=max(32, min(42, CFG.entry_h)), height=max(32, min(42, CFG.entry_h)),
                                       corner_radius=8, fg_color=CFG.accent_alt, hover_color=self._hover_cached(CFG.accent_alt),
                                       font=FONTS["small"], text_color=CFG.text,
                                       command=lambda: self._copy_to_clipboard(self.entry_var.get()))
@@ -1031,6 +4569,12 @@ class CalculatorApp:
 
         self._attach_copy_context(self.display, lambda: self.entry_var.get())
 
+        self.preview_var = tk.StringVar(value="")
+        self.preview_lbl = ctk.CTkLabel(top_frame, textvariable=self.preview_var, anchor="e", height=16,
+                                        text_color=CFG.muted, font=FONTS["ui"])
+        self.preview_lbl.pack(fill="x", pady=(2, 0))
+        self.entry_var.trace_add("write", lambda *_: self._schedule_preview())
+
         keys = [
             ("7", "8", "9", "/"),
             ("4", "5", "6", "*"),
@@ -1071,11 +4615,28 @@ class CalculatorApp:
         footer_frame.grid(row=6, column=0, columnspan=4, pady=(0, 8), sticky="we")
         footer_frame.grid_columnconfigure(0, weight=1)
         footer_frame.grid_columnconfigure(1, weight=0)
-        footer = ctk.CTkLabel(footer_frame, text="Compact • Smooth • Dark", text_color=CFG.muted, anchor="w", font=FONTS["ui"])
-        footer.grid(row=0, column=0, sticky="w", padx=(8, 0))
+        footer_frame.grid_columnconfigure(2, weight=0)
+        modes = list(self.EVAL_MODES.keys())
+        self.mode_var = tk.StringVar(value=modes[0])
+        mode_menu = ctk.CTkOptionMenu(footer_frame, values=modes, variable=self.mode_var, width=110, fg_color=CFG.surface,
+                                      button_color=CFG.accent_alt, text_color=CFG.text, corner_radius=6, font=FONTS["ui"],
+                                      command=lambda _v: self._schedule_preview())
+        mode_menu.grid(row=0, column=0, sticky="w", padx=(8, 0))
         examples_btn = ctk.CTkButton(footer_frame, text="Примеры", fg_color=CFG.accent_alt, width=100, corner_radius=6,
                                      command=self.examples_window, font=FONTS["ui"], text_color=CFG.text, hover_color=self._hover_cached(CFG.accent_alt))
-        examples_btn.grid(row=0, column=1, sticky="e", padx=(0, 8))
+        examples_btn.grid(row=0, column=2, sticky="e", padx=(0, 8))
+        self.tools_menu = tk.Menu(self.root, tearoff=0)
+        for label, method in self.TOOLS:
+            self.tools_menu.add_command(label=label, command=getattr(self, method))
+        self.tools_menu.add_separator()
+        self.reduced_motion_var = tk.BooleanVar(value=self.anim.reduced_motion)
+        self.tools_menu.add_checkbutton(label="Меньше анимации", variable=self.reduced_motion_var,
+                                        command=lambda: setattr(self.anim, "reduced_motion", self.reduced_motion_var.get()))
+        tools_btn = ctk.CTkButton(footer_frame, text="⋯", fg_color=CFG.accent_alt, width=36, corner_radius=6,
+                                  font=FONTS["ui"], text_color=CFG.text, hover_color=self._hover_cached(CFG.accent_alt))
+        tools_btn.configure(command=lambda: self.tools_menu.tk_popup(tools_btn.winfo_rootx(),
+                                                                     tools_btn.winfo_rooty() + tools_btn.winfo_height()))
+        tools_btn.grid(row=0, column=1, sticky="e", padx=(0, 6))
 
     def _on_press(self, ch: str):
         if ch == "=":
@@ -1088,23 +4649,321 @@ class CalculatorApp:
         except Exception:
             self.entry_var.set(cur + ch)
 
-    def evaluate(self):
-        expr = self.entry_var.get().strip()
-        if not expr:
-            return
+    def _run_evaluation(self, kind: str, payload, on_done: Callable[[bool, object], None]):
+        """
+        Evaluate off the Tk thread (in the worker pool when available) and hand
+        (ok, result_or_exception) back to `on_done` on the Tk thread.
+        """
+        if kind == "eval":
+            try:
+                fast = fast_eval(payload)
+            except ValueError as exc:
+                on_done(False, exc)
+                return
+            if fast is not None:
+                on_done(True, fast)
+                return
+        pool = self.eval_pool
+        if pool is None or self._in_process(kind, payload):
+            try:
+                on_done(True, _WORKER_TASKS[kind](payload))
+            except Exception as exc:
+                on_done(False, exc)
+            return
+
+        def work():
+            try:
+                res = (True, pool.submit(kind, payload))
+            except Exception as exc:
+                res = (False, exc)
+            try:
+                self.root.after(0, lambda: on_done(*res))
+            except Exception:
+                pass
+
+        threading.Thread(target=work, daemon=True).start()
+
+    @staticmethod
+    def _in_process(kind: str, payload) -> bool:
+        """
+        Cheap plain expressions skip the worker round trip; anything whose
+        cost class is above cheap goes to the sandbox.
+        """
+        return kind == "eval" and source_cost(payload) == COST_CHEAP
+
+    EVAL_MODES: Dict[str, str] = {
+        "Обычный": "eval",
+        "Точный": "precise",
+        "Матрицы": "matrix",
+    }
+
+    def _eval_kind(self) -> str:
+        try:
+            return self.EVAL_MODES.get(self.mode_var.get(), "eval")
+        except Exception:
+            return "eval"
+
+    def _session_request(self, kind: str, expr: str, preview: bool = False):
+        """
+        Route plain-mode input that defines or uses session names to the
+        "session" task; everything else keeps its own kind.
+        """
+        if kind == "eval" and (Session.is_definition(expr) or self.session.uses(expr)):
+            return "session", (self.session.texts(), expr, preview)
+        return kind, expr
+
+    def evaluate(self):
+        expr = self.entry_var.get().strip()
+        if not expr:
+            return
+        self._eval_seq += 1
+        seq = self._eval_seq
+        kind = self._eval_kind()
+        if kind == "eval" and Session.is_definition(expr):
+            self._define(seq, expr)
+            return
+        kind, payload = self._session_request(kind, expr)
+        self._run_evaluation(kind, payload, lambda ok, value: self._show_evaluation(seq, ok, value, expr))
+
+    def _define(self, seq: int, text: str):
+        """
+        Apply a definition to the session; a variable's value is then computed
+        like any evaluation and shown as `name = value`.
+        """
+        try:
+            d = self.session.define(text)
+        except ValueError as exc:
+            self._show_message("Ошибка", str(exc) or "Неверное определение", is_error=True)
+            return
+        except Exception:
+            self._show_message("Ошибка", "Неверное определение", is_error=True)
+            return
+        if d.params:
+            self.preview_var.set(f"✓ {d.name}({', '.join(d.params)})")
+            self._remember(text, "")
+            return
+
+        def done(ok: bool, value):
+            self._show_evaluation(seq, ok, value, text)
+            if ok and seq == self._eval_seq and not is_big_int(value) and not is_array(value) and len(str(value)) <= 24:
+                self.display.delete(0, "end")
+                self.display.insert(0, f"{d.name} = {value}")
+
+        self._run_evaluation("session", (self.session.texts(), d.name, False), done)
+
+    def _show_evaluation(self, seq: int, ok: bool, value, expr: str = ""):
+        if seq != self._eval_seq:
+            return
+        if ok and expr:
+            self._remember(expr, value)
+        if not ok:
+            if isinstance(value, EvaluationAborted):
+                self.display.delete(0, "end")
+                self.display.insert(0, "Вычисление прервано")
+            elif isinstance(value, ValueError):
+                self._show_message("Ошибка", str(value) or "Неверное выражение", is_error=True)
+            else:
+                self._show_message("Ошибка", "Неверное выражение", is_error=True)
+            return
+        self.display.delete(0, "end")
+        if is_big_int(value):
+            self.display.insert(0, big_int_short_text(value))
+            self._show_full_result("", value=value)
+            return
+        if is_array(value):
+            inline = array_inline_text(value) if value.size <= 16 else ""
+            if inline and len(inline) <= 32:
+                self.display.insert(0, inline)
+            else:
+                self.display.insert(0, array_summary(value))
+                self._show_matrix(value)
+            return
+        try:
+            s = result_text(value)
+        except ValueError as ve:
+            self._show_message("Ошибка", str(ve) or "Неверное выражение", is_error=True)
+            return
+        if len(s) > 32:
+            self.display.insert(0, "Результат слишком длинный")
+            self._show_full_result(s)
+        else:
+            self.display.insert(0, s)
+
+    # ---- history ----
+    def _remember(self, expr: str, value):
+        try:
+            if is_array(value):
+                text = array_inline_text(value) if value.size <= 16 else array_summary(value)
+            else:
+                text = result_text(value)
+            self.history.append(expr, text[:200])
+        except Exception:
+            pass
+        self._history_nav = None
+
+    def _history_step(self, direction: int):
+        """
+        Up/Down: walk through past expressions starting with what was typed
+        before the walk began (all of them if nothing was typed). Down past the
+        newest match restores the typed text.
+        """
+        text = self.entry_var.get()
+        nav = self._history_nav
+        if nav is None or text != nav["shown"]:
+            if direction > 0:
+                return
+            nav = {"query": text.strip(), "trail": [], "shown": text}
+        trail: List[int] = nav["trail"]
+        try:
+            if direction < 0:
+                i = self.history.search(nav["query"], trail[-1] if trail else None, prefix=True)
+                if i is None:
+                    return
+                trail.append(i)
+            elif trail:
+                trail.pop()
+            else:
+                return
+            shown = self.history.entry(trail[-1])[0] if trail else nav["query"]
+        except Exception:
+            return
+        nav["shown"] = shown
+        self._history_nav = nav
+        self.entry_var.set(shown)
+        try:
+            self.display.icursor("end")
+        except Exception:
+            pass
+
+    # ---- live preview ----
+    def _schedule_preview(self):
+        self.anim.schedule("preview", CFG.preview_debounce_ms, self._request_preview)
+
+    @staticmethod
+    def _is_plain_number(expr: str) -> bool:
+        try:
+            parse_number(expr)
+            return True
+        except ValueError:
+            return False
+
+    def _input_numbers(self, texts: List[str], on_done: Callable[[bool, object], None]):
+        """
+        Numbers typed into tool fields: literals, or expressions over the
+        session's variables. Cheap expressions are evaluated here, the rest go
+        to the worker pool like the main display; `on_done(ok, values_or_exception)`
+        runs on the Tk thread once every field is known.
+        """
+        values: List[object] = [None] * len(texts)
+        pending: List[int] = []
+        for i, text in enumerate(texts):
+            try:
+                values[i] = parse_number(text)
+                continue
+            except ValueError:
+                pass
+            try:
+                if Session.is_definition(text):
+                    raise ValueError("Ошибка ввода: ожидаются числа")
+                if self.session.cost(self.session.normalize(text)) != COST_CHEAP:
+                    pending.append(i)
+                    continue
+                values[i] = self.session.evaluate(text)
+            except Exception as exc:
+                on_done(False, exc)
+                return
+            if isinstance(values[i], UserFunction):
+                on_done(False, ValueError(f"{values[i]!r} — функция, укажите аргументы"))
+                return
+
+        def next_field(k: int):
+            if k == len(pending):
+                on_done(True, values)
+                return
+
+            def done(ok: bool, value):
+                if not ok:
+                    on_done(False, value)
+                    return
+                values[pending[k]] = value
+                next_field(k + 1)
+
+            self._run_evaluation("session", (self.session.texts(), texts[pending[k]], False), done)
+
+        next_field(0)
+
+    def _request_preview(self):
+        self._preview_seq += 1
+        seq = self._preview_seq
+        expr = self.entry_var.get().strip()
+        if not expr or self._is_plain_number(expr):
+            self.preview_var.set("")
+            return
+        kind, payload = self._session_request(self._eval_kind(), expr, preview=True)
+        key = (kind, f"{self.session.version}:{expr}" if kind == "session" else expr)
+        cached = self._preview_cache.get(key)
+        if cached is not None:
+            self._preview_cache.move_to_end(key)
+            self.preview_var.set(cached)
+            return
+        with self._preview_cond:
+            self._preview_pending = (seq, key, kind, payload)
+            self._preview_cond.notify()
+        if self._preview_thread is None:
+            self._preview_thread = threading.Thread(target=self._preview_loop, daemon=True)
+            self._preview_thread.start()
+
+    def _preview_loop(self):
+        while True:
+            with self._preview_cond:
+                while self._preview_pending is None:
+                    self._preview_cond.wait()
+                seq, key, kind, payload = self._preview_pending
+                self._preview_pending = None
+            if seq != self._preview_seq:
+                continue
+            cacheable = True
+            try:
+                fast = fast_eval(payload) if kind == "eval" else None
+                if fast is not None:
+                    value = fast
+                elif self.eval_pool is not None and not self._in_process(kind, payload):
+                    value = self.eval_pool.submit(kind, payload, timeout_s=CFG.preview_timeout_s)
+                else:
+                    value = _WORKER_TASKS[kind](payload)
+                text = "" if value is None else self._format_preview(value)
+            except EvaluationAborted:
+                text, cacheable = "", False
+            except Exception:
+                text = ""
+            try:
+                self.root.after(0, lambda s=seq, k=key, t=text, c=cacheable: self._apply_preview(s, k, t, c))
+            except Exception:
+                return
+
+    @staticmethod
+    def _format_preview(value) -> str:
+        if is_big_int(value):
+            return f"= {big_int_short_text(value)}"
+        if is_array(value):
+            inline = array_inline_text(value) if value.size <= 16 else ""
+            return f"= {inline}" if inline and len(inline) <= 28 else f"= {array_summary(value)}"
         try:
-            result = safe_eval(expr)
-            s = str(result)
-            self.display.delete(0, "end")
-            if len(s) > 32:
-                self.display.insert(0, "Результат слишком длинный")
-                self._show_full_result(s)
-            else:
-                self.display.insert(0, s)
-        except ValueError as ve:
-            self._show_message("Ошибка", str(ve) or "Неверное выражение", is_error=True)
-        except Exception:
-            self._show_message("Ошибка", "Неверное выражение", is_error=True)
+            s = str(value)
+        except ValueError:
+            return ""
+        if len(s) > 28:
+            s = s[:27] + "…"
+        return f"= {s}"
+
+    def _apply_preview(self, seq: int, key: Tuple[str, str], text: str, cacheable: bool):
+        if cacheable:
+            self._preview_cache[key] = text
+            self._preview_cache.move_to_end(key)
+            while len(self._preview_cache) > CFG.preview_cache_size:
+                self._preview_cache.popitem(last=False)
+        if seq == self._preview_seq:
+            self.preview_var.set(text)
 
     def clear_all(self):
         try:
@@ -1144,10 +5003,14 @@ class CalculatorApp:
         lbl.pack(pady=(8, 8))
         ctk.CTkButton(frame, text="Закрыть", fg_color=CFG.accent, command=win.destroy, font=FONTS["ui"], text_color=CFG.text).pack(pady=(0, 6))
 
-    def _show_full_result(self, text: str):
+    def _show_full_result(self, text: str, value: Optional[int] = None):
+        """
+        Paged viewer for long results. Huge ints are summarized immediately and
+        converted to decimal in the background; only one page is in the textbox.
+        """
         win = ctk.CTkToplevel(self.root)
         win.title("Результат (полный)")
-        win.geometry("520x300")
+        win.geometry("520x340")
         win.transient(self.root); win.grab_set()
         try:
             win.attributes("-alpha", 0.0)
@@ -1159,48 +5022,191 @@ class CalculatorApp:
             pass
         frame = ctk.CTkFrame(win, corner_radius=8, fg_color=CFG.panel)
         frame.pack(fill="both", expand=True, padx=10, pady=10)
+        info_lbl = ctk.CTkLabel(frame, text="", text_color=CFG.muted, anchor="w", justify="left", font=FONTS["ui"])
+        info_lbl.pack(fill="x", padx=6)
         txt = ctk.CTkTextbox(frame, width=480, height=220, corner_radius=6, fg_color=CFG.surface, font=FONTS["ui"])
         txt.pack(expand=True, fill="both", padx=6, pady=6)
-        txt.insert("0.0", text)
         try:
             txt.configure(state="normal")
             txt.bind("<Control-a>", lambda e: (txt.tag_add("sel", "1.0", "end"), "break"))
         except Exception:
             pass
+
+        state = {"full": text, "page": 0, "pages": 1}
+        page_chars = max(1000, CFG.result_page_chars)
+
         btns_frame = ctk.CTkFrame(frame, fg_color=frame.cget("fg_color"))
         btns_frame.pack(fill="x", pady=(6, 0))
         copy_btn = ctk.CTkButton(btns_frame, text="⟡", fg_color=CFG.accent_alt, width=36, height=36, corner_radius=8,
-                                 command=lambda: self._copy_to_clipboard(txt.get("0.0", "end").strip()),
+                                 command=lambda: self._copy_to_clipboard(state["full"]),
                                  font=FONTS["small"], text_color=CFG.text, hover_color=self._hover_cached(CFG.accent_alt))
         copy_btn.pack(side="left", padx=(6, 6))
+        prev_btn = ctk.CTkButton(btns_frame, text="◀", fg_color=CFG.card, width=36, height=36, corner_radius=8,
+                                 font=FONTS["small"], text_color=CFG.text, hover_color=self._hover_cached(CFG.card))
+        prev_btn.pack(side="left")
+        page_lbl = ctk.CTkLabel(btns_frame, text="", text_color=CFG.muted, font=FONTS["ui"], width=80)
+        page_lbl.pack(side="left", padx=4)
+        next_btn = ctk.CTkButton(btns_frame, text="▶", fg_color=CFG.card, width=36, height=36, corner_radius=8,
+                                 font=FONTS["small"], text_color=CFG.text, hover_color=self._hover_cached(CFG.card))
+        next_btn.pack(side="left")
         close_btn = ctk.CTkButton(btns_frame, text="Закрыть", fg_color=CFG.accent,
                                   command=win.destroy, font=FONTS["ui"], text_color=CFG.text)
         close_btn.pack(side="right", padx=(6, 6))
 
-    def power_window(self):
-        win_w, win_h = 360, 260
+        def show_page(i: int):
+            full = state["full"]
+            state["pages"] = max(1, -(-len(full) // page_chars))
+            state["page"] = max(0, min(state["pages"] - 1, i))
+            start = state["page"] * page_chars
+            try:
+                txt.delete("0.0", "end")
+                txt.insert("0.0", full[start:start + page_chars])
+                page_lbl.configure(text=f"{state['page'] + 1} / {state['pages']}")
+            except Exception:
+                pass
+
+        prev_btn.configure(command=lambda: show_page(state["page"] - 1))
+        next_btn.configure(command=lambda: show_page(state["page"] + 1))
+
+        if value is None:
+            show_page(0)
+            return
+
+        digits, lead, tail = int_digit_summary(value)
+        sign = "-" if value < 0 else ""
+        info_lbl.configure(text=f"Цифр: {digits}\nНачало: {sign}{lead}…\nКонец: …{tail}")
+        txt.insert("0.0", "Преобразование в десятичную запись…")
+
+        def on_converted(ok: bool, result):
+            if not ok:
+                try:
+                    txt.delete("0.0", "end")
+                    txt.insert("0.0", str(result) or "Не удалось преобразовать результат")
+                except Exception:
+                    pass
+                return
+            state["full"] = result
+            show_page(0)
+
+        self._run_evaluation("int_str", value, on_converted)
+
+    def _show_matrix(self, a):
+        """
+        Compact viewer for array results: only the cells in view are drawn, so
+        large matrices scroll as cheaply as small ones.
+        """
+        a = a.reshape(-1, 1) if a.ndim == 1 else a.reshape(a.shape[0], -1)
+        rows, cols = a.shape
+        if a.dtype.kind in "iub":
+            fmt = str
+        else:
+            fmt = lambda v: f"{v:.6g}".replace(".", ",")
         win = ctk.CTkToplevel(self.root)
-        win.title("Степень xʸ")
-        try:
-            rx = self.root.winfo_rootx(); ry = self.root.winfo_rooty()
-            rw = self.root.winfo_width(); rh = self.root.winfo_height()
-            x = rx + max(0, (rw - win_w) // 2); y = ry + max(0, (rh - win_h) // 2)
-            win.geometry(f"{win_w}x{win_h}+{x}+{y}")
-        except Exception:
-            sw = win.winfo_screenwidth(); sh = win.winfo_screenheight()
-            x = (sw - win_w) // 2; y = (sh - win_h) // 2
-            win.geometry(f"{win_w}x{win_h}+{x}+{y}")
-        win.resizable(False, False)
-        win.transient(self.root); win.grab_set()
-        try:
-            win.attributes("-alpha", 0.0)
-        except Exception:
-            pass
+        win.title("Результат — матрица")
+        win.geometry("560x380")
+        win.transient(self.root)
         try:
             self.anim.fade_in(win, target_alpha=1.0, duration=220, steps=12)
         except Exception:
             pass
+        frame = ctk.CTkFrame(win, corner_radius=8, fg_color=CFG.panel)
+        frame.pack(fill="both", expand=True, padx=10, pady=10)
+        info = f"{array_summary(a)}   тип: {a.dtype}"
+        if a.size and a.dtype.kind in "iuf":
+            info += f"   мин {fmt(a.min())}   макс {fmt(a.max())}"
+        ctk.CTkLabel(frame, text=info, anchor="w", font=FONTS["ui"], text_color=CFG.muted).pack(fill="x", padx=6)
+
+        grid = ctk.CTkFrame(frame, corner_radius=6, fg_color=CFG.surface)
+        grid.pack(fill="both", expand=True, padx=6, pady=6)
+        grid.grid_rowconfigure(0, weight=1); grid.grid_columnconfigure(0, weight=1)
+        canvas = tk.Canvas(grid, bg=CFG.surface, highlightthickness=0)
+        canvas.grid(row=0, column=0, sticky="nsew")
+        cell_w, cell_h, head_w = 92, 22, 48
+        view = {"r": 0, "c": 0}
+
+        def visible() -> Tuple[int, int]:
+            return (max(1, canvas.winfo_height() // cell_h - 1),
+                    max(1, (canvas.winfo_width() - head_w) // cell_w))
+
+        def redraw():
+            canvas.delete("all")
+            nr, nc = visible()
+            r0 = view["r"] = max(0, min(view["r"], rows - nr))
+            c0 = view["c"] = max(0, min(view["c"], cols - nc))
+            for j in range(c0, min(cols, c0 + nc)):
+                x = head_w + (j - c0) * cell_w
+                canvas.create_text(x + cell_w - 6, cell_h // 2, text=str(j + 1), anchor="e", fill=CFG.muted, font=FONTS["small"])
+            for i in range(r0, min(rows, r0 + nr)):
+                y = (i - r0 + 1) * cell_h
+                canvas.create_text(head_w - 8, y + cell_h // 2, text=str(i + 1), anchor="e", fill=CFG.muted, font=FONTS["small"])
+                for j in range(c0, min(cols, c0 + nc)):
+                    x = head_w + (j - c0) * cell_w
+                    canvas.create_text(x + cell_w - 6, y + cell_h // 2, text=fmt(a[i, j]), anchor="e", fill=CFG.text, font=FONTS["ui"])
+            vbar.set(r0 / rows, min(1.0, (r0 + nr) / rows))
+            hbar.set(c0 / cols, min(1.0, (c0 + nc) / cols))
+
+        def scroller(key: str, total: int, index: int):
+            def on_scroll(*args):
+                page = visible()[index]
+                if args[0] == "moveto":
+                    view[key] = int(float(args[1]) * total)
+                elif args[0] == "scroll":
+                    view[key] += int(args[1]) * (page if args[2] == "pages" else 1)
+                redraw()
+            return on_scroll
+
+        vbar = ctk.CTkScrollbar(grid, command=scroller("r", rows, 0))
+        vbar.grid(row=0, column=1, sticky="ns")
+        hbar = ctk.CTkScrollbar(grid, orientation="horizontal", command=scroller("c", cols, 1))
+        hbar.grid(row=1, column=0, sticky="we")
+
+        def on_wheel(event):
+            up = getattr(event, "num", 0) == 4 or getattr(event, "delta", 0) > 0
+            scroller("r", rows, 0)("scroll", -3 if up else 3, "units")
+
+        canvas.bind("<Configure>", lambda _e: self.anim.schedule("matrix", 15, redraw))
+        canvas.bind("<MouseWheel>", on_wheel)
+        canvas.bind("<Button-4>", on_wheel)
+        canvas.bind("<Button-5>", on_wheel)
+
+        def copy_all():
+            self._copy_to_clipboard("\n".join(";".join(fmt(v) for v in row) for row in a.tolist()))
+
+        btns = ctk.CTkFrame(frame, fg_color=frame.cget("fg_color"))
+        btns.pack(fill="x")
+        ctk.CTkButton(btns, text="⟡", fg_color=CFG.accent_alt, width=36, height=36, corner_radius=8, command=copy_all,
+                      font=FONTS["small"], text_color=CFG.text, hover_color=self._hover_cached(CFG.accent_alt)).pack(side="left", padx=(6, 6))
+        ctk.CTkButton(btns, text="Закрыть", fg_color=CFG.accent, command=win.destroy,
+                      font=FONTS["ui"], text_color=CFG.text).pack(side="right", padx=(6, 6))
+
+    def power_window(self):
+        self.windows.show("power")
+
+    def figures_window_compact_centered(self):
+        self.windows.show("figures")
+
+    def examples_window(self):
+        self.windows.show("examples")
+
+    def plot_window(self):
+        self.windows.show("plot")
+
+    def table_window(self):
+        self.windows.show("table")
+
+    def roots_window(self):
+        self.windows.show("roots")
+
+    def stats_window(self):
+        self.windows.show("stats")
+
+    def session_window(self):
+        self.windows.show("session")
 
+    def history_window(self):
+        self.windows.show("history")
+
+    def _build_power_window(self, win: ctk.CTkToplevel):
         f = ctk.CTkFrame(win, corner_radius=6, fg_color=CFG.panel)
         f.pack(fill="both", expand=True, padx=10, pady=10)
 
@@ -1234,55 +5240,34 @@ class CalculatorApp:
                                        hover_color=self._hover_cached(CFG.accent_alt))
         copy_power_btn.pack(side="left", padx=(8, 8), pady=(10, 10))
 
+        def show_result(ok: bool, res):
+            btn.configure(text="Вычислить")
+            if not ok:
+                if isinstance(res, EvaluationAborted):
+                    res_lbl.configure(text="Вычисление прервано", text_color="#ffb4b4")
+                elif isinstance(res, ValueError) and str(res):
+                    res_lbl.configure(text=str(res), text_color="#ffb4b4")
+                else:
+                    res_lbl.configure(text="Ошибка при вычислении", text_color="#ffb4b4")
+                return
+            if is_big_int(res):
+                res_lbl.configure(text=f"Результат: {big_int_short_text(res)}", text_color=CFG.text)
+                self._show_full_result("", value=res)
+                return
+            formatted = repr(res)
+            short = formatted if len(formatted) <= 64 else (formatted[:61] + "...")
+            res_lbl.configure(text=f"Результат: {short}", text_color=CFG.text)
+            if len(formatted) > 64:
+                self._show_full_result(formatted)
+
         def compute_and_show():
             self.anim.press_animation(btn)
-            try:
-                x = parse_number(ex.get().strip())
-                y = parse_number(ey.get().strip())
-                if isinstance(x, complex) or isinstance(y, complex):
-                    res_lbl.configure(text="Комплексные показатели не поддерживаются здесь", text_color="#ffb4b4")
-                else:
-                    res = float(x) ** float(y)
-                    formatted = repr(res)
-                    short = formatted if len(formatted) <= 64 else (formatted[:61] + "...")
-                    res_lbl.configure(text=f"Результат: {short}", text_color=CFG.text)
-                    if len(formatted) > 64:
-                        self._show_full_result(formatted)
-            except ValueError:
-                res_lbl.configure(text="Ошибка ввода: ожидаются числа", text_color="#ffb4b4")
-            except OverflowError:
-                res_lbl.configure(text="Ошибка: переполнение результата", text_color="#ffb4b4")
-            except Exception:
-                res_lbl.configure(text="Ошибка при вычислении", text_color="#ffb4b4")
-            finally:
-                btn.configure(text="Вычислить")
+            btn.configure(text="Вычисление…")
+            self._run_evaluation("power", (ex.get().strip(), ey.get().strip()), show_result)
 
         btn.configure(command=compute_and_show)
 
-    def figures_window_compact_centered(self):
-        win_w, win_h = 520, 260
-        win = ctk.CTkToplevel(self.root)
-        win.title("Фигуры — компактно")
-        try:
-            rx = self.root.winfo_rootx(); ry = self.root.winfo_rooty()
-            rw = self.root.winfo_width(); rh = self.root.winfo_height()
-            x = rx + max(0, (rw - win_w) // 2); y = ry + max(0, (rh - win_h) // 2)
-            win.geometry(f"{win_w}x{win_h}+{x}+{y}")
-        except Exception:
-            sw = win.winfo_screenwidth(); sh = win.winfo_screenheight()
-            x = (sw - win_w) // 2; y = (sh - win_h) // 2
-            win.geometry(f"{win_w}x{win_h}+{x}+{y}")
-        win.resizable(False, False)
-        win.transient(self.root); win.grab_set()
-        try:
-            win.attributes("-alpha", 0.0)
-        except Exception:
-            pass
-        try:
-            self.anim.fade_in(win, target_alpha=1.0, duration=220, steps=12)
-        except Exception:
-            pass
-
+    def _build_figures_window(self, win: ctk.CTkToplevel):
         main = ctk.CTkFrame(win, corner_radius=8, fg_color=CFG.panel)
         main.pack(fill="both", expand=True, padx=10, pady=10)
 
@@ -1291,7 +5276,7 @@ class CalculatorApp:
         top.grid_columnconfigure(0, weight=1); top.grid_columnconfigure(1, weight=0)
         ctk.CTkLabel(top, text="Фигура", font=FONTS["ui"], text_color=CFG.text).grid(row=0, column=0, sticky="e", padx=(0, 6))
 
-        names = list(self.FIGURES_MAP.keys())
+        names = list(self.FIGURES_MAP.keys()) + list(self.CUSTOM_FIGURE_PANELS.keys())
         fields_frame = ctk.CTkFrame(main, corner_radius=6, fg_color=CFG.panel)
         fields_frame.pack(fill="both", expand=True, padx=6, pady=(0, 6))
 
@@ -1305,17 +5290,33 @@ class CalculatorApp:
         self._populate_fields_for_figure_centered(names[0], fields_frame)
 
     def _populate_fields_for_figure_centered(self, figure_name: str, container: ctk.CTkFrame):
-        for w in container.winfo_children():
+        """
+        Show the panel for `figure_name`; each panel is built once per container
+        and swapped with pack_forget/pack, so typed values survive switching.
+        """
+        key = str(container)
+        panels = self._figure_panels.setdefault(key, {})
+        current = self._figure_current.get(key)
+        if current is not None and current in panels:
             try:
-                w.destroy()
+                panels[current].pack_forget()
             except Exception:
-                pass
-
+                panels.pop(current, None)
+        panel = panels.get(figure_name)
+        if panel is None:
+            panel = self._build_figure_panel(figure_name, container)
+            panels[figure_name] = panel
+        panel.pack(fill="both", expand=True, padx=4, pady=2)
+        self._figure_current[key] = figure_name
+
+    def _build_figure_panel(self, figure_name: str, container: ctk.CTkFrame) -> ctk.CTkFrame:
+        custom = self.CUSTOM_FIGURE_PANELS.get(figure_name)
+        if custom is not None:
+            return getattr(self, custom)(container)
         fields = self.FIGURES_MAP.get(figure_name, [])
         entries: List[ctk.CTkEntry] = []
 
         inner = ctk.CTkFrame(container, fg_color=container.cget("fg_color"))
-        inner.pack(fill="both", expand=True, padx=4, pady=2)
 
         inputs_holder = ctk.CTkFrame(inner, fg_color=inner.cget("fg_color"))
         inputs_holder.pack(fill="x", side="top", pady=(2, 4))
@@ -1382,42 +5383,31 @@ class CalculatorApp:
         self._attach_copy_context(res_lbl, lambda r=res_lbl: r.cget("text"))
 
         def compute_and_show():
+            spec = FIGURES.get(figure_name)
+            if spec is None:
+                res_lbl.configure(text="Нет данных для выбранной фигуры", text_color=CFG.text)
+                return
+            self._input_numbers([entry.get() for entry in entries], lambda ok, numbers: show_results(spec, ok, numbers))
+
+        def show_results(spec: FigureSpec, ok: bool, numbers):
+            if not res_lbl.winfo_exists():
+                return
+            if not ok:
+                aborted = isinstance(numbers, EvaluationAborted)
+                res_lbl.configure(text="Вычисление прервано" if aborted else "Ошибка ввода: ожидаются числа",
+                                  text_color="#ffb4b4")
+                return
             try:
-                vals = [entry.get() for entry in entries]
-                def getf(i: int) -> float:
-                    v = parse_number(vals[i])
+                values: Dict[str, float] = {}
+                for (_label, var), v in zip(spec.params, numbers):
                     if isinstance(v, complex):
                         raise ValueError("Требуется вещественное число")
-                    return float(v)
-                area = peri = vol = None
-                name = figure_name
-                if name == "Прямоугольник":
-                    a = getf(0); b = getf(1); area = a * b; peri = 2 * (a + b)
-                elif name == "Круг":
-                    r = getf(0); area = math.pi * r * r; peri = 2 * math.pi * r
-                elif name == "Треуг. (осн.,выс.)":
-                    a = getf(0); h = getf(1); area = 0.5 * a * h
-                elif name == "Треуг. (3 стороны)":
-                    a = getf(0); b = getf(1); c = getf(2); peri = a + b + c
-                elif name == "Куб":
-                    a = getf(0); area = 6 * a * a; vol = a ** 3
-                elif name == "Параллелепипед":
-                    a = getf(0); b = getf(1); c = getf(2); area = 2 * (a * b + b * c + a * c); vol = a * b * c
-                elif name == "Шар":
-                    r = getf(0); area = 4 * math.pi * r * r; vol = 4.0 / 3.0 * math.pi * r ** 3
-                elif name == "Цилиндр":
-                    r = getf(0); h = getf(1); area = 2 * math.pi * r * (r + h); vol = math.pi * r * r * h
-                elif name == "Конус":
-                    r = getf(0); h = getf(1); slant = math.sqrt(r * r + h * h); area = math.pi * r * (r + slant); vol = 1.0 / 3.0 * math.pi * r * r * h
-                elif name == "Пирамида":
-                    S = getf(0); h = getf(1); vol = 1.0 / 3.0 * S * h
+                    values[var] = float(v)
+                results = evaluate_figure(spec, values)
                 parts: List[str] = []
-                if area is not None:
-                    parts.append(f"📐 Площадь: {area:.4f}")
-                if peri is not None:
-                    parts.append(f"📏 Периметр/Стороны: {peri:.4f}")
-                if vol is not None:
-                    parts.append(f"📦 Объём: {vol:.4f}")
+                for kind, label in FIGURE_QUANTITIES:
+                    if kind in results:
+                        parts.append(f"{label}: {results[kind]:.4f}")
                 res_lbl.configure(text="\n".join(parts) if parts else "Нет данных для выбранной фигуры", text_color=CFG.text)
             except ValueError:
                 res_lbl.configure(text="Ошибка ввода: ожидаются числа", text_color="#ffb4b4")
@@ -1434,30 +5424,865 @@ class CalculatorApp:
                                 font=FONTS["ui"], text_color=CFG.text, hover_color=self._hover_cached(CFG.accent))
         calc_btn.pack(side="right", padx=(0, 8), pady=(6, 4))
 
-    def examples_window(self):
-        win_w, win_h = 720, 520
+        if figure_name in FIGURES:
+            batch_btn = ctk.CTkButton(bottom_frame, text="Пакет", fg_color=CFG.accent_alt, width=70, corner_radius=6,
+                                      command=lambda: self._batch_window(figure_name),
+                                      font=FONTS["ui"], text_color=CFG.text, hover_color=self._hover_cached(CFG.accent_alt))
+            batch_btn.pack(side="right", padx=(0, 8), pady=(6, 4))
+        return inner
+
+    def _file_figure_panel(self, container: ctk.CTkFrame, hint: str, filetypes: List[Tuple[str, str]],
+                           compute: Callable[[Optional[str], str], str], with_paste: bool = True) -> ctk.CTkFrame:
+        """
+        Panel for figures defined by data rather than parameters: optional paste
+        box, file picker, and a background `compute(path, pasted_text) -> text`.
+        """
+        inner = ctk.CTkFrame(container, fg_color=container.cget("fg_color"))
+        ctk.CTkLabel(inner, text=hint, anchor="w", font=FONTS["ui"], text_color=CFG.muted).pack(fill="x", padx=6)
+        paste = None
+        if with_paste:
+            paste = ctk.CTkTextbox(inner, height=70, corner_radius=6, fg_color=CFG.surface, font=FONTS["ui"])
+            paste.pack(fill="x", padx=6, pady=(2, 4))
+        bottom_frame = ctk.CTkFrame(inner, fg_color=inner.cget("fg_color"))
+        bottom_frame.pack(side="bottom", fill="x", pady=(4, 2))
+        res_lbl = ctk.CTkLabel(bottom_frame, text="", text_color=CFG.text, wraplength=300, justify="left", font=FONTS["ui"])
+        res_lbl.pack(side="left", padx=(6, 4))
+        self._attach_copy_context(res_lbl, lambda r=res_lbl: r.cget("text"))
+        state = {"path": None}
+
+        def choose_file():
+            path = filedialog.askopenfilename(parent=container.winfo_toplevel(), filetypes=filetypes)
+            if path:
+                state["path"] = path
+                res_lbl.configure(text=f"Файл: {os.path.basename(path)}", text_color=CFG.muted)
+
+        def run():
+            text = paste.get("0.0", "end") if paste is not None else ""
+            path = state["path"]
+            res_lbl.configure(text="Расчёт…", text_color=CFG.muted)
+
+            def work():
+                try:
+                    out, color = compute(path, text), CFG.text
+                except ValueError as exc:
+                    out, color = str(exc) or "Ошибка ввода", "#ffb4b4"
+                except Exception:
+                    out, color = "Ошибка при вычислении", "#ffb4b4"
+                self.root.after(0, lambda: res_lbl.configure(text=out, text_color=color))
+
+            threading.Thread(target=work, daemon=True).start()
+
+        copy_btn = ctk.CTkButton(bottom_frame, text="⟡", fg_color=CFG.accent_alt, width=36, height=36, corner_radius=8,
+                                 command=lambda: self._copy_to_clipboard(res_lbl.cget("text")),
+                                 font=FONTS["small"], text_color=CFG.text, hover_color=self._hover_cached(CFG.accent_alt))
+        copy_btn.pack(side="right", padx=(6, 6), pady=(6, 4))
+        calc_btn = ctk.CTkButton(bottom_frame, text="Вычислить", fg_color=CFG.accent, width=100, corner_radius=6,
+                                 command=lambda: (self.anim.press_animation(calc_btn), run()),
+                                 font=FONTS["ui"], text_color=CFG.text, hover_color=self._hover_cached(CFG.accent))
+        calc_btn.pack(side="right", padx=(0, 8), pady=(6, 4))
+        file_btn = ctk.CTkButton(bottom_frame, text="Файл…", fg_color=CFG.accent_alt, width=70, corner_radius=6,
+                                 command=choose_file, font=FONTS["ui"], text_color=CFG.text,
+                                 hover_color=self._hover_cached(CFG.accent_alt))
+        file_btn.pack(side="right", padx=(0, 8), pady=(6, 4))
+        return inner
+
+    def _build_polygon_panel(self, container: ctk.CTkFrame) -> ctk.CTkFrame:
+        def compute(path: Optional[str], text: str) -> str:
+            if path:
+                with open(path, "r", encoding="utf-8-sig", errors="replace") as fh:
+                    xs, ys = read_vertices(fh)
+            else:
+                xs, ys = read_vertices(io.StringIO(text))
+            area, perimeter, (cx, cy) = polygon_metrics(xs, ys)
+            return (f"📐 Площадь: {area:.4f}\n📏 Периметр: {perimeter:.4f}\n"
+                    f"⊙ Центр: ({cx:.4f}; {cy:.4f})   вершин: {len(xs)}")
+
+        return self._file_figure_panel(container, "Вершины: «x y» по строкам (или файл)",
+                                       [("CSV / текст", "*.csv *.txt *.tsv"), ("Все файлы", "*.*")], compute)
+
+    def _build_stl_panel(self, container: ctk.CTkFrame) -> ctk.CTkFrame:
+        def compute(path: Optional[str], _text: str) -> str:
+            if not path:
+                raise ValueError("Выберите STL-файл")
+            volume, area, triangles = stl_mesh_metrics(path)
+            return (f"📦 Объём: {volume:.4f}\n📐 Площадь поверхности: {area:.4f}\n"
+                    f"Треугольников: {triangles}")
+
+        return self._file_figure_panel(container, "Произвольное тело из STL (двоичный или ASCII)",
+                                       [("STL", "*.stl"), ("Все файлы", "*.*")], compute, with_paste=False)
+
+    def _batch_window(self, figure_name: str):
+        spec = FIGURES[figure_name]
         win = ctk.CTkToplevel(self.root)
-        win.title("Генератор примеров")
-        try:
-            rx = self.root.winfo_rootx(); ry = self.root.winfo_rooty()
-            rw = self.root.winfo_width(); rh = self.root.winfo_height()
-            x = rx + max(0, (rw - win_w) // 2); y = ry + max(0, (rh - win_h) // 2)
-            win.geometry(f"{win_w}x{win_h}+{x}+{y}")
-        except Exception:
-            sw = win.winfo_screenwidth(); sh = win.winfo_screenheight()
-            x = (sw - win_w) // 2; y = (sh - win_h) // 2
-            win.geometry(f"{win_w}x{win_h}+{x}+{y}")
-        win.resizable(False, False)
+        win.title(f"Пакетный расчёт — {figure_name}")
+        win.geometry("560x460")
         win.transient(self.root); win.grab_set()
-        try:
-            win.attributes("-alpha", 0.0)
-        except Exception:
-            pass
         try:
             self.anim.fade_in(win, target_alpha=1.0, duration=220, steps=12)
         except Exception:
             pass
+        frame = ctk.CTkFrame(win, corner_radius=8, fg_color=CFG.panel)
+        frame.pack(fill="both", expand=True, padx=10, pady=10)
 
+        cols_text = "; ".join(spec.labels)
+        ctk.CTkLabel(frame, text=f"Столбцы: {cols_text}\nВставьте строки или выберите CSV-файл.", justify="left",
+                     anchor="w", font=FONTS["ui"], text_color=CFG.text).pack(fill="x", padx=6, pady=(4, 4))
+        paste = ctk.CTkTextbox(frame, height=150, corner_radius=6, fg_color=CFG.surface, font=FONTS["ui"])
+        paste.pack(fill="both", expand=True, padx=6, pady=(0, 6))
+
+        paths = {"src": "", "out": ""}
+        files_lbl = ctk.CTkLabel(frame, text="Файл: —   Сохранить в: —", anchor="w", font=FONTS["ui"], text_color=CFG.muted)
+        files_lbl.pack(fill="x", padx=6)
+
+        summary_lbl = ctk.CTkLabel(frame, text="", anchor="w", justify="left", font=FONTS["ui"], text_color=CFG.text)
+        summary_lbl.pack(fill="x", padx=6, pady=(4, 4))
+        self._attach_copy_context(summary_lbl, lambda: summary_lbl.cget("text"))
+
+        actions = ctk.CTkFrame(frame, fg_color=frame.cget("fg_color"))
+        actions.pack(fill="x", padx=6, pady=(0, 4))
+        cancel_evt = threading.Event()
+
+        def refresh_files():
+            src = os.path.basename(paths["src"]) if paths["src"] else "—"
+            out = os.path.basename(paths["out"]) if paths["out"] else "—"
+            files_lbl.configure(text=f"Файл: {src}   Сохранить в: {out}")
+
+        def choose_src():
+            path = filedialog.askopenfilename(parent=win, filetypes=[("CSV / текст", "*.csv *.txt *.tsv"), ("Все файлы", "*.*")])
+            if path:
+                paths["src"] = path
+                refresh_files()
+
+        def choose_out():
+            path = filedialog.asksaveasfilename(parent=win, defaultextension=".csv", filetypes=[("CSV", "*.csv")])
+            if path:
+                paths["out"] = path
+                refresh_files()
+
+        def show_summary(res: BatchResult, elapsed: float):
+            lines = [f"Строк: {res.rows}  (пропущено: {res.skipped})  за {elapsed:.2f} с"]
+            for kind, label in FIGURE_QUANTITIES:
+                col = res.columns.get(kind)
+                if col is None or not col.count:
+                    continue
+                lines.append(f"{label}: Σ {col.total:.6g}   ср. {col.mean:.6g}   мин {col.minimum:.6g}   макс {col.maximum:.6g}")
+            summary_lbl.configure(text="\n".join(lines), text_color=CFG.text)
+
+        def run():
+            cancel_evt.clear()
+            text = paste.get("0.0", "end")
+            summary_lbl.configure(text="Расчёт…", text_color=CFG.muted)
+
+            def work():
+                t0 = time.perf_counter()
+                try:
+                    if paths["src"]:
+                        src_fh = open(paths["src"], "r", encoding="utf-8-sig", errors="replace")
+                    else:
+                        src_fh = io.StringIO(text)
+                    out_fh = open(paths["out"], "w", encoding="utf-8", newline="") if paths["out"] else None
+                    try:
+                        res = batch_figure_table(spec, src_fh, out_fh, cancel=cancel_evt,
+                                                 progress=lambda n: self.root.after(0, lambda: summary_lbl.configure(text=f"Обработано строк: {n}")))
+                    finally:
+                        src_fh.close()
+                        if out_fh is not None:
+                            out_fh.close()
+                    elapsed = time.perf_counter() - t0
+                    self.root.after(0, lambda: show_summary(res, elapsed))
+                except Exception as exc:
+                    msg = f"Ошибка: {exc}"
+                    self.root.after(0, lambda: summary_lbl.configure(text=msg, text_color="#ffb4b4"))
+
+            threading.Thread(target=work, daemon=True).start()
+
+        for txt, cmd, color in (("Рассчитать", run, CFG.accent), ("Сохранить в…", choose_out, CFG.accent_alt),
+                                ("Файл…", choose_src, CFG.accent_alt), ("Стоп", cancel_evt.set, CFG.card)):
+            ctk.CTkButton(actions, text=txt, fg_color=color, width=110, corner_radius=6, command=cmd,
+                          font=FONTS["ui"], text_color=CFG.text, hover_color=self._hover_cached(color)).pack(side="right", padx=(0, 6))
+        win.protocol("WM_DELETE_WINDOW", lambda: (cancel_evt.set(), win.destroy()))
+
+    def _build_plot_window(self, win: ctk.CTkToplevel):
+        main = ctk.CTkFrame(win, corner_radius=8, fg_color=CFG.panel)
+        main.pack(fill="both", expand=True, padx=10, pady=10)
+
+        top = ctk.CTkFrame(main, corner_radius=6, fg_color=CFG.panel)
+        top.pack(fill="x", padx=6, pady=(4, 6))
+        ctk.CTkLabel(top, text="f(x) =", font=FONTS["ui"], text_color=CFG.text).pack(side="left", padx=(0, 6))
+        expr_var = tk.StringVar(value="sin(x)")
+        expr_entry = ctk.CTkEntry(top, textvariable=expr_var, corner_radius=6, fg_color=CFG.surface,
+                                  text_color=CFG.text, font=FONTS["ui"], height=CFG.compact_entry_h)
+        expr_entry.pack(side="left", fill="x", expand=True)
+        self._attach_focus_highlight(expr_entry)
+
+        canvas = tk.Canvas(main, bg=CFG.surface, highlightthickness=0, cursor="fleur")
+        canvas.pack(fill="both", expand=True, padx=6)
+        status_var = tk.StringVar(value="Колесо — масштаб, перетаскивание — сдвиг")
+        ctk.CTkLabel(main, textvariable=status_var, anchor="w", font=FONTS["ui"], text_color=CFG.muted).pack(fill="x", padx=8)
+
+        view = {"x0": -10.0, "x1": 10.0, "y0": -6.0, "y1": 6.0, "sampler": None, "drag": None, "auto_y": True,
+                "remote": False, "busy": False, "again": False}
+
+        def size() -> Tuple[int, int]:
+            return max(50, canvas.winfo_width()), max(50, canvas.winfo_height())
+
+        def draw_axes(w: int, h: int):
+            x0, x1, y0, y1 = view["x0"], view["x1"], view["y0"], view["y1"]
+            grid_color = adjust_brightness(CFG.surface, 1.9)
+            for tx in nice_ticks(x0, x1):
+                px = (tx - x0) / (x1 - x0) * w
+                canvas.create_line(px, 0, px, h, fill=grid_color)
+                canvas.create_text(px + 3, h - 3, text=f"{tx:g}", anchor="sw", fill=CFG.muted, font=("Helvetica", 9))
+            for ty in nice_ticks(y0, y1):
+                py = (y1 - ty) / (y1 - y0) * h
+                canvas.create_line(0, py, w, py, fill=grid_color)
+                canvas.create_text(3, py - 2, text=f"{ty:g}", anchor="sw", fill=CFG.muted, font=("Helvetica", 9))
+            if x0 < 0 < x1:
+                px = -x0 / (x1 - x0) * w
+                canvas.create_line(px, 0, px, h, fill=CFG.muted)
+            if y0 < 0 < y1:
+                py = y1 / (y1 - y0) * h
+                canvas.create_line(0, py, w, py, fill=CFG.muted)
+
+        def sample(sampler: PlotSampler, x0: float, x1: float, y0: float, y1: float, w: int, h: int, auto_y: bool):
+            xs, ys = sampler.grid(x0, x1, w)
+            if auto_y:
+                finite = ys[_np.isfinite(ys)]
+                if finite.size:
+                    lo, hi = (float(v) for v in _np.percentile(finite, [2, 98]))
+                    if hi - lo < 1e-12:
+                        lo, hi = lo - 1.0, hi + 1.0
+                    pad_y = (hi - lo) * 0.1
+                    y0, y1 = lo - pad_y, hi + pad_y
+            xs, ys = sampler.refine(xs, ys, h / (y1 - y0), h)
+            return y0, y1, plot_polylines(xs, ys, x0, x1, y0, y1, w, h)
+
+        def paint(w: int, h: int, lines: Optional[List[List[float]]]):
+            canvas.delete("all")
+            draw_axes(w, h)
+            for coords in lines or ():
+                canvas.create_line(*coords, fill=CFG.accent, width=2)
+
+        def finish(w: int, h: int, auto_y: bool, result):
+            if not canvas.winfo_exists():
+                return
+            view["busy"] = False
+            if view["again"]:
+                view["again"] = False
+                schedule_redraw()
+                return
+            if isinstance(result, Exception):
+                paint(w, h, None)
+                status_var.set(str(result) if isinstance(result, ValueError) and str(result) else "Ошибка при вычислении")
+                return
+            y0, y1, lines = result
+            if auto_y:
+                view.update(y0=y0, y1=y1, auto_y=False)
+            paint(w, h, lines)
+
+        def redraw():
+            if view["busy"]:
+                view["again"] = True
+                return
+            w, h = size()
+            sampler = view["sampler"]
+            if sampler is None:
+                paint(w, h, None)
+                return
+            auto_y = view["auto_y"]
+            bounds = (view["x0"], view["x1"], view["y0"], view["y1"])
+            if not view["remote"]:
+                try:
+                    result = sample(sampler, *bounds, w, h, auto_y)
+                except Exception as exc:
+                    result = exc
+                finish(w, h, auto_y, result)
+                return
+            # heavy f(x): the worker pool samples under its timeout, this thread only waits
+            view["busy"] = True
+
+            def work():
+                try:
+                    result = sample(sampler, *bounds, w, h, auto_y)
+                except Exception as exc:
+                    result = exc
+                try:
+                    self.root.after(0, lambda: finish(w, h, auto_y, result))
+                except Exception:
+                    pass
+
+            threading.Thread(target=work, daemon=True).start()
+
+        def schedule_redraw():
+            self.anim.schedule("plot", 15, redraw)
+
+        def plot():
+            try:
+                src = self.session.normalize(expr_var.get())
+                pool = self.eval_pool
+                view["remote"] = pool is not None and self.session.cost(src) != COST_CHEAP
+                if view["remote"]:
+                    texts = self.session.texts()
+                    view["sampler"] = PlotSampler(None, evaluate=lambda xs: pool.submit("grid", (texts, src, xs)))
+                else:
+                    view["sampler"] = PlotSampler(self.session.compile(src, ("x",)))
+            except ValueError as exc:
+                status_var.set(str(exc) or "Некорректное выражение")
+                return
+            except Exception:
+                status_var.set("Некорректное выражение")
+                return
+            view["auto_y"] = True
+            status_var.set("Колесо — масштаб, перетаскивание — сдвиг")
+            schedule_redraw()
+
+        def reset_view():
+            view.update(x0=-10.0, x1=10.0, auto_y=True)
+            schedule_redraw()
+
+        def to_world(px: float, py: float) -> Tuple[float, float]:
+            w, h = size()
+            return (view["x0"] + px / w * (view["x1"] - view["x0"]),
+                    view["y1"] - py / h * (view["y1"] - view["y0"]))
+
+        def on_press(event):
+            view["drag"] = (event.x, event.y, view["x0"], view["x1"], view["y0"], view["y1"])
+
+        def on_drag(event):
+            if view["drag"] is None:
+                return
+            sx, sy, x0, x1, y0, y1 = view["drag"]
+            w, h = size()
+            dx = (event.x - sx) / w * (x1 - x0)
+            dy = (event.y - sy) / h * (y1 - y0)
+            view.update(x0=x0 - dx, x1=x1 - dx, y0=y0 + dy, y1=y1 + dy)
+            schedule_redraw()
+
+        def on_wheel(event):
+            up = getattr(event, "num", 0) == 4 or getattr(event, "delta", 0) > 0
+            factor = 0.8 if up else 1.25
+            cx, cy = to_world(event.x, event.y)
+            x0 = cx - (cx - view["x0"]) * factor
+            x1 = cx + (view["x1"] - cx) * factor
+            # keep x / step inside exact float integers and the view finite
+            scale = max(abs(x0), abs(x1), 1e-300)
+            if not (scale * 1e-12 < x1 - x0 < 1e12):
+                return
+            view.update(x0=x0, x1=x1, y0=cy - (cy - view["y0"]) * factor, y1=cy + (view["y1"] - cy) * factor)
+            schedule_redraw()
+
+        def on_motion(event):
+            x, y = to_world(event.x, event.y)
+            status_var.set(f"x = {x:.6g}   y = {y:.6g}")
+
+        canvas.bind("<ButtonPress-1>", on_press)
+        canvas.bind("<B1-Motion>", on_drag)
+        canvas.bind("<ButtonRelease-1>", lambda _e: view.update(drag=None))
+        canvas.bind("<MouseWheel>", on_wheel)
+        canvas.bind("<Button-4>", on_wheel)
+        canvas.bind("<Button-5>", on_wheel)
+        canvas.bind("<Motion>", on_motion)
+        canvas.bind("<Configure>", lambda _e: schedule_redraw())
+        expr_entry.bind("<Return>", lambda _e: plot())
+
+        reset_btn = ctk.CTkButton(top, text="⌂", fg_color=CFG.accent_alt, width=36, corner_radius=6, command=reset_view,
+                                  font=FONTS["ui"], text_color=CFG.text, hover_color=self._hover_cached(CFG.accent_alt))
+        reset_btn.pack(side="right", padx=(6, 0))
+        plot_btn = ctk.CTkButton(top, text="Построить", fg_color=CFG.accent, width=100, corner_radius=6,
+                                 command=lambda: (self.anim.press_animation(plot_btn), plot()),
+                                 font=FONTS["ui"], text_color=CFG.text, hover_color=self._hover_cached(CFG.accent))
+        plot_btn.pack(side="right", padx=(6, 0))
+        plot()
+
+    def _build_table_window(self, win: ctk.CTkToplevel):
+        main = ctk.CTkFrame(win, corner_radius=8, fg_color=CFG.panel)
+        main.pack(fill="both", expand=True, padx=10, pady=10)
+
+        expr_row = ctk.CTkFrame(main, fg_color=main.cget("fg_color"))
+        expr_row.pack(fill="x", padx=6, pady=(4, 4))
+        ctk.CTkLabel(expr_row, text="f(x) =", font=FONTS["ui"], text_color=CFG.text).pack(side="left", padx=(0, 6))
+        expr_var = tk.StringVar(value="x^2")
+        expr_entry = ctk.CTkEntry(expr_row, textvariable=expr_var, corner_radius=6, fg_color=CFG.surface,
+                                  text_color=CFG.text, font=FONTS["ui"], height=CFG.compact_entry_h)
+        expr_entry.pack(side="left", fill="x", expand=True)
+        self._attach_focus_highlight(expr_entry)
+
+        range_row = ctk.CTkFrame(main, fg_color=main.cget("fg_color"))
+        range_row.pack(fill="x", padx=6, pady=(0, 6))
+        range_vars: List[tk.StringVar] = []
+        for label, default in (("от", "0"), ("до", "10"), ("шаг", "0,5")):
+            ctk.CTkLabel(range_row, text=label, font=FONTS["ui"], text_color=CFG.text).pack(side="left", padx=(0, 4))
+            var = tk.StringVar(value=default)
+            e = ctk.CTkEntry(range_row, textvariable=var, width=80, corner_radius=6, fg_color=CFG.surface,
+                             text_color=CFG.text, font=FONTS["ui"], height=CFG.compact_entry_h)
+            e.pack(side="left", padx=(0, 10))
+            self._attach_focus_highlight(e)
+            e.bind("<Return>", lambda _e: build())
+            range_vars.append(var)
+
+        body = ctk.CTkFrame(main, corner_radius=6, fg_color=CFG.surface)
+        body.pack(fill="both", expand=True, padx=6)
+        canvas = tk.Canvas(body, bg=CFG.surface, highlightthickness=0)
+        canvas.pack(side="left", fill="both", expand=True)
+        status_lbl = ctk.CTkLabel(main, text="", anchor="w", font=FONTS["ui"], text_color=CFG.muted)
+        status_lbl.pack(fill="x", padx=8)
+
+        row_h = 22
+        table = {"fn": None, "evaluate": None, "start": 0.0, "step": 1.0, "rows": 0, "top": 0,
+                 "chunks": OrderedDict(), "pending": set(), "gen": 0}
+        cancel_evt = threading.Event()
+
+        def visible_rows() -> int:
+            return max(1, canvas.winfo_height() // row_h)
+
+        def store_chunk(ci: int, values):
+            cache: OrderedDict = table["chunks"]
+            cache[ci] = values
+            while len(cache) > 32:
+                cache.popitem(last=False)
+
+        def request_chunk(ci: int, i0: int, i1: int):
+            """
+            Heavy f(x): the worker pool computes the chunk under its timeout;
+            the rows show "…" until it arrives.
+            """
+            if ci in table["pending"]:
+                return
+            table["pending"].add(ci)
+            gen, fn, evaluate = table["gen"], table["fn"], table["evaluate"]
+            start, step = table["start"], table["step"]
+
+            def work():
+                try:
+                    result = value_table_chunk(fn, start, step, i0, i1, evaluate)
+                except Exception as exc:
+                    result = exc
+                try:
+                    self.root.after(0, lambda: deliver(gen, ci, i0, i1, result))
+                except Exception:
+                    pass
+
+            threading.Thread(target=work, daemon=True).start()
+
+        def deliver(gen: int, ci: int, i0: int, i1: int, result):
+            if gen != table["gen"] or not canvas.winfo_exists():
+                return
+            table["pending"].discard(ci)
+            if isinstance(result, Exception):
+                # keep the rows empty instead of asking again on every redraw
+                xs = table["start"] + _np.arange(i0, i1, dtype=_np.float64) * table["step"]
+                result = (xs, _np.full(xs.shape, _np.nan))
+                status_lbl.configure(text="Вычисление прервано", text_color="#ffb4b4")
+            store_chunk(ci, result)
+            redraw()
+
+        def row_values(i: int) -> Tuple[float, Optional[float]]:
+            chunk = CFG.table_chunk_rows
+            ci = i // chunk
+            cache: OrderedDict = table["chunks"]
+            if ci in cache:
+                cache.move_to_end(ci)
+            else:
+                i0 = ci * chunk
+                i1 = min(table["rows"], i0 + chunk)
+                if table["evaluate"] is not None:
+                    request_chunk(ci, i0, i1)
+                    return table["start"] + i * table["step"], None
+                store_chunk(ci, value_table_chunk(table["fn"], table["start"], table["step"], i0, i1))
+            xs, ys = cache[ci]
+            return float(xs[i % chunk]), float(ys[i % chunk])
+
+        def redraw():
+            canvas.delete("all")
+            w = max(100, canvas.winfo_width())
+            rows = table["rows"]
+            if not rows:
+                scrollbar.set(0.0, 1.0)
+                return
+            n = visible_rows()
+            top = table["top"] = max(0, min(table["top"], rows - n))
+            canvas.create_text(8, row_h // 2, text="x", anchor="w", fill=CFG.muted, font=FONTS["small"])
+            canvas.create_text(w // 2, row_h // 2, text=f"f(x) = {table['fn'].source}", anchor="w", fill=CFG.muted, font=FONTS["small"])
+            stripe = adjust_brightness(CFG.surface, 1.5)
+            for k, i in enumerate(range(top, min(rows, top + n - 1)), start=1):
+                x, y = row_values(i)
+                y0 = k * row_h
+                if i % 2:
+                    canvas.create_rectangle(0, y0, w, y0 + row_h, fill=stripe, width=0)
+                canvas.create_text(8, y0 + row_h // 2, text=format_table_value(x), anchor="w", fill=CFG.text, font=FONTS["ui"])
+                canvas.create_text(w // 2, y0 + row_h // 2, text="…" if y is None else format_table_value(y) or "—",
+                                   anchor="w", fill=CFG.text, font=FONTS["ui"])
+            scrollbar.set(top / rows, min(1.0, (top + n - 1) / rows))
+
+        def on_scroll(*args):
+            if not table["rows"]:
+                return
+            n = visible_rows() - 1
+            if args[0] == "moveto":
+                table["top"] = int(float(args[1]) * table["rows"])
+            elif args[0] == "scroll":
+                table["top"] += int(args[1]) * (n if args[2] == "pages" else 1)
+            redraw()
+
+        def on_wheel(event):
+            up = getattr(event, "num", 0) == 4 or getattr(event, "delta", 0) > 0
+            on_scroll("scroll", -3 if up else 3, "units")
+
+        scrollbar = ctk.CTkScrollbar(body, command=on_scroll)
+        scrollbar.pack(side="right", fill="y")
+
+        def build():
+            try:
+                src = self.session.normalize(expr_var.get())
+                pool = self.eval_pool
+                evaluate = None
+                if HAVE_NUMPY and pool is not None and self.session.cost(src) != COST_CHEAP:
+                    # validated here, evaluated by the worker's mirror session
+                    fn = self.session.compile(src, ("x",), bind=False)
+                    texts = self.session.texts()
+                    evaluate = lambda xs: pool.submit("grid", (texts, src, xs))
+                else:
+                    fn = self.session.compile(src, ("x",))
+            except ValueError as exc:
+                status_lbl.configure(text=str(exc) or "Некорректный ввод", text_color="#ffb4b4")
+                return
+            except Exception:
+                status_lbl.configure(text="Некорректное выражение", text_color="#ffb4b4")
+                return
+            self._input_numbers([v.get() for v in range_vars], lambda ok, numbers: show_table(fn, evaluate, ok, numbers))
+
+        def show_table(fn: SafeExpression, evaluate: Optional[Callable], ok: bool, numbers):
+            if not status_lbl.winfo_exists():
+                return
+            try:
+                if not ok:
+                    raise numbers
+                start, stop, step = (float(v) for v in numbers)
+                rows = value_table_rows(start, stop, step)
+            except (ValueError, TypeError) as exc:
+                status_lbl.configure(text=str(exc) or "Некорректный ввод", text_color="#ffb4b4")
+                return
+            except Exception:
+                status_lbl.configure(text="Некорректный ввод", text_color="#ffb4b4")
+                return
+            table.update(fn=fn, evaluate=evaluate, start=start, step=step, rows=rows, top=0, chunks=OrderedDict(),
+                         pending=set(), gen=table["gen"] + 1)
+            status_lbl.configure(text=f"Строк: {rows}", text_color=CFG.muted)
+            redraw()
+
+        def export():
+            if table["fn"] is None:
+                return
+            path = filedialog.asksaveasfilename(parent=win, defaultextension=".csv", filetypes=[("CSV", "*.csv")])
+            if not path:
+                return
+            cancel_evt.clear()
+            fn, evaluate, start, step, rows = table["fn"], table["evaluate"], table["start"], table["step"], table["rows"]
+            status_lbl.configure(text="Экспорт…", text_color=CFG.muted)
+
+            def work():
+                t0 = time.perf_counter()
+                try:
+                    with open(path, "w", encoding="utf-8", newline="") as fh:
+                        written = export_value_table(fn, start, step, rows, fh, cancel=cancel_evt, evaluate=evaluate,
+                                                     progress=lambda n: self.root.after(0, lambda: status_lbl.configure(text=f"Экспорт: {n} / {rows}")))
+                    msg, color = f"Сохранено строк: {written} за {time.perf_counter() - t0:.2f} с", CFG.muted
+                except Exception as exc:
+                    msg, color = f"Ошибка: {exc}", "#ffb4b4"
+                self.root.after(0, lambda: status_lbl.configure(text=msg, text_color=color))
+
+            threading.Thread(target=work, daemon=True).start()
+
+        canvas.bind("<Configure>", lambda _e: self.anim.schedule("table", 15, redraw))
+        canvas.bind("<MouseWheel>", on_wheel)
+        canvas.bind("<Button-4>", on_wheel)
+        canvas.bind("<Button-5>", on_wheel)
+        expr_entry.bind("<Return>", lambda _e: build())
+
+        actions = ctk.CTkFrame(main, fg_color=main.cget("fg_color"))
+        actions.pack(fill="x", padx=6, pady=(4, 2))
+        for txt, cmd, color in (("Построить", build, CFG.accent), ("CSV…", export, CFG.accent_alt), ("Стоп", cancel_evt.set, CFG.card)):
+            ctk.CTkButton(actions, text=txt, fg_color=color, width=100, corner_radius=6, command=cmd,
+                          font=FONTS["ui"], text_color=CFG.text, hover_color=self._hover_cached(color)).pack(side="right", padx=(0, 6))
+        build()
+
+    def _build_roots_window(self, win: ctk.CTkToplevel):
+        main = ctk.CTkFrame(win, corner_radius=8, fg_color=CFG.panel)
+        main.pack(fill="both", expand=True, padx=10, pady=10)
+
+        eq_var = tk.StringVar(value="cos(x) = x")
+        eq_entry = ctk.CTkEntry(main, textvariable=eq_var, corner_radius=6, fg_color=CFG.surface, text_color=CFG.text,
+                                font=FONTS["ui"], height=CFG.compact_entry_h, placeholder_text="f(x) = g(x)")
+        eq_entry.pack(fill="x", padx=6, pady=(4, 6))
+        self._attach_focus_highlight(eq_entry)
+
+        range_row = ctk.CTkFrame(main, fg_color=main.cget("fg_color"))
+        range_row.pack(fill="x", padx=6, pady=(0, 6))
+        range_vars: List[tk.StringVar] = []
+        for label, default in (("x от", "-10"), ("до", "10")):
+            ctk.CTkLabel(range_row, text=label, font=FONTS["ui"], text_color=CFG.text).pack(side="left", padx=(0, 4))
+            var = tk.StringVar(value=default)
+            e = ctk.CTkEntry(range_row, textvariable=var, width=90, corner_radius=6, fg_color=CFG.surface,
+                             text_color=CFG.text, font=FONTS["ui"], height=CFG.compact_entry_h)
+            e.pack(side="left", padx=(0, 10))
+            self._attach_focus_highlight(e)
+            range_vars.append(var)
+
+        out_box = ctk.CTkTextbox(main, corner_radius=6, fg_color=CFG.surface, font=FONTS["ui"])
+        out_box.pack(fill="both", expand=True, padx=6, pady=(0, 6))
+        self._attach_copy_context(out_box, lambda: out_box.get("0.0", "end").strip())
+
+        def show(text: str):
+            out_box.configure(state="normal")
+            out_box.delete("0.0", "end")
+            out_box.insert("0.0", text)
+            out_box.configure(state="disabled")
+
+        def solve():
+            equation = eq_var.get()
+            try:
+                # with a pool the search runs in a worker: only validate here
+                fn = compile_equation(equation, self.session, bind=self.eval_pool is None)
+            except ValueError as exc:
+                show(str(exc) or "Некорректный ввод")
+                return
+            except Exception:
+                show("Некорректное уравнение")
+                return
+            self._input_numbers([v.get() for v in range_vars], lambda ok, numbers: search(fn, equation, ok, numbers))
+
+        def report(roots: List[float], elapsed: float) -> str:
+            if not roots:
+                return "Корней на отрезке не найдено"
+            lines = [f"x{i} = {format_table_value(r)}" for i, r in enumerate(roots, start=1)]
+            return f"Корней: {len(roots)}  ({elapsed * 1000:.0f} мс)\n" + "\n".join(lines)
+
+        def search(fn: SafeExpression, equation: str, ok: bool, numbers):
+            if not out_box.winfo_exists():
+                return
+            try:
+                if not ok:
+                    raise numbers
+                a, b = (float(v) for v in numbers)
+            except (ValueError, TypeError) as exc:
+                show(str(exc) or "Некорректный ввод")
+                return
+            except Exception:
+                show("Некорректный ввод")
+                return
+            show("Поиск корней…")
+            t0 = time.perf_counter()
+            if self.eval_pool is not None:
+                # the worker's time limit bounds a search that would never finish
+                def done(ok: bool, value):
+                    if not out_box.winfo_exists():
+                        return
+                    if ok:
+                        show(report(value, time.perf_counter() - t0))
+                    elif isinstance(value, ValueError):
+                        show(str(value) or "Ошибка ввода")
+                    else:
+                        show("Ошибка при вычислении")
+
+                self._run_evaluation("roots", (self.session.texts(), equation, a, b), done)
+                return
+
+            def work():
+                try:
+                    text = report(find_roots(fn, a, b), time.perf_counter() - t0)
+                except ValueError as exc:
+                    text = str(exc) or "Ошибка ввода"
+                except Exception:
+                    text = "Ошибка при вычислении"
+                self.root.after(0, lambda: show(text))
+
+            threading.Thread(target=work, daemon=True).start()
+
+        eq_entry.bind("<Return>", lambda _e: solve())
+        solve_btn = ctk.CTkButton(range_row, text="Найти корни", fg_color=CFG.accent, width=110, corner_radius=6,
+                                  command=lambda: (self.anim.press_animation(solve_btn), solve()),
+                                  font=FONTS["ui"], text_color=CFG.text, hover_color=self._hover_cached(CFG.accent))
+        solve_btn.pack(side="right")
+
+    def _build_stats_window(self, win: ctk.CTkToplevel):
+        main = ctk.CTkFrame(win, corner_radius=8, fg_color=CFG.panel)
+        main.pack(fill="both", expand=True, padx=10, pady=10)
+        ctk.CTkLabel(main, text="Числа по строкам (или файл .csv / .txt / .npy / .f64)", anchor="w",
+                     font=FONTS["ui"], text_color=CFG.muted).pack(fill="x", padx=6)
+        paste = ctk.CTkTextbox(main, height=110, corner_radius=6, fg_color=CFG.surface, font=FONTS["ui"])
+        paste.pack(fill="x", padx=6, pady=(2, 6))
+
+        opts = ctk.CTkFrame(main, fg_color=main.cget("fg_color"))
+        opts.pack(fill="x", padx=6)
+        ctk.CTkLabel(opts, text="Столбец", font=FONTS["ui"], text_color=CFG.text).pack(side="left", padx=(0, 6))
+        column_var = tk.StringVar(value="1")
+        col_entry = ctk.CTkEntry(opts, textvariable=column_var, width=50, corner_radius=6, fg_color=CFG.surface,
+                                 text_color=CFG.text, font=FONTS["ui"], height=CFG.compact_entry_h)
+        col_entry.pack(side="left")
+        self._attach_focus_highlight(col_entry)
+        file_lbl = ctk.CTkLabel(opts, text="Файл: —", anchor="w", font=FONTS["ui"], text_color=CFG.muted)
+        file_lbl.pack(side="left", padx=(12, 0))
+
+        result_lbl = ctk.CTkLabel(main, text="", anchor="nw", justify="left", font=FONTS["ui"], text_color=CFG.text)
+        result_lbl.pack(fill="both", expand=True, padx=6, pady=(6, 4))
+        self._attach_copy_context(result_lbl, lambda: result_lbl.cget("text"))
+
+        state = {"path": ""}
+        cancel_evt = threading.Event()
+
+        def choose_file():
+            path = filedialog.askopenfilename(parent=win, filetypes=[("Данные", "*.csv *.txt *.tsv *.npy *.f64 *.bin"),
+                                                                     ("Все файлы", "*.*")])
+            if path:
+                state["path"] = path
+                file_lbl.configure(text=f"Файл: {os.path.basename(path)}")
+
+        def show_stats(st: StreamStats, elapsed: float):
+            if not st.count:
+                result_lbl.configure(text="Нет чисел для обработки", text_color="#ffb4b4")
+                return
+            approx = "" if st.exact_quantiles else "≈ "
+            q = st.quantiles([0.05, 0.25, 0.5, 0.75, 0.95])
+            f = format_table_value
+            lines = [
+                f"Количество: {st.count}   (пропущено: {st.skipped})   за {elapsed:.2f} с",
+                f"Среднее: {f(st.mean)}",
+                f"Ст. отклонение: {f(st.stddev)}   дисперсия: {f(st.variance)}",
+                f"Мин: {f(st.minimum)}   макс: {f(st.maximum)}",
+                f"Медиана: {approx}{f(q[2])}",
+                f"Квартили: {approx}{f(q[1])} … {f(q[3])}",
+                f"5% … 95%: {approx}{f(q[0])} … {f(q[4])}",
+            ]
+            result_lbl.configure(text="\n".join(lines), text_color=CFG.text)
+
+        def run():
+            try:
+                column = int(column_var.get().strip()) - 1
+                if column < 0:
+                    raise ValueError
+            except ValueError:
+                result_lbl.configure(text="Номер столбца — целое число от 1", text_color="#ffb4b4")
+                return
+            cancel_evt.clear()
+            text = paste.get("0.0", "end")
+            path = state["path"]
+            result_lbl.configure(text="Расчёт…", text_color=CFG.muted)
+            report = lambda n: self.root.after(0, lambda: result_lbl.configure(text=f"Обработано чисел: {n}"))
+
+            def work():
+                t0 = time.perf_counter()
+                try:
+                    if path:
+                        st = stream_file_stats(path, column, progress=report, cancel=cancel_evt)
+                    else:
+                        st = stream_stats(io.StringIO(text), column, progress=report, cancel=cancel_evt)
+                    elapsed = time.perf_counter() - t0
+                    self.root.after(0, lambda: show_stats(st, elapsed))
+                except Exception as exc:
+                    msg = str(exc) if isinstance(exc, ValueError) and str(exc) else "Не удалось прочитать данные"
+                    self.root.after(0, lambda: result_lbl.configure(text=msg, text_color="#ffb4b4"))
+
+            threading.Thread(target=work, daemon=True).start()
+
+        def clear_file():
+            state["path"] = ""
+            file_lbl.configure(text="Файл: —")
+
+        actions = ctk.CTkFrame(main, fg_color=main.cget("fg_color"))
+        actions.pack(fill="x", padx=6, pady=(0, 2))
+        for txt, cmd, color in (("Рассчитать", run, CFG.accent), ("Файл…", choose_file, CFG.accent_alt),
+                                ("Без файла", clear_file, CFG.card), ("Стоп", cancel_evt.set, CFG.card)):
+            ctk.CTkButton(actions, text=txt, fg_color=color, width=96, corner_radius=6, command=cmd,
+                          font=FONTS["ui"], text_color=CFG.text, hover_color=self._hover_cached(color)).pack(side="right", padx=(0, 6))
+
+    def _build_session_window(self, win: ctk.CTkToplevel):
+        main = ctk.CTkFrame(win, corner_radius=8, fg_color=CFG.panel)
+        main.pack(fill="both", expand=True, padx=10, pady=10)
+        ctk.CTkLabel(main, text="Определения: «r = 3,5», «f(x) = x^2+1»", anchor="w",
+                     font=FONTS["ui"], text_color=CFG.muted).pack(fill="x", padx=6)
+        listing = ctk.CTkTextbox(main, corner_radius=6, fg_color=CFG.surface, font=FONTS["ui"])
+        listing.pack(fill="both", expand=True, padx=6, pady=(2, 6))
+
+        row = ctk.CTkFrame(main, fg_color=main.cget("fg_color"))
+        row.pack(fill="x", padx=6)
+        name_var = tk.StringVar()
+        name_entry = ctk.CTkEntry(row, textvariable=name_var, width=120, corner_radius=6, fg_color=CFG.surface,
+                                  text_color=CFG.text, font=FONTS["ui"], height=CFG.compact_entry_h, placeholder_text="имя")
+        name_entry.pack(side="left")
+        self._attach_focus_highlight(name_entry)
+        status = ctk.CTkLabel(main, text="", anchor="w", font=FONTS["ui"], text_color=CFG.muted)
+        status.pack(fill="x", padx=6, pady=(4, 0))
+
+        def refresh():
+            listing.configure(state="normal")
+            listing.delete("0.0", "end")
+            listing.insert("0.0", "\n".join(self.session.texts()) or "Нет определений")
+            listing.configure(state="disabled")
+            status.configure(text="")
+
+        def remove():
+            try:
+                self.session.remove(name_var.get().strip())
+                name_var.set("")
+                refresh()
+            except ValueError as exc:
+                status.configure(text=str(exc), text_color="#ffb4b4")
+
+        def clear():
+            self.session.clear()
+            refresh()
+
+        for txt, cmd, color in (("Очистить всё", clear, CFG.card), ("Удалить", remove, CFG.accent_alt),
+                                ("Обновить", refresh, CFG.accent)):
+            ctk.CTkButton(row, text=txt, fg_color=color, width=96, corner_radius=6, command=cmd,
+                          font=FONTS["ui"], text_color=CFG.text, hover_color=self._hover_cached(color)).pack(side="right", padx=(6, 0))
+        win.bind("<FocusIn>", lambda _e: refresh() if _e.widget is win else None, add="+")
+        refresh()
+
+    def _build_history_window(self, win: ctk.CTkToplevel):
+        main = ctk.CTkFrame(win, corner_radius=8, fg_color=CFG.panel)
+        main.pack(fill="both", expand=True, padx=10, pady=10)
+        query_var = tk.StringVar()
+        query_entry = ctk.CTkEntry(main, textvariable=query_var, corner_radius=6, fg_color=CFG.surface, text_color=CFG.text,
+                                   font=FONTS["ui"], height=CFG.compact_entry_h, placeholder_text="Поиск по выражениям")
+        query_entry.pack(fill="x", padx=6, pady=(0, 6))
+        self._attach_focus_highlight(query_entry)
+        listing = ctk.CTkTextbox(main, corner_radius=6, fg_color=CFG.surface, font=FONTS["ui"], wrap="none")
+        listing.pack(fill="both", expand=True, padx=6)
+        ctk.CTkLabel(main, text="Двойной щелчок — вставить выражение", anchor="w",
+                     font=FONTS["ui"], text_color=CFG.muted).pack(fill="x", padx=6, pady=(4, 0))
+        shown: List[str] = []
+
+        def refresh():
+            try:
+                rows = self.history.matches(query_var.get().strip(), CFG.history_window_rows)
+            except Exception:
+                rows = []
+            shown[:] = [expr for _i, expr, _result in rows]
+            lines = [f"{expr}  =  {result}" if result else expr for _i, expr, result in rows]
+            listing.configure(state="normal")
+            listing.delete("0.0", "end")
+            listing.insert("0.0", "\n".join(line.replace("\n", " ") for line in lines) or "История пуста")
+            listing.configure(state="disabled")
+
+        def pick(event):
+            try:
+                row = int(listing.index(f"@{event.x},{event.y}").split(".")[0]) - 1
+            except Exception:
+                return
+            if 0 <= row < len(shown):
+                self.entry_var.set(shown[row])
+                try:
+                    self.display.icursor("end")
+                except Exception:
+                    pass
+
+        query_var.trace_add("write", lambda *_: self.anim.schedule("history_search", 120, refresh))
+        listing.bind("<Double-Button-1>", pick)
+        win.bind("<FocusIn>", lambda _e: refresh() if _e.widget is win else None, add="+")
+        refresh()
+
+    def _build_examples_window(self, win: ctk.CTkToplevel):
         frame = ctk.CTkFrame(win, corner_radius=8, fg_color=CFG.panel)
         frame.pack(fill="both", expand=True, padx=10, pady=10)
 
@@ -1615,29 +6440,69 @@ class CalculatorApp:
                      period_ms: int = 1200, steps: int = 20):
         half = steps // 2
         step_ms = max(10, period_ms // steps)
+        factors = [min_factor + (max_factor - min_factor) * i / max(1, half - 1) for i in range(half)]
+        factors += [max_factor - (max_factor - min_factor) * i / max(1, steps - half - 1) for i in range(steps - half)]
+        # the whole period as ready-made colors: frames only index into it
+        ramp = PALETTE.ramp(base_color)
+        shades = [ramp[PALETTE.index(f)] for f in factors]
+        shown = [None]
 
         def frame(i: int = 0):
-            if i < half:
-                t = i / max(1, half - 1)
-                factor = min_factor + (max_factor - min_factor) * t
-            else:
-                t = (i - half) / max(1, steps - half - 1)
-                factor = max_factor - (max_factor - min_factor) * t
-            try:
-                widget.configure(fg_color=adjust_brightness(base_color, factor))
-            except Exception:
-                pass
+            if not self.anim.ambient_allowed:
+                # paused while animation is degraded or reduced motion is on
+                if shown[0] != base_color:
+                    shown[0] = base_color
+                    try:
+                        widget.configure(fg_color=base_color)
+                    except Exception:
+                        pass
+                self.root.after(1000, frame)
+                return
+            if shades[i] != shown[0]:
+                shown[0] = shades[i]
+                try:
+                    widget.configure(fg_color=shades[i])
+                except Exception:
+                    pass
             self.root.after(step_ms, lambda: frame((i + 1) % steps))
 
         frame(0)
 
     def run(self):
-        self.root.mainloop()
+        try:
+            self.root.mainloop()
+        finally:
+            if self.eval_pool is not None:
+                self.eval_pool.shutdown()
+
+def _benchmark_fast_path(rounds: int = 20000):
+    exprs = ["7+8*9", "12,5/4-3", "(1+2)*(3+4)/5", "100-99*2+0,5", "-3+4*-2", "64/8/2+1"]
+    srcs = [_normalize_expr(x) for x in exprs]
+    compile_uncached = compile_safe.__wrapped__
+
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for src in srcs:
+            compile_uncached(src)()
+    t_ast = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for src in srcs:
+            _fast_arith_eval(src)
+    t_fast = time.perf_counter() - t0
+
+    n = rounds * len(srcs)
+    print(f"AST path:  {t_ast / n * 1e6:.2f} us/expr")
+    print(f"Fast path: {t_fast / n * 1e6:.2f} us/expr  (x{t_ast / max(t_fast, 1e-12):.1f})")
 
 # ---------------------------
 # Run
 # ---------------------------
 if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        _benchmark_fast_path()
+        sys.exit(0)
     try:
         print("Optional libs: numpy={}, pytweening={}, easing-functions={}".format(HAVE_NUMPY, HAVE_PYTWEEN, HAVE_EASING_LIB))
     except Exception: